@@ -10,7 +10,17 @@ from flask_login import LoginManager
 from flask_migrate import Migrate
 from werkzeug.middleware.proxy_fix import ProxyFix
 from database import db, User
+from db_engine import apply_engine_options, register_sqlite_pragmas, register_pool_metrics
 import auth
+from bot.llm_dispatch import llm_dispatcher
+from bot.rate_limit import rate_limiter
+from bot.model_registry import model_registry
+from bot.render_cache import render_cache
+from dice_rng import dice_rng
+from bot.unit_of_work import group_committer
+from bot.jobs import job_worker
+from bot.reference_data import reference_data
+from bot.message_queue import socketio_options
 from cli import register_cli_commands
 from routes.main_routes import main_bp
 from routes.admin_routes import admin_bp
@@ -53,11 +63,38 @@ elif db_type in ["mysql", "postgresql"]:
     else: # postgresql
         app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
+apply_engine_options(app)
 db.init_app(app)
+register_sqlite_pragmas(app)
+register_pool_metrics(app)
 migrate = Migrate(app, db)
 
-# SocketIO
-socketio = SocketIO(app, async_mode='gevent')
+# LLM dispatch pool
+llm_dispatcher.init_app(app)
+
+# Gemini rate limits
+rate_limiter.init_app(app)
+
+# Shared Gemini clients
+model_registry.init_app(app)
+
+# Rendered message cache
+render_cache.init_app(app)
+
+# Dice RNG backend
+dice_rng.init_app(app)
+
+# Group commit of chat turn writes
+group_committer.init_app(app)
+
+# Background job queue
+job_worker.init_app(app)
+
+# TTRPG types and prep messages
+reference_data.init_app(app)
+
+# SocketIO, optionally sharing a message queue with the other workers
+socketio = SocketIO(app, async_mode='gevent', **socketio_options(app))
 
 # Login Manager
 login_manager = LoginManager(app)
@@ -1,82 +1,87 @@
 import logging
-import json
-import datetime
-from database import db, Character, Message, CharacterSheetHistory
-import google.generativeai as genai
-from flask import current_app
+from sqlalchemy import func
+from database import db, Character, Message
+from dice_rng import dice_rng, new_seed, BACKENDS
+from bot.unit_of_work import current_turn
+from bot.sheet_history import record_sheet_update
+from bot.recap import schedule_recap
 
 logger = logging.getLogger(__name__)
 
 def update_character_sheet(character_id, sheet_data):
+    turn = current_turn()
+    if turn is not None:
+        # Written together with the turn's messages when the turn commits.
+        turn.update_sheet(character_id, sheet_data)
+        logger.info(f"Character sheet update for character {character_id} added to the current turn")
+        return
+
     character = Character.query.get(character_id)
     if character:
-        character.charactersheet = json.dumps(sheet_data)
-        history_record = CharacterSheetHistory(
-            character_id=character_id,
-            sheet_data=json.dumps(sheet_data)
-        )
-        db.session.add(history_record)
-        db.session.commit()
-        logger.info(f"Character sheet updated for character {character_id}")
+        if record_sheet_update(character, sheet_data):
+            db.session.commit()
+            logger.info(f"Character sheet updated for character {character_id}")
     else:
         logger.error(f"Character not found when trying to update sheet: {character_id}")
 
-def get_recap(character_id):
-    character = Character.query.get(character_id)
-    if not character:
-        return {'error': 'Character not found'}, 404
-
-    messages = Message.query.filter_by(character_id=character.id).order_by(Message.timestamp.asc()).all()
-    if not messages:
-        return {'recap': ''}
-
-    last_message_id = messages[-1].id
-    if character.recap and character.last_recap_message_id == last_message_id:
-        return {'recap': character.recap}
-
-    history_for_prompt = []
-    for msg in messages:
-        if msg.role == 'user' and "You are the DM" in msg.content:
-            continue
-        history_for_prompt.append(f"{msg.role.capitalize()}: {msg.content}")
+def reserve_dice_roll(character_id):
+    """
+    Claims the next roll number of a character's dice stream.
 
-    history_str = "\n".join(history_for_prompt)
+    The counter is incremented in the database and read back inside the same
+    transaction, so two workers never hand out the same roll number. A
+    character gets its seed and backend on its first roll; the seed is only
+    written while none is stored, so concurrent first rolls share one stream.
 
-    sessions = []
-    if messages:
-        current_session = [messages[0]]
-        for i in range(1, len(messages)):
-            time_diff = messages[i].timestamp - messages[i-1].timestamp
-            if time_diff > datetime.timedelta(hours=1):
-                sessions.append(current_session)
-                current_session = [messages[i]]
-            else:
-                current_session.append(messages[i])
-        sessions.append(current_session)
+    Returns:
+        A tuple of (backend, seed, counter) identifying the roll.
 
-    prompt = f"""
-Please provide a recap of the following adventure based on the message history. The user wants a two-part summary:
-1. A general overview of the entire adventure so far (one paragraph).
-2. A more detailed summary of the last two sessions. A 'session' is a period of continuous play.
+    Raises:
+        ValueError: If the character does not exist or its stored backend is
+            not available, since reseeding would break replaying its rolls.
+    """
+    character = Character.query.get(character_id)
+    if character is None:
+        raise ValueError(f"Character not found: {character_id}")
+    if character.dice_seed is None:
+        Character.query.filter(
+            Character.id == character.id,
+            Character.dice_seed.is_(None)
+        ).update({
+            Character.dice_seed: new_seed(),
+            Character.dice_rng_backend: dice_rng.backend,
+            Character.dice_roll_counter: 0
+        }, synchronize_session=False)
+        db.session.refresh(character, ['dice_seed', 'dice_rng_backend', 'dice_roll_counter'])
+    if character.dice_rng_backend not in BACKENDS:
+        logger.error(f"Dice backend {character.dice_rng_backend!r} of character {character.id} is not available")
+        db.session.rollback()
+        raise ValueError(f"Dice backend not available: {character.dice_rng_backend}")
 
-Here is the full message history:
----
-{history_str}
----
+    character.dice_roll_counter = Character.dice_roll_counter + 1
+    db.session.flush()
+    db.session.refresh(character, ['dice_roll_counter'])
+    roll = (character.dice_rng_backend, character.dice_seed, character.dice_roll_counter - 1)
+    db.session.commit()
+    return roll
 
-Based on this, please generate the recap.
-"""
+def get_recap(character_id):
+    """
+    Returns the character's last generated recap straight away.
 
-    model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-    try:
-        response = model.generate_content(prompt)
-        recap_text = response.text.replace('\\n', '<br>')
-    except Exception as e:
-        logger.error(f"Error generating recap for character {character_id}: {e}")
-        return {'error': 'Failed to generate recap'}, 500
+    If messages were written since it was generated, a refresh is scheduled
+    in the background (see bot.recap) and 'pending' is set so the client
+    can ask again later.
+    """
+    character = Character.query.get(character_id)
+    if not character:
+        return {'error': 'Character not found'}, 404
 
-    character.recap = recap_text
-    character.last_recap_message_id = last_message_id
-    db.session.commit()
+    last_message_id = db.session.query(func.max(Message.id)).filter(Message.character_id == character.id).scalar()
+    if last_message_id is None:
+        return {'recap': ''}
 
-    return {'recap': recap_text}
+    pending = character.last_recap_message_id != last_message_id
+    if pending:
+        schedule_recap(character.id)
+    return {'recap': character.recap or '', 'pending': pending}
@@ -0,0 +1,181 @@
+import functools
+import logging
+import threading
+from flask import current_app
+from database import db, Character
+from bot.rate_limit import generate, BACKGROUND_USER
+from bot.model_registry import model_registry
+from bot.history import history_cache
+from bot.jobs import job_handler, enqueue, PRIORITY_BACKGROUND
+from bot.unit_of_work import current_turn
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 32000
+DEFAULT_MIN_RECENT_MESSAGES = 10
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PREFIX = "Summary of the adventure so far (older messages have been condensed):\n"
+SUMMARY_ACK = "Understood. I will continue the adventure from here."
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting; Gemini averages ~4 characters per token."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _entry_tokens(entry):
+    return sum(estimate_tokens(part) for part in entry['parts'])
+
+class ContextWindowMetrics:
+    """Running totals of how many prompt tokens the context window saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.full_tokens = 0
+        self.sent_tokens = 0
+        self.last_saved_tokens = 0
+
+    def record(self, full_tokens, sent_tokens):
+        with self._lock:
+            self.turns += 1
+            self.full_tokens += full_tokens
+            self.sent_tokens += sent_tokens
+            self.last_saved_tokens = full_tokens - sent_tokens
+
+    def snapshot(self):
+        with self._lock:
+            saved = self.full_tokens - self.sent_tokens
+            return {
+                'turns': self.turns,
+                'full_prompt_tokens': self.full_tokens,
+                'sent_prompt_tokens': self.sent_tokens,
+                'saved_tokens': saved,
+                'saved_tokens_per_turn': saved / self.turns if self.turns else 0,
+                'last_saved_tokens': self.last_saved_tokens,
+            }
+
+context_metrics = ContextWindowMetrics()
+
+def build_context(character, history, token_budget=None, min_recent_messages=None):
+    """
+    Builds the prompt sent to Gemini for a character.
+
+    The prompt keeps the initial DM prompt, the character's running summary
+    and every message the summary doesn't cover yet. The token budget decides
+    which older messages should be folded into the summary (see
+    schedule_summary); until the background job has done so they are still
+    sent verbatim, so a slow or failed job never drops part of the
+    conversation.
+
+    Args:
+        character: The Character the prompt is built for.
+        history: The full prompt history (see bot.history.HistoryCache).
+        token_budget: Maximum estimated prompt tokens, defaults to CONTEXT_TOKEN_BUDGET.
+        min_recent_messages: Messages that are always kept, even over budget.
+
+    Returns:
+        A tuple of the prompt list and the index of the first history entry
+        within the token budget. Entries between the summary and that index
+        are due to be summarised.
+    """
+    if token_budget is None:
+        token_budget = current_app.config.get('CONTEXT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+    if min_recent_messages is None:
+        min_recent_messages = current_app.config.get('CONTEXT_MIN_RECENT_MESSAGES', DEFAULT_MIN_RECENT_MESSAGES)
+
+    if not history:
+        return [], 0
+
+    system_entry = history[0]
+    summarized = max(character.context_summary_message_count or 0, 1)
+    summary_entries = []
+    if character.context_summary:
+        summary_entries = [
+            {'role': 'user', 'parts': [SUMMARY_PREFIX + character.context_summary]},
+            {'role': 'model', 'parts': [SUMMARY_ACK]},
+        ]
+
+    used = _entry_tokens(system_entry) + sum(_entry_tokens(entry) for entry in summary_entries)
+    window_start = len(history)
+    while window_start > summarized:
+        tokens = _entry_tokens(history[window_start - 1])
+        if used + tokens > token_budget and len(history) - window_start >= min_recent_messages:
+            break
+        used += tokens
+        window_start -= 1
+
+    # A truncated window must open with a player turn.
+    while summarized < window_start < len(history) and history[window_start]['role'] != 'user':
+        window_start -= 1
+        used += _entry_tokens(history[window_start])
+
+    # Messages that fell out of the budget but are not in the summary yet.
+    pending = history[summarized:window_start]
+    used += sum(_entry_tokens(entry) for entry in pending)
+    prompt = [system_entry] + summary_entries + history[summarized:]
+
+    full_tokens = sum(_entry_tokens(entry) for entry in history)
+    context_metrics.record(full_tokens, used)
+    logger.info(f"Context window for character {character.id}: ~{used} prompt tokens, ~{full_tokens - used} saved")
+
+    return prompt, window_start
+
+def schedule_summary(character, history, window_start):
+    """
+    Folds messages that fell out of the context window into the running
+    summary. The model call happens in a background job so the turn that
+    triggered it is not delayed; while one is queued, later turns only move
+    its window_start forward. Inside a TurnUnitOfWork the job is queued once
+    the turn has committed, since queueing commits.
+    """
+    summarized = max(character.context_summary_message_count or 0, 1)
+    if window_start <= summarized:
+        return
+
+    queue_summary = functools.partial(
+        enqueue, 'context_summary', {'character_id': character.id, 'window_start': window_start},
+        dedupe_key=f"context_summary:{character.id}", priority=PRIORITY_BACKGROUND)
+    turn = current_turn()
+    if turn is not None:
+        turn.after_commit(queue_summary)
+    else:
+        queue_summary()
+
+@job_handler('context_summary')
+def fold_into_summary(character_id, window_start):
+    """Adds the messages before window_start that the summary doesn't cover yet to it."""
+    character = Character.query.get(character_id)
+    if character is None:
+        return
+    summarized = max(character.context_summary_message_count or 0, 1)
+    entries = history_cache.get(character_id)[summarized:window_start]
+    if window_start <= summarized or not entries:
+        return
+
+    transcript = "\n".join(f"{entry['role'].capitalize()}: {''.join(entry['parts'])}" for entry in entries)
+    prompt = f"""
+You maintain a running summary of a tabletop role-playing campaign for the Game Master.
+Update the summary with the new messages below. Keep every fact that matters for the
+rest of the campaign: character decisions, stats, items, NPCs, locations, quests and open threads.
+
+Current summary:
+---
+{character.context_summary or '(none yet)'}
+---
+
+New messages:
+---
+{transcript}
+---
+
+Reply with the updated summary only.
+"""
+    model = model_registry.get()
+    response = generate(model, prompt, BACKGROUND_USER)
+
+    db.session.refresh(character)
+    if (character.context_summary_message_count or 0) < window_start:
+        character.context_summary = response.text
+        character.context_summary_message_count = window_start
+        db.session.commit()
+        logger.info(f"Context summary for character {character_id} now covers {window_start} messages")
@@ -1,91 +1,65 @@
 import logging
 import time
-import re
 import json
 import html
-from flask import current_app
+from flask import current_app, has_request_context
+from flask_login import current_user
 from flask_socketio import emit
 from bot.character_utils import update_character_sheet
+from bot.streaming import StreamTagBuffer
+from bot.response_parser import parse_bot_response, MalformedAppDataError
+from bot.llm_dispatch import llm_dispatcher
+from bot.rate_limit import rate_limiter, generate, model_key, estimate_tokens, response_tokens, retry_after, is_rate_limit_error, backoff_delay
 
 logger = logging.getLogger(__name__)
 
-class MalformedAppDataError(Exception):
-    pass
+# Bump whenever process_bot_response renders stored messages differently, so
+# cached renders (see bot.render_cache) are not reused.
+RENDERER_VERSION = 2
 
-def process_bot_response(bot_response, character_id=None):
-    charactersheet_pattern = re.compile(r'\[CHARACTERSHEET\](.*?)\[/CHARACTERSHEET\]', re.DOTALL)
-    match_cs = charactersheet_pattern.search(bot_response)
-    if match_cs and character_id:
-        cs_json_str = match_cs.group(1)
-        try:
-            cs_data = json.loads(cs_json_str)
-            update_character_sheet(character_id, cs_data)
-            bot_response = charactersheet_pattern.sub('', bot_response).strip()
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse CHARACTERSHEET json: {e}")
-
-    if bot_response.count('[APPDATA]') != bot_response.count('[/APPDATA]'):
-        raise MalformedAppDataError("Mismatched number of [APPDATA] and [/APPDATA] tags.")
-
-    appdata_pattern = re.compile(r'\[APPDATA\](.*?)\[/APPDATA\]', re.DOTALL)
-    match = appdata_pattern.search(bot_response)
-
-    if not match:
-        return bot_response.replace('\\n', '<br>')
+def _render_single_choice(choice_data):
+    title = choice_data.get('Title', 'Choose an option')
+    options = choice_data.get('Options', {})
 
-    appdata_json_str = match.group(1)
-    processed_text = appdata_pattern.sub('', bot_response).strip().replace('\\n', '<br>')
-
-    try:
-        appdata = json.loads(appdata_json_str)
-        if 'SingleChoice' in appdata:
-            choice_data = appdata['SingleChoice']
-            title = choice_data.get('Title', 'Choose an option')
-            options = choice_data.get('Options', {})
-
-            html_choices = f'<div class="singlechoice-container"><h3>{title}</h3>'
-            for key, details in options.items():
-                html_choices += f"""
+    parts = [f'<div class="singlechoice-container"><h3>{title}</h3>']
+    for key, details in options.items():
+        parts.append(f"""
                     <div class="singlechoice-option">
                         <div class="singlechoice-option-inner">
                             <button onclick="sendChoice('{details['Name']}')">{details['Name']}</button>
                         </div>
                         <span class="description">{details['Description']}</span>
                     </div>
-                """
-            html_choices += '</div>'
-
-            return processed_text + html_choices
-
-        if 'OrderedList' in appdata:
-            list_data = appdata['OrderedList']
-            title = list_data.get('Title', 'Ordered List')
-            items = list_data.get('Items', [])
-            values = list_data.get('Values', [])
-
-            html_list = f'<div class="ordered-list-container"><h3>{title}</h3><ul id="sortable-list">'
-            for i, item in enumerate(items):
-                value = values[i] if i < len(values) else ''
-                li_class = "sortable-item"
-                if i == 0:
-                    li_class += " first-item"
-                if i == len(items) - 1:
-                    li_class += " last-item"
-
-                html_list += f'<li class="{li_class}" data-name="{item["Name"]}">{item["Name"]}<div class="value-card" draggable="true" ondragstart="drag(event)" id="val-{i}"><span class="value">{value}</span><span class="arrows"><span class="up-arrow" onclick="moveValueUp(this)">&#8593;</span><span class="down-arrow" onclick="moveValueDown(this)">&#8595;</span></span><span class="drag-handle">&#9776;</span></div></li>'
-            html_list += '</ul><button onclick="confirmOrderedList()">Confirm</button></div>'
-
-            return processed_text + html_list
-
-        if 'MultiSelect' in appdata:
-            multiselect_data = appdata['MultiSelect']
-            title = multiselect_data.get('Title', 'Choose an option')
-            max_choices = multiselect_data.get('MaxChoices', 1)
-            options = multiselect_data.get('Options', {})
-
-            html_choices = f'<div class="multiselect-container" data-max-choices="{max_choices}"><h3>{title}</h3>'
-            for key, details in options.items():
-                html_choices += f"""
+                """)
+    parts.append('</div>')
+    return ''.join(parts)
+
+def _render_ordered_list(list_data):
+    title = list_data.get('Title', 'Ordered List')
+    items = list_data.get('Items', [])
+    values = list_data.get('Values', [])
+
+    parts = [f'<div class="ordered-list-container"><h3>{title}</h3><ul id="sortable-list">']
+    for i, item in enumerate(items):
+        value = values[i] if i < len(values) else ''
+        li_class = "sortable-item"
+        if i == 0:
+            li_class += " first-item"
+        if i == len(items) - 1:
+            li_class += " last-item"
+
+        parts.append(f'<li class="{li_class}" data-name="{item["Name"]}">{item["Name"]}<div class="value-card" draggable="true" ondragstart="drag(event)" id="val-{i}"><span class="value">{value}</span><span class="arrows"><span class="up-arrow" onclick="moveValueUp(this)">&#8593;</span><span class="down-arrow" onclick="moveValueDown(this)">&#8595;</span></span><span class="drag-handle">&#9776;</span></div></li>')
+    parts.append('</ul><button onclick="confirmOrderedList()">Confirm</button></div>')
+    return ''.join(parts)
+
+def _render_multi_select(multiselect_data):
+    title = multiselect_data.get('Title', 'Choose an option')
+    max_choices = multiselect_data.get('MaxChoices', 1)
+    options = multiselect_data.get('Options', {})
+
+    parts = [f'<div class="multiselect-container" data-max-choices="{max_choices}"><h3>{title}</h3>']
+    for key, details in options.items():
+        parts.append(f"""
                     <div class="multiselect-option">
                         <div class="multiselect-option-inner">
                             <input type="checkbox" id="{key}" name="{details['Name']}" value="{details['Name']}">
@@ -93,50 +67,155 @@ def process_bot_response(bot_response, character_id=None):
                         </div>
                         <span class="description">{details['Description']}</span>
                     </div>
-                """
-            html_choices += '<button onclick="confirmMultiSelect(this)">Confirm</button></div>'
-
-            return processed_text + html_choices
+                """)
+    parts.append('<button onclick="confirmMultiSelect(this)">Confirm</button></div>')
+    return ''.join(parts)
 
-        if 'DiceRoll' in appdata:
-            dice_data = appdata['DiceRoll']
-            title = dice_data.get('Title', 'Roll Dice')
-            button_text = dice_data.get('ButtonText', 'Roll')
+def _render_dice_roll(dice_data):
+    title = dice_data.get('Title', 'Roll Dice')
+    button_text = dice_data.get('ButtonText', 'Roll')
 
-            dice_data_str = html.escape(json.dumps(dice_data))
-            html_dice = f'''
+    dice_data_str = html.escape(json.dumps(dice_data))
+    return f'''
                 <div class="diceroll-container">
                     <h3>{title}</h3>
                     <button onclick="rollDice('{dice_data_str}')">{button_text}</button>
                 </div>
             '''
-            return processed_text + html_dice
 
+# Checked in order; the first key present in an [APPDATA] block selects its renderer.
+APPDATA_RENDERERS = (
+    ('SingleChoice', _render_single_choice),
+    ('OrderedList', _render_ordered_list),
+    ('MultiSelect', _render_multi_select),
+    ('DiceRoll', _render_dice_roll),
+)
+
+def render_appdata(appdata_json_str):
+    """Renders the JSON of one [APPDATA] block to HTML."""
+    try:
+        appdata = json.loads(appdata_json_str)
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse APPDATA json: {e}")
         raise MalformedAppDataError(f"Failed to parse APPDATA json: {e}")
 
-    return processed_text
+    for key, renderer in APPDATA_RENDERERS:
+        if key in appdata:
+            return renderer(appdata[key])
+    return ''
+
+def process_bot_response(bot_response, character_id=None):
+    """
+    Renders a bot response to HTML.
+
+    The character sheet is only updated when character_id is given; without
+    it the function has no side effects and can be used to re-render stored
+    messages.
+    """
+    parsed = parse_bot_response(bot_response)
+
+    for cs_json_str in parsed.character_sheets:
+        try:
+            cs_data = json.loads(cs_json_str)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse CHARACTERSHEET json: {e}")
+            continue
+        if character_id:
+            update_character_sheet(character_id, cs_data)
+
+    text = parsed.text.strip() if parsed.has_blocks else parsed.text
+    parts = [text.replace('\\n', '<br>')]
+    for appdata_json_str in parsed.appdata:
+        parts.append(render_appdata(appdata_json_str))
+    return ''.join(parts)
+
+def _render_stream_block(tag, block):
+    if tag != 'APPDATA':
+        return None
+    try:
+        return render_appdata(block[len('[APPDATA]'):-len('[/APPDATA]')])
+    except MalformedAppDataError:
+        return None
+
+def _response_text(response):
+    if hasattr(response, 'parts') and response.parts:
+        return "".join(part.text for part in response.parts)
+    return response.text
+
+def _user_key(character_id):
+    """The key requests are queued under by the rate limiter: the player, or the character outside a request."""
+    if has_request_context() and current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return f"character:{character_id}"
+
+def _stream_from_gemini(model, contents, character_id):
+    """
+    Streams a Gemini response to the client as 'message_chunk' events and
+    returns the full response text.
+    """
+    limiter = rate_limiter.for_model(model_key(model))
+    tokens = estimate_tokens(contents)
+    # The slot is held until the stream is finished.
+    with limiter.slot(_user_key(character_id), tokens) as slot:
+        emit('message_chunk', {'text': '', 'reset': True, 'character_id': character_id})
+        buffer = StreamTagBuffer(_render_stream_block)
+        chunks = []
+        start = time.monotonic()
+        try:
+            response = llm_dispatcher.call(model.generate_content, contents, stream=True)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.pause(retry_after(e) or 0)
+            raise
+        response_iter = iter(response)
+        while True:
+            # Each step of the stream blocks on the network, so it runs on the dispatcher too.
+            chunk = llm_dispatcher.call(next, response_iter, None)
+            if chunk is None:
+                break
+            chunk_text = "".join(part.text for part in chunk.parts) if chunk.parts else ''
+            if not chunk_text:
+                continue
+            if not chunks:
+                logger.info(f"Gemini stream time to first byte for character {character_id}: {(time.monotonic() - start) * 1000:.0f} ms")
+            chunks.append(chunk_text)
+            for segment in buffer.feed(chunk_text):
+                emit('message_chunk', {'text': segment, 'character_id': character_id})
+        slot.actual_tokens = response_tokens(response)
+        remaining = buffer.flush()
+        if remaining:
+            emit('message_chunk', {'text': remaining, 'character_id': character_id})
+        return "".join(chunks)
+
+def send_to_gemini_with_retry(model, history, character_id, max_retries=3, stream=None):
+    if stream is None:
+        stream = current_app.config.get('GEMINI_STREAMING', False)
 
-def send_to_gemini_with_retry(model, history, character_id, max_retries=3):
     if current_app.config.get('GEMINI_DEBUG'):
         emit('debug_message', {'type': 'request', 'data': json.dumps(history, indent=2), 'character_id': character_id})
 
     bot_response_text = None
+    corrections = []
     for attempt in range(max_retries):
         try:
-            response = model.generate_content(history)
+            contents = history + corrections if corrections else history
+            if stream:
+                bot_response_text = _stream_from_gemini(model, contents, character_id)
+                if not bot_response_text:
+                    logger.warning(f"Empty response from Gemini on attempt {attempt + 1}")
+                    if attempt + 1 == max_retries:
+                        return "Sorry, I received an empty or invalid response from the AI.", None
+                    continue
+            else:
+                response = generate(model, contents, _user_key(character_id))
 
-            if not response or not (hasattr(response, 'parts') and response.parts or hasattr(response, 'text')):
-                logger.warning(f"Empty response from Gemini on attempt {attempt + 1}")
-                if attempt + 1 == max_retries:
-                    return "Sorry, I received an empty or invalid response from the AI.", None
-                continue
+                if not response or not (hasattr(response, 'parts') and response.parts or hasattr(response, 'text')):
+                    logger.warning(f"Empty response from Gemini on attempt {attempt + 1}")
+                    if attempt + 1 == max_retries:
+                        return "Sorry, I received an empty or invalid response from the AI.", None
+                    continue
 
-            if hasattr(response, 'parts') and response.parts:
-                bot_response_text = "".join(part.text for part in response.parts)
-            else:
-                bot_response_text = response.text
+                bot_response_text = _response_text(response)
 
             if current_app.config.get('GEMINI_DEBUG'):
                 emit('debug_message', {'type': 'response', 'data': bot_response_text, 'character_id': character_id})
@@ -148,8 +227,8 @@ def send_to_gemini_with_retry(model, history, character_id, max_retries=3):
         except MalformedAppDataError as e:
             logger.warning(f"Malformed APPDATA from Gemini (attempt {attempt+1}): {e}. Retrying...")
             if bot_response_text:
-                history.append({'role': 'model', 'parts': [bot_response_text]})
-            history.append({'role': 'user', 'parts': ["The response you just sent contained a malformed [APPDATA] block. Please correct the formatting of the JSON data and resend your message."]})
+                corrections.append({'role': 'model', 'parts': [bot_response_text]})
+            corrections.append({'role': 'user', 'parts': ["The response you just sent contained a malformed [APPDATA] block. Please correct the formatting of the JSON data and resend your message."]})
 
             if attempt + 1 == max_retries:
                 logger.error(f"Failed to get valid response from Gemini after {max_retries} attempts.")
@@ -159,6 +238,6 @@ def send_to_gemini_with_retry(model, history, character_id, max_retries=3):
             logger.error(f"Error calling Gemini API on attempt {attempt + 1}: {e}")
             if attempt + 1 == max_retries:
                 return "Error: Could not connect to the bot.", None
-            time.sleep(1)
+            time.sleep(backoff_delay(attempt, e))
 
     return "An unexpected error occurred.", None
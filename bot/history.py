@@ -0,0 +1,153 @@
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import and_, or_
+from database import db, Message
+from bot.render_cache import render_cache
+from bot.reference_data import current_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CHARACTERS = 256
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# cache_version counter bumped in the transaction that deletes a character.
+VERSION_NAME = 'characters'
+
+class _CharacterHistory:
+    __slots__ = ('entries', 'last_message_id', 'lock')
+
+    def __init__(self):
+        self.entries = []
+        self.last_message_id = 0
+        self.lock = threading.Lock()
+
+class HistoryCache:
+    """
+    Keeps a warm, append-only prompt history per character.
+
+    The first lookup for a character loads its messages once; every later
+    lookup only fetches the rows written since the last known message id, so
+    the per-turn cost does not depend on the length of the campaign. The tail
+    query also picks up messages written by other workers.
+
+    Deleting a character is the one change the tail query cannot see: its
+    messages vanish, and SQLite can hand their ids to a new character. The
+    transaction that deletes a character bumps the 'characters' counter in
+    cache_version, and every lookup compares that counter (a primary key
+    read) with the one this cache last saw and starts over when it moved,
+    so no worker keeps serving a deleted character's history.
+
+    The cache-wide lock only guards the LRU bookkeeping; the tail query runs
+    under a per-character lock, so turns of different characters don't wait
+    on each other's database reads.
+    """
+
+    def __init__(self, max_characters=DEFAULT_MAX_CHARACTERS):
+        self.max_characters = max_characters
+        self._histories = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+    def get(self, character_id):
+        """
+        Returns the prompt history for a character as a list of
+        {'role': ..., 'parts': [...]} dicts.
+
+        The returned list is owned by the cache and must not be mutated.
+        """
+        character_id = int(character_id)
+        version = current_version(VERSION_NAME)
+        with self._lock:
+            if version != self._version:
+                self._histories.clear()
+                self._version = version
+            history = self._histories.get(character_id)
+            if history is None:
+                history = _CharacterHistory()
+                self._histories[character_id] = history
+                while len(self._histories) > self.max_characters:
+                    self._histories.popitem(last=False)
+            else:
+                self._histories.move_to_end(character_id)
+
+        with history.lock:
+            new_messages = Message.query.filter(
+                Message.character_id == character_id,
+                Message.id > history.last_message_id
+            ).order_by(Message.id).all()
+            for msg in new_messages:
+                history.entries.append({'role': msg.role, 'parts': [msg.content]})
+                history.last_message_id = msg.id
+
+            return history.entries
+
+    def invalidate(self, character_id):
+        """Drops the cached history for a character."""
+        with self._lock:
+            self._histories.pop(int(character_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._histories.clear()
+
+history_cache = HistoryCache()
+
+def message_history_page(character_id, before_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of a character's chat history for display, newest page first.
+
+    Args:
+        character_id: The character whose messages are loaded.
+        before_id: Only messages older than this message id are returned.
+        limit: The maximum number of messages in the page.
+
+    Returns:
+        A dict with the rendered messages of the page in chronological order,
+        the cursor for the next (older) page and whether such a page exists.
+    """
+    try:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    if before_id is not None:
+        # An invalid cursor from the client loads the newest page.
+        try:
+            before_id = int(before_id)
+        except (TypeError, ValueError):
+            before_id = None
+    query = Message.query.filter(Message.character_id == character_id)
+    if before_id is not None:
+        # The cursor's timestamp is compared inside the database: SQLite stores
+        # server_default timestamps in a format that doesn't compare equal to a
+        # bound Python datetime.
+        cursor_timestamp = db.session.query(Message.timestamp).filter(
+            Message.id == before_id,
+            Message.character_id == character_id
+        ).scalar_subquery()
+        query = query.filter(or_(
+            Message.timestamp < cursor_timestamp,
+            and_(Message.timestamp == cursor_timestamp, Message.id < before_id)
+        ))
+
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    history_data = []
+    for msg in reversed(messages):
+        if msg.role == 'user' and "You are the DM" in msg.content:
+            continue
+
+        history_data.append({
+            'id': msg.id,
+            'role': msg.role,
+            'content': render_cache.render(msg)
+        })
+
+    return {
+        'history': history_data,
+        'before_id': messages[-1].id if has_more else None,
+        'has_more': has_more,
+    }
@@ -0,0 +1,303 @@
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.orm import aliased
+from database import db, Job
+from bot.llm_dispatch import llm_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first. Work a player is waiting for goes ahead of upkeep such
+# as summaries and recaps.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 50
+PRIORITY_BACKGROUND = 100
+
+DEFAULT_WORKERS = 1
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_RETRY_MAX_SECONDS = 1800
+DEFAULT_MAX_ATTEMPTS = 3
+CLAIM_CANDIDATES = 10
+MAX_ERROR_LENGTH = 2000
+
+_handlers = {}
+
+def job_handler(kind):
+    """Registers a function as the handler for jobs of a kind. It is called with the job's payload as keyword arguments."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+def _now():
+    return datetime.datetime.utcnow()
+
+def enqueue(kind, payload=None, dedupe_key=None, priority=PRIORITY_DEFAULT, max_attempts=DEFAULT_MAX_ATTEMPTS, delay=0):
+    """
+    Queues a job and commits it.
+
+    If a job with the same dedupe_key is still pending, no new job is added;
+    the pending one gets this payload (the newest request wins) and the more
+    urgent of the two priorities. A job that is already running doesn't
+    count, so work requested while it runs isn't lost.
+
+    Returns:
+        The queued Job.
+    """
+    payload_json = json.dumps(payload or {})
+    job = None
+    if dedupe_key is not None:
+        job = Job.query.filter_by(dedupe_key=dedupe_key, status='pending').order_by(Job.id).first()
+    if job is not None:
+        job.payload = payload_json
+        job.priority = min(job.priority, priority)
+    else:
+        job = Job(kind=kind, payload=payload_json, dedupe_key=dedupe_key, priority=priority,
+                  max_attempts=max_attempts, run_after=_now() + datetime.timedelta(seconds=delay))
+        db.session.add(job)
+    db.session.commit()
+    job_worker.notify()
+    return job
+
+def claim_next(worker_id, below_priority=None):
+    """
+    Marks the most urgent due job as running and returns it, or None.
+
+    The claim is a conditional UPDATE, so two workers polling the same table
+    never both get a job. A job is skipped while another job with its
+    dedupe_key is running.
+    """
+    now = _now()
+    running = aliased(Job)
+    busy = db.session.query(running.id).filter(running.status == 'running', running.dedupe_key == Job.dedupe_key).exists()
+    query = db.session.query(Job.id).filter(
+        Job.status == 'pending',
+        Job.run_after <= now,
+        or_(Job.dedupe_key.is_(None), ~busy)
+    )
+    if below_priority is not None:
+        query = query.filter(Job.priority < below_priority)
+    candidates = query.order_by(Job.priority, Job.id).limit(CLAIM_CANDIDATES).all()
+
+    for (job_id,) in candidates:
+        claimed = Job.query.filter(Job.id == job_id, Job.status == 'pending').update({
+            'status': 'running',
+            'locked_by': worker_id,
+            'locked_at': now,
+            'attempts': Job.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a job that failed for the attempts-th time: exponential back-off, capped."""
+    base = current_app.config.get('JOB_RETRY_BASE_SECONDS', DEFAULT_RETRY_BASE_SECONDS)
+    cap = current_app.config.get('JOB_RETRY_MAX_SECONDS', DEFAULT_RETRY_MAX_SECONDS)
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+def run_job(job):
+    """Runs a claimed job and records the outcome. Returns True if it succeeded."""
+    job_id, kind = job.id, job.kind
+    try:
+        handler = _handlers.get(kind)
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{kind}'")
+        handler(**json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = str(e)[:MAX_ERROR_LENGTH]
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = _now()
+            logger.error(f"Job {job_id} ({kind}) failed after {job.attempts} attempts: {e}")
+        else:
+            delay = retry_delay(job.attempts)
+            job.status = 'pending'
+            job.run_after = _now() + datetime.timedelta(seconds=delay)
+            logger.warning(f"Job {job_id} ({kind}) failed on attempt {job.attempts}, retrying in {delay}s: {e}")
+        db.session.commit()
+        return False
+
+    job = db.session.get(Job, job_id)
+    job.status = 'done'
+    job.locked_by = None
+    job.finished_at = _now()
+    db.session.commit()
+    return True
+
+def requeue_stale(lease_seconds):
+    """
+    Hands jobs back to the queue whose worker has held them longer than the
+    lease (e.g. because it died). Only writes when there are such jobs, so a
+    sweep of an idle queue doesn't take SQLite's write lock.
+    """
+    cutoff = _now() - datetime.timedelta(seconds=lease_seconds)
+    stale = Job.query.filter(Job.status == 'running', Job.locked_at < cutoff)
+    if not db.session.query(stale.exists()).scalar():
+        return 0
+    failed = stale.filter(Job.attempts >= Job.max_attempts).update(
+        {'status': 'failed', 'locked_by': None, 'finished_at': _now(), 'last_error': 'Lease expired'},
+        synchronize_session=False)
+    requeued = stale.update({'status': 'pending', 'locked_by': None}, synchronize_session=False)
+    db.session.commit()
+    if failed or requeued:
+        logger.warning(f"Requeued {requeued} and failed {failed} jobs whose lease expired")
+    return requeued + failed
+
+def purge_finished(older_than_days):
+    """Deletes done and failed jobs that finished more than older_than_days ago."""
+    cutoff = _now() - datetime.timedelta(days=older_than_days)
+    deleted = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def job_stats(pending_limit=20):
+    """Job counts by status and kind, and the next pending jobs."""
+    counts = {}
+    for status, kind, count in db.session.query(Job.status, Job.kind, func.count(Job.id)).group_by(Job.status, Job.kind):
+        counts.setdefault(status, {})[kind] = count
+    pending = Job.query.filter_by(status='pending').order_by(Job.priority, Job.run_after, Job.id).limit(pending_limit).all()
+    return {
+        'counts': counts,
+        'pending': [{
+            'id': job.id,
+            'kind': job.kind,
+            'dedupe_key': job.dedupe_key,
+            'priority': job.priority,
+            'attempts': job.attempts,
+            'run_after': job.run_after.strftime('%Y-%m-%d %H:%M:%S') + ' UTC',
+            'last_error': job.last_error,
+        } for job in pending],
+        'worker': job_worker.stats(),
+    }
+
+class JobWorker:
+    """
+    Runs queued jobs in background greenlets.
+
+    JOB_WORKERS greenlets are started in the web process when it serves its
+    first request; set it to 0 to leave the queue to separate
+    `flask run-jobs` processes. While model calls from chat turns are
+    waiting for the LLM dispatch pool, an in-process worker only takes jobs
+    more urgent than PRIORITY_BACKGROUND, so summaries and recaps never hold
+    up a player.
+
+    Expired leases are swept at most once per half lease per process, not
+    on every poll.
+    """
+
+    def __init__(self, concurrency=DEFAULT_WORKERS, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = DEFAULT_LEASE_SECONDS
+        self._app = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._last_sweep = None
+        self.processed = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.concurrency = app.config.get('JOB_WORKERS', DEFAULT_WORKERS)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+        self.lease_seconds = app.config.get('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+        self._app = app
+        app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self.concurrency > 0 and not self._threads:
+            self.start()
+
+    def start(self, concurrency=None):
+        """Starts the worker greenlets for this process."""
+        with self._lock:
+            if self._threads:
+                return
+            if self._app is None:
+                self._app = current_app._get_current_object()
+            self._stopping = False
+            for index in range(concurrency or self.concurrency):
+                thread = threading.Thread(target=self._run, args=(self._worker_id(index),), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {len(self._threads)} job workers")
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self):
+        """Wakes an idle worker up to look for a new job."""
+        self._wakeup.set()
+
+    def _worker_id(self, index):
+        return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+    def _below_priority(self):
+        # Interactive model calls are waiting for a pool thread: leave background work alone.
+        if llm_dispatcher.stats()['queue_depth'] > 0:
+            return PRIORITY_BACKGROUND
+        return None
+
+    def _sweep_due(self):
+        # No lock: start() holds self._lock while the workers start, and two
+        # workers sweeping at once is harmless.
+        now = time.monotonic()
+        if self._last_sweep is not None and now - self._last_sweep < self.lease_seconds / 2:
+            return False
+        self._last_sweep = now
+        return True
+
+    def run_pending(self, worker_id=None, below_priority=None):
+        """Runs due jobs until none are left; returns how many ran. Needs an app context."""
+        worker_id = worker_id or self._worker_id('once')
+        ran = 0
+        while not self._stopping:
+            job = claim_next(worker_id, below_priority if below_priority is not None else self._below_priority())
+            if job is None:
+                break
+            if run_job(job):
+                self.processed += 1
+            else:
+                self.failed += 1
+            ran += 1
+        return ran
+
+    def _run(self, worker_id):
+        while not self._stopping:
+            try:
+                with self._app.app_context():
+                    if self._sweep_due():
+                        requeue_stale(self.lease_seconds)
+                    self.run_pending(worker_id)
+                    db.session.remove()
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def stats(self):
+        return {
+            'workers': len(self._threads),
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+job_worker = JobWorker()
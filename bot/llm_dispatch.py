@@ -0,0 +1,67 @@
+import logging
+from gevent.monkey import get_original
+from gevent.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+# The counters are touched from native worker threads, so they need a real
+# lock rather than the gevent-patched one.
+_allocate_lock = get_original('_thread', 'allocate_lock')
+
+DEFAULT_MAX_WORKERS = 8
+
+class LLMDispatcher:
+    """
+    Runs blocking model calls in a bounded pool of native threads.
+
+    The Google client talks gRPC, which is not cooperative under gevent, so a
+    slow generate_content call made directly from a socket handler would
+    freeze every other greenlet on the worker. Calls made through the
+    dispatcher only block the calling greenlet; the handler then emits the
+    result to its own client as before.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = _allocate_lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+
+    def init_app(self, app):
+        self.max_workers = app.config.get('LLM_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.max_workers)
+        return self._pool
+
+    def call(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on a worker thread and waits for its result."""
+        with self._lock:
+            self._queued += 1
+
+        def run():
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+
+        return self._get_pool().apply(run)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+            }
+
+llm_dispatcher = LLMDispatcher()
@@ -0,0 +1,83 @@
+import logging
+import queue
+import threading
+import socketio
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'dndadventure'
+LOCAL_URL = 'local://'
+
+class LocalManager(socketio.PubSubManager):
+    """
+    In-process stand-in for a Redis message queue.
+
+    Every Socket.IO server created with a LocalManager on the same channel
+    receives the others' emits, room changes and disconnects, exactly as
+    servers sharing a Redis channel would. It cannot reach other processes,
+    so it is only meant for tests and for trying the multi-worker code paths
+    on a single process.
+    """
+    name = 'local'
+
+    _channels = {}
+    _channels_lock = threading.Lock()
+
+    def __init__(self, url=LOCAL_URL, channel=DEFAULT_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = queue.Queue()
+        if not write_only:
+            with self._channels_lock:
+                self._channels.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        with self._channels_lock:
+            inboxes = list(self._channels.get(self.channel, []))
+        for inbox in inboxes:
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+    def close(self):
+        """Stops receiving messages on the channel."""
+        with self._channels_lock:
+            inboxes = self._channels.get(self.channel, [])
+            if self._inbox in inboxes:
+                inboxes.remove(self._inbox)
+
+def socketio_options(app):
+    """
+    SocketIO keyword arguments for SOCKETIO_MESSAGE_QUEUE.
+
+    Without a message queue every emit only reaches the clients of the
+    current process. With a Redis (redis://) or any Kombu URL the workers
+    share a channel, so emits from any worker, background job or
+    `flask run-jobs` process reach the client wherever it is connected.
+    'local://' selects LocalManager.
+    """
+    url = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return {}
+    channel = app.config.get('SOCKETIO_CHANNEL', DEFAULT_CHANNEL)
+    logger.info(f"Socket.IO message queue: {url.split('://')[0]} (channel {channel})")
+    if url == LOCAL_URL:
+        return {'client_manager': LocalManager(channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+def user_room(user_id):
+    """The room every Socket.IO connection of a user joins."""
+    return f"user:{user_id}"
+
+def emit_to_user(user_id, event, data):
+    """
+    Emits to all connections of a user from outside a Socket.IO handler,
+    e.g. from a background job. Returns False when the app has no SocketIO.
+    """
+    server = current_app.extensions.get('socketio')
+    if server is None:
+        return False
+    server.emit(event, data, to=user_room(user_id))
+    return True
@@ -0,0 +1,167 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from gevent.monkey import get_original
+import google.generativeai as genai
+from database import db
+from bot.reference_data import current_version, bump_version, DEFAULT_POLL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# PooledModel counters are updated from the native threads of the LLM
+# dispatcher, so they need a real lock rather than the gevent-patched one.
+_allocate_lock = get_original('_thread', 'allocate_lock')
+
+DEFAULT_MAX_CLIENTS = 64
+SETTINGS_VERSION = 'gemini_settings'
+
+class PooledModel:
+    """
+    A GenerativeModel shared between requests, counting its calls.
+
+    For streamed calls the latency is the time until the stream is opened.
+    """
+
+    def __init__(self, model, model_name, generation_config, system_prompt_id):
+        self.model = model
+        self.model_name = getattr(model, 'model_name', None) or model_name
+        self.generation_config = generation_config
+        self.system_prompt_id = system_prompt_id
+        self._lock = _allocate_lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.last_used = None
+
+    def generate_content(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.model.generate_content(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.calls += 1
+                self.total_seconds += elapsed
+                self.last_used = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'generation_config': self.generation_config,
+                'system_prompt_id': self.system_prompt_id,
+                'calls': self.calls,
+                'errors': self.errors,
+                'average_latency_ms': round(self.total_seconds / self.calls * 1000, 2) if self.calls else None,
+                'last_used': time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(self.last_used)) if self.last_used else None,
+            }
+
+class ModelRegistry:
+    """
+    Builds each GenerativeModel once per (model name, generation config,
+    system prompt version) and hands out the same instance afterwards, so
+    requests reuse its client and warm transport instead of constructing a
+    new one per call.
+
+    The registry is cleared when the admin selects another GEMINI_MODEL;
+    clients are then rebuilt on first use. Other worker processes notice
+    the change through the gemini_settings cache_version counter, which is
+    checked at most once per REFERENCE_DATA_POLL_SECONDS, and reload their
+    config. The least recently used client is dropped beyond
+    GEMINI_MODEL_CLIENTS.
+    """
+
+    def __init__(self, max_clients=DEFAULT_MAX_CLIENTS, poll_seconds=None):
+        self.max_clients = max_clients
+        self.poll_seconds = poll_seconds
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._settings_version = None
+        self._checked = 0.0
+        self.builds = 0
+
+    def init_app(self, app):
+        self.max_clients = app.config.get('GEMINI_MODEL_CLIENTS', DEFAULT_MAX_CLIENTS)
+        self.poll_seconds = app.config.get('REFERENCE_DATA_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+
+    def _sync_settings(self):
+        """Picks up a model change the admin saved on another worker."""
+        now = time.monotonic()
+        if self.poll_seconds is None or now - self._checked < self.poll_seconds:
+            return
+        self._checked = now
+        version = current_version(SETTINGS_VERSION)
+        if self._settings_version is not None and version != self._settings_version:
+            current_app.config.from_pyfile('config.py', silent=True)
+            self.clear()
+            logger.info(f"Gemini settings changed on another worker; now using {current_app.config.get('GEMINI_MODEL')}")
+        self._settings_version = version
+
+    def settings_changed(self):
+        """
+        Called after the admin saved GEMINI_MODEL: drops this worker's
+        clients and tells the other workers to reload their config.
+        """
+        self.clear()
+        bump_version(SETTINGS_VERSION)
+        db.session.commit()
+        self._settings_version = current_version(SETTINGS_VERSION)
+
+    def get(self, model_name=None, generation_config=None, system_prompt=None):
+        """
+        Returns the shared model for GEMINI_MODEL (or model_name) with the
+        given generation config and SystemPrompt as system instruction.
+        """
+        self._sync_settings()
+        if model_name is None:
+            model_name = current_app.config.get('GEMINI_MODEL')
+        config_key = json.dumps(generation_config, sort_keys=True) if generation_config else None
+        system_prompt_id = system_prompt.id if system_prompt is not None else None
+        key = (model_name, config_key, system_prompt_id)
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+        kwargs = {}
+        if generation_config:
+            kwargs['generation_config'] = generation_config
+        if system_prompt is not None:
+            kwargs['system_instruction'] = system_prompt.content
+        client = PooledModel(genai.GenerativeModel(model_name, **kwargs), model_name, generation_config, system_prompt_id)
+
+        with self._lock:
+            # Another greenlet may have built the same client meanwhile.
+            existing = self._clients.get(key)
+            if existing is not None:
+                return existing
+            self._clients[key] = client
+            self.builds += 1
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        logger.info(f"Built Gemini client for {model_name} (system prompt {system_prompt_id})")
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            builds = self.builds
+        return {
+            'builds': builds,
+            'clients': [client.stats() for client in clients],
+        }
+
+model_registry = ModelRegistry()
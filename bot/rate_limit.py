@@ -0,0 +1,331 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from flask import current_app
+from bot.llm_dispatch import llm_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Limits per model. 0 disables a limit. GEMINI_RATE_LIMITS can override them
+# for individual models, e.g. {'gemini-1.5-flash': {'rpm': 1000}}.
+DEFAULT_RPM = 0
+DEFAULT_TPM = 0
+DEFAULT_MAX_IN_FLIGHT = 0
+DEFAULT_RETRY_BASE_SECONDS = 1.0
+DEFAULT_RETRY_MAX_SECONDS = 30.0
+
+CHARS_PER_TOKEN = 4
+# Queue key shared by all background jobs, so together they get one user's share.
+BACKGROUND_USER = 'background'
+# A waiter re-checks the limits at least this often.
+MAX_WAIT_SLICE = 1.0
+WINDOW_SECONDS = 60.0
+
+def estimate_tokens(contents):
+    """Rough prompt size of a string or a list of {'role', 'parts'} entries, ~4 characters per token."""
+    if isinstance(contents, str):
+        return len(contents) // CHARS_PER_TOKEN + 1
+    total = 0
+    for entry in contents or []:
+        if isinstance(entry, dict):
+            total += sum(len(str(part)) for part in entry.get('parts', []))
+        else:
+            total += len(str(entry))
+    return total // CHARS_PER_TOKEN + 1
+
+def response_tokens(response):
+    """Total tokens reported by a Gemini response, or None."""
+    usage = getattr(response, 'usage_metadata', None)
+    total = getattr(usage, 'total_token_count', None)
+    return total if isinstance(total, int) and total > 0 else None
+
+_RETRY_IN = re.compile(r"retry in ([0-9.]+)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*([0-9]+)")
+
+def retry_after(error):
+    """The delay in seconds a provider error asks for before retrying, if it gives one."""
+    hint = getattr(error, 'retry_after', None)
+    if isinstance(hint, (int, float)):
+        return float(hint)
+    for detail in getattr(error, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None and hasattr(delay, 'seconds'):
+            return delay.seconds + getattr(delay, 'nanos', 0) / 1e9
+    message = str(error)
+    for pattern in (_RETRY_IN, _RETRY_DELAY):
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+def is_rate_limit_error(error):
+    return getattr(error, 'code', None) == 429 or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+def backoff_delay(attempt, error=None, base=None, cap=None):
+    """
+    Seconds to wait before retry number attempt + 1: exponential back-off
+    with full jitter, but never less than the error's retry-after hint.
+    """
+    if base is None:
+        base = current_app.config.get('GEMINI_RETRY_BASE_SECONDS', DEFAULT_RETRY_BASE_SECONDS)
+    if cap is None:
+        cap = current_app.config.get('GEMINI_RETRY_MAX_SECONDS', DEFAULT_RETRY_MAX_SECONDS)
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    hint = retry_after(error) if error is not None else None
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
+
+class _Waiter:
+    __slots__ = ('tokens', 'event', 'granted')
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.event = threading.Event()
+        self.granted = False
+
+class ModelLimiter:
+    """
+    Requests-per-minute, tokens-per-minute and in-flight limits for one model.
+
+    The per-minute limits are token buckets that refill continuously, so a
+    burst can use a full minute's allowance at once and then proceeds at the
+    configured rate. Requests that have to wait are queued per user and
+    admitted round-robin, so one player clicking quickly can't starve the
+    others. Tokens are charged from an estimate of the prompt when a request
+    is admitted and corrected with the reported usage when it finishes.
+    """
+
+    def __init__(self, model, rpm=0, tpm=0, max_in_flight=0):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._request_allowance = float(rpm)
+        self._token_allowance = float(tpm)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._queues = OrderedDict()
+        self._waiting = 0
+        self._in_flight = 0
+        self._admitted = deque()
+        self._tokens_used = deque()
+        self.requests = 0
+        self.throttled = 0
+        self.rate_limit_errors = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._refilled
+        self._refilled = now
+        if self.rpm:
+            self._request_allowance = min(self.rpm, self._request_allowance + elapsed * self.rpm / WINDOW_SECONDS)
+        if self.tpm:
+            self._token_allowance = min(self.tpm, self._token_allowance + elapsed * self.tpm / WINDOW_SECONDS)
+
+    def _delay_for(self, tokens, now):
+        """Seconds until a request of this size fits; 0 if it fits now, None if it waits for a slot."""
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            return None
+        delay = max(self._paused_until - now, 0.0)
+        if self.rpm and self._request_allowance < 1:
+            delay = max(delay, (1 - self._request_allowance) * WINDOW_SECONDS / self.rpm)
+        if self.tpm:
+            # A prompt larger than the whole allowance waits for a full bucket.
+            needed = min(tokens, self.tpm)
+            if self._token_allowance < needed:
+                delay = max(delay, (needed - self._token_allowance) * WINDOW_SECONDS / self.tpm)
+        return delay
+
+    def _dispatch(self):
+        """Admits queued requests, one user at a time, while the limits allow. Returns how long the next must wait."""
+        now = time.monotonic()
+        self._refill(now)
+        while self._queues:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            delay = self._delay_for(waiter.tokens, now)
+            if delay is None or delay > 0:
+                return delay
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._admit(waiter.tokens, now)
+            self._waiting -= 1
+            waiter.granted = True
+            waiter.event.set()
+        return 0
+
+    def _admit(self, tokens, now):
+        if self.rpm:
+            self._request_allowance -= 1
+        if self.tpm:
+            self._token_allowance -= tokens
+        self._in_flight += 1
+        self.requests += 1
+        self._admitted.append(now)
+        self._tokens_used.append((now, tokens))
+
+    def acquire(self, user, tokens):
+        """Blocks until a request of about this many tokens may be sent for user."""
+        start = time.monotonic()
+        waiter = _Waiter(tokens)
+        with self._lock:
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._waiting += 1
+            delay = self._dispatch()
+        if not waiter.granted:
+            with self._lock:
+                self.throttled += 1
+        while not waiter.granted:
+            waiter.event.wait(min(delay, MAX_WAIT_SLICE) if delay else MAX_WAIT_SLICE)
+            with self._lock:
+                delay = self._dispatch()
+        waited = time.monotonic() - start
+        with self._lock:
+            self.wait_seconds += waited
+        return waited
+
+    def release(self, estimated_tokens, actual_tokens=None):
+        """Frees the request's slot and charges any tokens beyond the estimate."""
+        with self._lock:
+            self._in_flight -= 1
+            if actual_tokens is not None and actual_tokens != estimated_tokens:
+                extra = actual_tokens - estimated_tokens
+                if self.tpm:
+                    self._token_allowance -= extra
+                self._tokens_used.append((time.monotonic(), extra))
+            self._dispatch()
+
+    def pause(self, seconds):
+        """Holds every request for this model, e.g. after the provider returned a retry-after."""
+        with self._lock:
+            self.rate_limit_errors += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @contextmanager
+    def slot(self, user, tokens):
+        """
+        Holds a request slot for the duration of the block. Set
+        slot.actual_tokens inside it to correct the token estimate.
+        """
+        handle = _Slot(tokens)
+        self.acquire(user, tokens)
+        try:
+            yield handle
+        finally:
+            self.release(tokens, handle.actual_tokens)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            while self._admitted and self._admitted[0] < now - WINDOW_SECONDS:
+                self._admitted.popleft()
+            while self._tokens_used and self._tokens_used[0][0] < now - WINDOW_SECONDS:
+                self._tokens_used.popleft()
+            requests_last_minute = len(self._admitted)
+            tokens_last_minute = sum(tokens for _, tokens in self._tokens_used)
+
+            def utilisation(used, limit):
+                return round(used / limit, 3) if limit else None
+
+            return {
+                'rpm_limit': self.rpm or None,
+                'tpm_limit': self.tpm or None,
+                'max_in_flight': self.max_in_flight or None,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'waiting_users': len(self._queues),
+                'requests_last_minute': requests_last_minute,
+                'tokens_last_minute': tokens_last_minute,
+                'rpm_utilisation': utilisation(requests_last_minute, self.rpm),
+                'tpm_utilisation': utilisation(tokens_last_minute, self.tpm),
+                'in_flight_utilisation': utilisation(self._in_flight, self.max_in_flight),
+                'paused_seconds': round(max(self._paused_until - now, 0.0), 2),
+                'requests': self.requests,
+                'throttled_requests': self.throttled,
+                'rate_limit_errors': self.rate_limit_errors,
+                'average_wait_ms': round(self.wait_seconds / self.requests * 1000, 2) if self.requests else 0,
+            }
+
+class _Slot:
+    __slots__ = ('estimated_tokens', 'actual_tokens')
+
+    def __init__(self, tokens):
+        self.estimated_tokens = tokens
+        self.actual_tokens = None
+
+class RateLimiter:
+    """
+    The ModelLimiter of each Gemini model, shared by every request of the process.
+
+    The limits are per API key. When WORKER_PROCESSES processes share the
+    key, each one enforces its share of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self.defaults = {'rpm': DEFAULT_RPM, 'tpm': DEFAULT_TPM, 'max_in_flight': DEFAULT_MAX_IN_FLIGHT}
+        self.overrides = {}
+        self.workers = 1
+
+    def init_app(self, app):
+        self.defaults = {
+            'rpm': app.config.get('GEMINI_RPM', DEFAULT_RPM),
+            'tpm': app.config.get('GEMINI_TPM', DEFAULT_TPM),
+            'max_in_flight': app.config.get('GEMINI_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT),
+        }
+        self.overrides = app.config.get('GEMINI_RATE_LIMITS', {})
+        self.workers = max(1, app.config.get('WORKER_PROCESSES', 1))
+        with self._lock:
+            self._limiters = {}
+
+    def for_model(self, model):
+        model = model.removeprefix('models/')
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limits = dict(self.defaults, **self.overrides.get(model, {}))
+                # 0 means unlimited and stays so; a share is at least 1.
+                limits = {name: max(1, value // self.workers) if value else 0 for name, value in limits.items()}
+                limiter = ModelLimiter(model, **limits)
+                self._limiters[model] = limiter
+            return limiter
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.model: limiter.snapshot() for limiter in limiters}
+
+rate_limiter = RateLimiter()
+
+def model_key(model):
+    """The name a GenerativeModel is limited under: its model name, or GEMINI_MODEL."""
+    return getattr(model, 'model_name', None) or current_app.config.get('GEMINI_MODEL') or 'default'
+
+def generate(model, contents, user, **kwargs):
+    """
+    Calls model.generate_content through the model's limiter and the LLM
+    dispatch pool. A rate-limit error pauses the model for its retry-after
+    hint and is re-raised for the caller to retry.
+    """
+    limiter = rate_limiter.for_model(model_key(model))
+    tokens = estimate_tokens(contents)
+    with limiter.slot(user, tokens) as slot:
+        try:
+            response = llm_dispatcher.call(model.generate_content, contents, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                limiter.pause(retry_after(e) or 0)
+            raise
+        slot.actual_tokens = response_tokens(response)
+    return response
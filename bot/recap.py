@@ -0,0 +1,142 @@
+import datetime
+import logging
+from database import db, Character, Message, SessionSummary
+from bot.rate_limit import generate, BACKGROUND_USER
+from bot.model_registry import model_registry
+from bot.jobs import job_handler, enqueue, PRIORITY_BACKGROUND
+from bot.message_queue import emit_to_user
+
+logger = logging.getLogger(__name__)
+
+SESSION_GAP = datetime.timedelta(hours=1)
+RECENT_SESSIONS = 2
+
+def split_sessions(messages):
+    """Splits messages, in order, into sessions wherever more than an hour passes between two messages."""
+    sessions = []
+    for message in messages:
+        if sessions and message.timestamp - sessions[-1][-1].timestamp <= SESSION_GAP:
+            sessions[-1].append(message)
+        else:
+            sessions.append([message])
+    return sessions
+
+def _transcript(messages):
+    return "\n".join(
+        f"{msg.role.capitalize()}: {msg.content}"
+        for msg in messages
+        if not (msg.role == 'user' and "You are the DM" in msg.content)
+    )
+
+def _generate(prompt):
+    model = model_registry.get()
+    response = generate(model, prompt, BACKGROUND_USER)
+    return response.text.replace('\\n', '<br>')
+
+def _summarize_session(messages):
+    transcript = _transcript(messages)
+    if not transcript:
+        return ''
+    return _generate(f"""
+Please summarise the following session of a tabletop role-playing adventure in detail for the player.
+Cover what happened, the decisions the player made, the people and places they met, and what was left open.
+
+Here is the message history of the session:
+---
+{transcript}
+---
+
+Reply with the summary only.
+""")
+
+def _merge_overview(overview, summaries):
+    new_sessions = "\n\n".join(summary for summary in summaries if summary)
+    return _generate(f"""
+Please write a general overview of a tabletop role-playing adventure so far, in one paragraph.
+
+Overview of the earlier sessions:
+---
+{overview or '(this is the start of the adventure)'}
+---
+
+Summaries of the sessions since then:
+---
+{new_sessions}
+---
+
+Reply with the updated one-paragraph overview only.
+""")
+
+def _compose_recap(overview, recent):
+    parts = []
+    if overview:
+        parts.append(f"<b>The adventure so far</b><br>{overview}")
+    recent = [summary for summary in recent if summary.summary]
+    if recent:
+        parts.append("<b>Recent sessions</b><br>" + "<br><br>".join(summary.summary for summary in recent))
+    return "<br><br>".join(parts)
+
+@job_handler('recap')
+def refresh_recap(character_id):
+    """
+    Brings a character's recap up to date, summarising only what is new.
+
+    Each closed session is summarised once and stored. The open (latest)
+    session is summarised again only when it has new messages. The
+    one-paragraph overview is merged with the summaries of newly closed
+    sessions instead of being regenerated from the whole campaign. The recap
+    is the overview followed by the last two session summaries.
+    """
+    character = db.session.get(Character, int(character_id))
+    if character is None:
+        return
+
+    closed = SessionSummary.query.filter_by(character_id=character.id, is_open=False).order_by(SessionSummary.last_message_id).all()
+    open_summary = SessionSummary.query.filter_by(character_id=character.id, is_open=True).first()
+
+    start_after = closed[-1].last_message_id if closed else 0
+    messages = Message.query.filter(
+        Message.character_id == character.id,
+        Message.id > start_after
+    ).order_by(Message.timestamp.asc(), Message.id.asc()).all()
+    if not messages:
+        return
+    sessions = split_sessions(messages)
+
+    newly_closed = []
+    for session in sessions[:-1]:
+        if open_summary is not None and open_summary.first_message_id == session[0].id and open_summary.last_message_id == session[-1].id:
+            # The open session was already summarised in full before it closed.
+            summary = SessionSummary(character_id=character.id, first_message_id=session[0].id, last_message_id=session[-1].id,
+                                     message_count=len(session), summary=open_summary.summary)
+        else:
+            summary = SessionSummary(character_id=character.id, first_message_id=session[0].id, last_message_id=session[-1].id,
+                                     message_count=len(session), summary=_summarize_session(session))
+        db.session.add(summary)
+        newly_closed.append(summary)
+
+    current = sessions[-1]
+    if open_summary is None:
+        open_summary = SessionSummary(character_id=character.id, is_open=True, first_message_id=current[0].id,
+                                      last_message_id=0, message_count=0, summary='')
+        db.session.add(open_summary)
+    if open_summary.first_message_id != current[0].id or open_summary.last_message_id != current[-1].id:
+        open_summary.first_message_id = current[0].id
+        open_summary.last_message_id = current[-1].id
+        open_summary.message_count = len(current)
+        open_summary.summary = _summarize_session(current)
+
+    if newly_closed:
+        character.recap_overview = _merge_overview(character.recap_overview, [s.summary for s in newly_closed])
+        character.recap_overview_message_id = newly_closed[-1].last_message_id
+
+    recent = (closed + newly_closed)[-(RECENT_SESSIONS - 1):] + [open_summary]
+    character.recap = _compose_recap(character.recap_overview, recent)
+    character.last_recap_message_id = messages[-1].id
+    db.session.commit()
+    emit_to_user(character.user_id, 'recap_ready', {'character_id': character.id, 'recap': character.recap})
+    logger.info(f"Recap for character {character.id} refreshed: {len(newly_closed)} new sessions summarised")
+
+def schedule_recap(character_id):
+    """Queues a refresh of a character's recap; a refresh that is already queued is not queued again."""
+    enqueue('recap', {'character_id': character_id}, dedupe_key=f"recap:{character_id}", priority=PRIORITY_BACKGROUND)
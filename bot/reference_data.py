@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import namedtuple
+from database import db, TTRPGType, GeminiPrepMessage, CacheVersion
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = 'reference_data'
+DEFAULT_POLL_SECONDS = 5.0
+
+# Immutable copies of the rows, safe to share between requests and greenlets.
+CachedTTRPGType = namedtuple('CachedTTRPGType', ['id', 'name', 'json_template', 'html_template', 'wiki_link', 'template_version'])
+CachedPrepMessage = namedtuple('CachedPrepMessage', ['id', 'message', 'priority'])
+
+def current_version(name):
+    """The value of a cache_version counter, 0 if it was never bumped."""
+    return db.session.query(CacheVersion.version).filter(CacheVersion.name == name).scalar() or 0
+
+def bump_version(name):
+    """Increments a cache_version counter in the current transaction."""
+    updated = CacheVersion.query.filter_by(name=name).update(
+        {'version': CacheVersion.version + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def template_version(html_template):
+    """Content hash that addresses a sheet template, so clients can cache it."""
+    return hashlib.sha256((html_template or '').encode('utf-8')).hexdigest()[:16]
+
+class ReferenceDataCache:
+    """
+    Read-through cache of the TTRPG types and Gemini prep messages.
+
+    This data only changes through the admin blueprint, which commits its
+    writes with commit(). That also increments a row in cache_version;
+    every worker compares that counter with the version it loaded, at most
+    once per REFERENCE_DATA_POLL_SECONDS, and reloads everything when it
+    moved. Between checks reads are served from memory.
+    """
+
+    def __init__(self, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0.0
+        self._ttrpg_types = None
+        self._prep_messages = None
+        self._templates = None
+        self.loads = 0
+        self.version_checks = 0
+
+    def init_app(self, app):
+        self.poll_seconds = app.config.get('REFERENCE_DATA_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+
+    def _current_version(self):
+        self.version_checks += 1
+        return current_version(VERSION_NAME)
+
+    def _load(self, check_version=False):
+        """
+        Returns the cached data, reloading it if another worker bumped the
+        version. check_version compares the version now instead of waiting
+        for the poll interval. Needs an app context.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._ttrpg_types is not None and not check_version and now - self._checked < self.poll_seconds:
+                return self._ttrpg_types, self._prep_messages, self._templates
+
+            version = self._current_version()
+            self._checked = now
+            if self._ttrpg_types is not None and version == self._version:
+                return self._ttrpg_types, self._prep_messages, self._templates
+
+            self._ttrpg_types = {
+                t.id: CachedTTRPGType(t.id, t.name, t.json_template, t.html_template, t.wiki_link,
+                                      template_version(t.html_template))
+                for t in TTRPGType.query.order_by(TTRPGType.id).all()
+            }
+            self._templates = {(t.id, t.template_version): t for t in self._ttrpg_types.values()}
+            self._prep_messages = tuple(
+                CachedPrepMessage(m.id, m.message, m.priority)
+                for m in GeminiPrepMessage.query.order_by(GeminiPrepMessage.priority, GeminiPrepMessage.id).all()
+            )
+            self._version = version
+            self.loads += 1
+            logger.info(f"Loaded reference data version {version}: {len(self._ttrpg_types)} TTRPG types, {len(self._prep_messages)} prep messages")
+            return self._ttrpg_types, self._prep_messages, self._templates
+
+    def ttrpg_types(self):
+        """All TTRPG types, by id."""
+        return list(self._load()[0].values())
+
+    def ttrpg_type(self, ttrpg_type_id):
+        """
+        One TTRPG type, or None. An id missing from this worker's copy may
+        have been added on another worker since the last poll, so a miss
+        checks the version before giving up.
+        """
+        try:
+            ttrpg_type_id = int(ttrpg_type_id)
+        except (TypeError, ValueError):
+            return None
+        ttrpg_type = self._load()[0].get(ttrpg_type_id)
+        if ttrpg_type is None:
+            ttrpg_type = self._load(check_version=True)[0].get(ttrpg_type_id)
+        return ttrpg_type
+
+    def sheet_template(self, ttrpg_type_id, version):
+        """
+        The TTRPG type with this id if its html_template still has this
+        template_version, or None. Types with identical templates share a
+        version, so the id is part of the key.
+        """
+        try:
+            return self._load()[2].get((int(ttrpg_type_id), version))
+        except (TypeError, ValueError):
+            return None
+
+    def prep_messages(self):
+        """The Gemini prep messages, by priority."""
+        return list(self._load()[1])
+
+    def commit(self):
+        """
+        Commits the session's changes to TTRPGType or GeminiPrepMessage
+        together with a version bump, which tells the other workers to
+        reload, and drops this worker's copy.
+        """
+        bump_version(VERSION_NAME)
+        db.session.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        """Drops this worker's copy; the next read reloads it."""
+        with self._lock:
+            self._ttrpg_types = None
+            self._prep_messages = None
+            self._templates = None
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'loads': self.loads,
+                'version_checks': self.version_checks,
+                'poll_seconds': self.poll_seconds,
+            }
+
+reference_data = ReferenceDataCache()
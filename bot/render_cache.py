@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from bot.gemini_utils import process_bot_response, MalformedAppDataError, RENDERER_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+
+def _content_hash(content):
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+class RenderCache:
+    """
+    LRU cache of the HTML rendered for stored messages.
+
+    Stored messages never change, so an entry keyed by character, message
+    id and renderer version stays valid until it is evicted; bumping
+    RENDERER_VERSION makes every older entry unreachable. SQLite reuses the
+    ids of deleted rows, so each entry also records a hash of the content it
+    was rendered from and is only served for a message with that content.
+    Rendering goes
+    through process_bot_response without a character id and therefore never
+    updates a character sheet.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, version=RENDERER_VERSION):
+        self.max_entries = max_entries
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RENDER_CACHE_SIZE', DEFAULT_MAX_ENTRIES)
+
+    def put(self, character_id, message_id, content, rendered):
+        """Stores HTML that was already rendered when the message was written."""
+        key = (character_id, message_id, self.version)
+        with self._lock:
+            self._entries[key] = (_content_hash(content), rendered)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def render(self, message):
+        """Returns the HTML for a stored Message, rendering it on a cache miss."""
+        key = (message.character_id, message.id, self.version)
+        content_hash = _content_hash(message.content)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == content_hash:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        try:
+            rendered = process_bot_response(message.content)
+        except MalformedAppDataError:
+            logger.warning(f"Malformed APPDATA in history for message {message.id}. Displaying raw content.")
+            rendered = message.content.replace('\\n', '<br>')
+
+        self.put(message.character_id, message.id, message.content, rendered)
+        return rendered
+
+    def drop_character(self, character_id):
+        """Drops the entries of a deleted character."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == character_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'renderer_version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+render_cache = RenderCache()
@@ -0,0 +1,71 @@
+import re
+
+TAG_PATTERN = re.compile(r'\[(/?)(APPDATA|CHARACTERSHEET)\]')
+
+class MalformedAppDataError(Exception):
+    pass
+
+class ParsedResponse:
+    """
+    The parts of a bot response.
+
+    Attributes:
+        text: The response with every tagged block removed.
+        character_sheets: The raw JSON strings of all [CHARACTERSHEET] blocks, in order.
+        appdata: The raw JSON strings of all [APPDATA] blocks, in order.
+    """
+    __slots__ = ('text', 'character_sheets', 'appdata')
+
+    def __init__(self, text, character_sheets, appdata):
+        self.text = text
+        self.character_sheets = character_sheets
+        self.appdata = appdata
+
+    @property
+    def has_blocks(self):
+        return bool(self.character_sheets or self.appdata)
+
+def parse_bot_response(bot_response):
+    """
+    Splits a bot response into plain text and tagged blocks in a single scan.
+
+    An [APPDATA] block that is not closed, a stray [/APPDATA] or an [APPDATA]
+    opened inside another one raises MalformedAppDataError. An unterminated
+    [CHARACTERSHEET] tag is kept as plain text.
+    """
+    text_parts = []
+    blocks = {'APPDATA': [], 'CHARACTERSHEET': []}
+    open_tag = None
+    open_end = 0
+    position = 0
+    # A [CHARACTERSHEET] opened after the last closing tag is never closed,
+    # so it is kept as text without scanning the rest for its end.
+    last_sheet_close = bot_response.rfind('[/CHARACTERSHEET]')
+
+    for match in TAG_PATTERN.finditer(bot_response):
+        is_closing, tag = match.group(1), match.group(2)
+        if open_tag is None:
+            if is_closing:
+                if tag == 'APPDATA':
+                    raise MalformedAppDataError("Found [/APPDATA] without a matching [APPDATA].")
+                continue
+            if tag == 'CHARACTERSHEET' and match.start() > last_sheet_close:
+                continue
+            text_parts.append(bot_response[position:match.start()])
+            position = match.start()
+            open_tag = tag
+            open_end = match.end()
+        elif tag == open_tag:
+            if not is_closing:
+                if tag == 'APPDATA':
+                    raise MalformedAppDataError("Found [APPDATA] inside another [APPDATA] block.")
+                continue
+            blocks[tag].append(bot_response[open_end:match.start()])
+            position = match.end()
+            open_tag = None
+
+    if open_tag == 'APPDATA':
+        raise MalformedAppDataError("Mismatched number of [APPDATA] and [/APPDATA] tags.")
+    text_parts.append(bot_response[position:])
+
+    return ParsedResponse(''.join(text_parts), blocks['CHARACTERSHEET'], blocks['APPDATA'])
@@ -0,0 +1,247 @@
+import copy
+import json
+import logging
+from flask import current_app
+from database import db, CharacterSheetHistory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_INTERVAL = 20
+DEFAULT_HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+def json_diff(old, new, path=''):
+    """
+    Returns a JSON Patch (RFC 6902) turning old into new.
+
+    Objects are compared key by key and lists of equal length item by item;
+    any other change replaces the value at its path.
+    """
+    if type(old) is type(new) and isinstance(old, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'remove', 'path': f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': 'add', 'path': f"{path}/{_escape(key)}", 'value': value})
+            else:
+                ops.extend(json_diff(old[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if type(old) is type(new) and isinstance(old, list) and len(old) == len(new):
+        ops = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            ops.extend(json_diff(old_item, new_item, f"{path}/{index}"))
+        return ops
+    if type(old) is type(new) and old == new:
+        return []
+    return [{'op': 'replace', 'path': path, 'value': new}]
+
+def apply_patch(document, patch):
+    """Returns a copy of document with a patch from json_diff applied."""
+    document = copy.deepcopy(document)
+    for op in patch:
+        tokens = [_unescape(token) for token in op['path'].split('/')[1:]]
+        if not tokens:
+            document = copy.deepcopy(op['value'])
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            last = int(last)
+
+        if op['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op['value'])
+    return document
+
+def _snapshot_due(character_id, interval):
+    """Whether the next history row should be a full snapshot."""
+    last_snapshot_id = db.session.query(CharacterSheetHistory.id).filter(
+        CharacterSheetHistory.character_id == character_id,
+        CharacterSheetHistory.is_delta.is_(False)
+    ).order_by(CharacterSheetHistory.id.desc()).limit(1).scalar()
+    if last_snapshot_id is None:
+        return True
+    deltas = CharacterSheetHistory.query.filter(
+        CharacterSheetHistory.character_id == character_id,
+        CharacterSheetHistory.id > last_snapshot_id
+    ).count()
+    return deltas + 1 >= interval
+
+def record_sheet_update(character, sheet_data):
+    """
+    Sets a character's sheet and adds the change to its history.
+
+    An update identical to the current sheet is skipped entirely. Otherwise
+    the history gets a JSON Patch against the previous version, and every
+    SHEET_SNAPSHOT_INTERVAL-th row is a full snapshot so reconstructing a
+    version never applies more than that many patches. The caller commits.
+
+    Returns:
+        True if the sheet changed.
+    """
+    sheet_json = json.dumps(sheet_data)
+    try:
+        previous = json.loads(character.charactersheet)
+    except (TypeError, json.JSONDecodeError):
+        previous = None
+
+    if previous == sheet_data:
+        logger.info(f"Character sheet for character {character.id} is unchanged; skipping history")
+        return False
+
+    interval = current_app.config.get('SHEET_SNAPSHOT_INTERVAL', DEFAULT_SNAPSHOT_INTERVAL)
+    if previous is None or _snapshot_due(character.id, interval):
+        record = CharacterSheetHistory(character_id=character.id, sheet_data=sheet_json, is_delta=False)
+    else:
+        patch = json_diff(previous, sheet_data)
+        record = CharacterSheetHistory(character_id=character.id, sheet_data=json.dumps(patch), is_delta=True)
+
+    character.charactersheet = sheet_json
+    db.session.add(record)
+    return True
+
+def sheet_history_versions(character_id):
+    """
+    Reconstructs every stored version of a character's sheet.
+
+    Returns:
+        A list of (CharacterSheetHistory, sheet dict) pairs, oldest first.
+        A row that can't be decoded is logged and skipped; the deltas after
+        it are skipped too, up to the next snapshot.
+    """
+    records = CharacterSheetHistory.query.filter_by(character_id=character_id).order_by(CharacterSheetHistory.id).all()
+
+    versions = []
+    current = None
+    for record in records:
+        try:
+            data = json.loads(record.sheet_data)
+            if not record.is_delta:
+                current = data
+            elif current is not None:
+                current = apply_patch(current, data)
+            else:
+                continue
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError, TypeError):
+            logger.error(f"Could not decode character sheet history for character {character_id}, record {record.id}")
+            current = None
+            continue
+        versions.append((record, current))
+    return versions
+
+def sheet_version(character_id, history_id):
+    """
+    Reconstructs the sheet as of one history row.
+
+    Loads the closest snapshot at or before the row and applies the deltas
+    after it, so at most SHEET_SNAPSHOT_INTERVAL rows are read.
+
+    Returns:
+        The (CharacterSheetHistory, sheet dict) pair, or None if the row
+        doesn't belong to the character or can't be reconstructed.
+    """
+    snapshot_id = db.session.query(CharacterSheetHistory.id).filter(
+        CharacterSheetHistory.character_id == character_id,
+        CharacterSheetHistory.id <= history_id,
+        CharacterSheetHistory.is_delta.is_(False)
+    ).order_by(CharacterSheetHistory.id.desc()).limit(1).scalar()
+    if snapshot_id is None:
+        return None
+
+    records = CharacterSheetHistory.query.filter(
+        CharacterSheetHistory.character_id == character_id,
+        CharacterSheetHistory.id >= snapshot_id,
+        CharacterSheetHistory.id <= history_id
+    ).order_by(CharacterSheetHistory.id).all()
+    if not records or records[-1].id != history_id:
+        return None
+
+    try:
+        sheet = json.loads(records[0].sheet_data)
+        for record in records[1:]:
+            sheet = apply_patch(sheet, json.loads(record.sheet_data))
+    except (json.JSONDecodeError, KeyError, IndexError, ValueError, TypeError):
+        logger.error(f"Could not reconstruct character sheet history record {history_id} for character {character_id}")
+        return None
+    return records[-1], sheet
+
+def sheet_history_page(character_id, before_id=None, limit=DEFAULT_HISTORY_PAGE_SIZE):
+    """
+    Returns one page of a character's sheet versions, newest first, as the
+    changes each version made to the one before it.
+
+    Delta rows already store exactly that. A snapshot row is diffed against
+    the previous version, which is reconstructed only when it is itself a
+    delta. The first version of a sheet has no changes ('initial': True);
+    full sheets are loaded with sheet_version().
+
+    Returns:
+        A dict with the versions ({'id', 'timestamp', 'initial', 'changes'}),
+        the cursor for the next (older) page, whether it exists and the
+        total number of versions.
+    """
+    try:
+        limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = DEFAULT_HISTORY_PAGE_SIZE
+    if before_id is not None:
+        # An invalid cursor from the client loads the newest page.
+        try:
+            before_id = int(before_id)
+        except (TypeError, ValueError):
+            before_id = None
+    query = CharacterSheetHistory.query.filter(CharacterSheetHistory.character_id == character_id)
+    count = query.count()
+    if before_id is not None:
+        query = query.filter(CharacterSheetHistory.id < before_id)
+    # One extra row tells whether there is an older page and is also the
+    # version before the oldest one on this page.
+    records = query.order_by(CharacterSheetHistory.id.desc()).limit(limit + 1).all()
+    has_more = len(records) > limit
+    page, older = records[:limit], records[limit:limit + 1]
+    chain = page + older
+
+    versions = []
+    for index, record in enumerate(page):
+        previous = chain[index + 1] if index + 1 < len(chain) else None
+        try:
+            if record.is_delta:
+                changes = json.loads(record.sheet_data)
+            elif previous is None:
+                changes = None
+            else:
+                if previous.is_delta:
+                    reconstructed = sheet_version(character_id, previous.id)
+                    previous_sheet = reconstructed[1] if reconstructed else None
+                else:
+                    previous_sheet = json.loads(previous.sheet_data)
+                changes = json_diff(previous_sheet, json.loads(record.sheet_data)) if previous_sheet is not None else None
+        except json.JSONDecodeError:
+            logger.error(f"Could not decode character sheet history for character {character_id}, record {record.id}")
+            continue
+
+        versions.append({
+            'id': record.id,
+            'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S') + ' UTC',
+            'initial': previous is None,
+            'changes': changes,
+        })
+
+    return {
+        'versions': versions,
+        'before_id': page[-1].id if has_more else None,
+        'has_more': has_more,
+        'count': count,
+    }
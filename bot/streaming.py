@@ -0,0 +1,65 @@
+BLOCK_TAGS = ('APPDATA', 'CHARACTERSHEET')
+
+class StreamTagBuffer:
+    """
+    Turns streamed Gemini text into display segments.
+
+    Plain text is passed through as soon as it arrives. Tagged blocks such as
+    [APPDATA]...[/APPDATA] are held back until their closing tag has been
+    received and are then handed to render_block as a whole, so the client
+    never sees half a block or raw JSON.
+    """
+
+    def __init__(self, render_block):
+        self.render_block = render_block
+        self._pending = ''
+        self._open_tag = None
+
+    def feed(self, text):
+        """Adds streamed text and returns the segments that are ready for display."""
+        self._pending += text
+        segments = []
+        while self._pending:
+            if self._open_tag:
+                closing_tag = f'[/{self._open_tag}]'
+                end = self._pending.find(closing_tag)
+                if end == -1:
+                    break
+                end += len(closing_tag)
+                block = self._pending[:end]
+                self._pending = self._pending[end:]
+                rendered = self.render_block(self._open_tag, block)
+                self._open_tag = None
+                if rendered:
+                    segments.append(rendered)
+                continue
+
+            start = self._pending.find('[')
+            if start == -1:
+                segments.append(_render_text(self._pending))
+                self._pending = ''
+                break
+            if start > 0:
+                segments.append(_render_text(self._pending[:start]))
+                self._pending = self._pending[start:]
+
+            opened = next((tag for tag in BLOCK_TAGS if self._pending.startswith(f'[{tag}]')), None)
+            if opened:
+                self._open_tag = opened
+                continue
+            if any(f'[{tag}]'.startswith(self._pending) for tag in BLOCK_TAGS):
+                # Could still become an opening tag once more text arrives.
+                break
+            segments.append('[')
+            self._pending = self._pending[1:]
+        return segments
+
+    def flush(self):
+        """Returns whatever plain text is left at the end of the stream. Unclosed blocks are dropped."""
+        remaining = '' if self._open_tag else _render_text(self._pending)
+        self._pending = ''
+        self._open_tag = None
+        return remaining
+
+def _render_text(text):
+    return text.replace('\\n', '<br>')
@@ -0,0 +1,83 @@
+import hashlib
+import logging
+from sqlalchemy.exc import IntegrityError
+from database import db, SystemPrompt
+from bot.model_registry import model_registry
+from bot.reference_data import reference_data
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_NAME_PLACEHOLDER = '[DB.CHARACTER.NAME]'
+# First user turn when no prep message names the character.
+DEFAULT_KICKOFF = "Let's begin."
+
+def render_preamble(character, prep_messages=None):
+    """
+    Renders the prep messages for a character.
+
+    Messages that don't mention the character only depend on the prep
+    messages and the TTRPG type, so they form the system instruction shared
+    by every character of that type. Messages that name the character (e.g.
+    "The player has chosen [DB.CHARACTER.NAME]...") become the first user
+    turn that starts the conversation.
+
+    Returns:
+        A tuple of the system instruction and the kickoff message.
+
+    Raises:
+        ValueError: If the character's TTRPG type does not exist.
+    """
+    if prep_messages is None:
+        prep_messages = reference_data.prep_messages()
+    ttrpg_type = reference_data.ttrpg_type(character.ttrpg_type_id)
+    if ttrpg_type is None:
+        raise ValueError(f"TTRPG type not found: {character.ttrpg_type_id}")
+
+    system_parts = []
+    kickoff_parts = []
+    for prep_msg in prep_messages:
+        msg = prep_msg.message.replace('[DB.TTRPG.Name]', ttrpg_type.name).replace('[DB.TTRPG.JSON]', ttrpg_type.json_template)
+        if CHARACTER_NAME_PLACEHOLDER in msg:
+            kickoff_parts.append(msg.replace(CHARACTER_NAME_PLACEHOLDER, character.character_name))
+        else:
+            system_parts.append(msg)
+    return "\n\n".join(system_parts), "\n\n".join(kickoff_parts) or DEFAULT_KICKOFF
+
+def get_or_create_system_prompt(content, ttrpg_type_id=None):
+    """Returns the SystemPrompt with this exact content, storing it first if it is new."""
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    prompt = SystemPrompt.query.filter_by(content_hash=content_hash).first()
+    if prompt is not None:
+        return prompt
+
+    prompt = SystemPrompt(content_hash=content_hash, content=content, ttrpg_type_id=ttrpg_type_id)
+    db.session.add(prompt)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored the same version first.
+        db.session.rollback()
+        prompt = SystemPrompt.query.filter_by(content_hash=content_hash).one()
+    else:
+        logger.info(f"Stored system prompt {prompt.id} ({len(content)} characters) for TTRPG type {ttrpg_type_id}")
+    return prompt
+
+def assign_system_prompt(character):
+    """
+    Points a new character at the current system prompt for its TTRPG type.
+
+    Returns:
+        The kickoff message to send as the character's first user turn.
+    """
+    system_text, kickoff = render_preamble(character)
+    character.system_prompt = get_or_create_system_prompt(system_text, character.ttrpg_type_id)
+    db.session.commit()
+    return kickoff
+
+def system_instruction(character):
+    """The system instruction for a character's model calls, or None for characters started before system prompts."""
+    return character.system_prompt.content if character.system_prompt_id else None
+
+def model_for(character):
+    """The shared GenerativeModel for GEMINI_MODEL with the character's system instruction."""
+    return model_registry.get(system_prompt=character.system_prompt if character.system_prompt_id else None)
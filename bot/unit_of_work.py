@@ -0,0 +1,237 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from flask import current_app
+from database import db, Character, Message
+from bot.sheet_history import record_sheet_update
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1000
+
+_local = threading.local()
+
+def current_turn():
+    """Returns the TurnUnitOfWork active in this greenlet/thread, if any."""
+    return getattr(_local, 'turn', None)
+
+class TurnWriteMetrics:
+    """Counts commits per chat turn and keeps recent write latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.commits = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, turns, commits, latencies):
+        with self._lock:
+            self.turns += turns
+            self.commits += commits
+            self._latencies.extend(latencies)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            turns, commits = self.turns, self.commits
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+        return {
+            'turns': turns,
+            'commits': commits,
+            'commits_per_turn': round(commits / turns, 3) if turns else None,
+            'write_latency_p50_ms': percentile(0.50),
+            'write_latency_p99_ms': percentile(0.99),
+        }
+
+turn_write_metrics = TurnWriteMetrics()
+
+def _apply_writes(writes):
+    """Adds a turn's writes to the session and returns the new Messages, in order."""
+    messages = []
+    for kind, character_id, payload in writes:
+        if kind == 'message':
+            role, content = payload
+            message = Message(character_id=character_id, role=role, content=content)
+            db.session.add(message)
+            messages.append(message)
+        elif kind == 'sheet':
+            character = db.session.get(Character, int(character_id))
+            if character is None:
+                logger.error(f"Character not found when trying to update sheet: {character_id}")
+                continue
+            record_sheet_update(character, payload)
+    return messages
+
+class TurnUnitOfWork:
+    """
+    Collects everything a chat turn writes and stores it in one transaction.
+
+    The user message, the model message, character sheet updates and their
+    history snapshots are recorded in memory while the model is generating
+    and written by a single commit at the end of the turn, so a turn costs
+    one fsync instead of three and no write lock is held during the model
+    call. While a unit of work is active, update_character_sheet records its
+    change here instead of committing, and work that commits on its own,
+    like queueing a job, is deferred with after_commit.
+
+    If the turn fails, e.g. because the model call raised, only the user's
+    messages are stored, as they were before the turn was batched; the
+    model's reply and sheet updates are dropped.
+
+    Usage:
+        with TurnUnitOfWork() as turn:
+            turn.add_message(character_id, 'user', text)
+            ...
+        # turn.message_ids now holds the ids of the stored messages.
+    """
+
+    def __init__(self, committer=None):
+        self.committer = committer
+        self.writes = []
+        self.message_ids = []
+        self._after_commit = []
+
+    def __enter__(self):
+        self._previous = current_turn()
+        _local.turn = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.turn = self._previous
+        if exc_type is None:
+            if self.writes:
+                self.commit()
+            for func, args, kwargs in self._after_commit:
+                func(*args, **kwargs)
+            return False
+
+        self.writes = [write for write in self.writes if write[0] == 'message' and write[2][0] == 'user']
+        if self.writes:
+            try:
+                self.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Could not store the user message of a failed turn")
+        return False
+
+    def add_message(self, character_id, role, content):
+        """Records a message. Returns its position in message_ids after commit."""
+        self.writes.append(('message', character_id, (role, content)))
+        return sum(1 for kind, _, _ in self.writes if kind == 'message') - 1
+
+    def update_sheet(self, character_id, sheet_data):
+        self.writes.append(('sheet', character_id, sheet_data))
+
+    def after_commit(self, func, *args, **kwargs):
+        """Calls func(*args, **kwargs) once the turn has been committed; never if it fails."""
+        self._after_commit.append((func, args, kwargs))
+
+    def commit(self):
+        writes, self.writes = self.writes, []
+        committer = self.committer if self.committer is not None else group_committer
+        if committer.window > 0:
+            self.message_ids = committer.submit(writes)
+            return
+
+        start = time.perf_counter()
+        messages = _apply_writes(writes)
+        db.session.flush()
+        self.message_ids = [message.id for message in messages]
+        db.session.commit()
+        turn_write_metrics.record(1, 1, [time.perf_counter() - start])
+
+class GroupCommitter:
+    """
+    Optionally merges the writes of concurrent turns into shared commits.
+
+    With a window of DB_GROUP_COMMIT_WINDOW_MS > 0, a turn hands its writes
+    to a background writer and waits. The writer collects every turn that
+    arrives within the window and commits them together. If a combined commit
+    fails, each turn is retried on its own so one bad write doesn't fail the
+    others. A window of 0 (the default) commits each turn directly.
+    """
+
+    def __init__(self, window_ms=0, max_batch=64):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._app = None
+
+    def init_app(self, app):
+        self.window = app.config.get('DB_GROUP_COMMIT_WINDOW_MS', 0) / 1000
+        self._app = app
+
+    def submit(self, writes):
+        """Queues a turn's writes and blocks until they are committed; returns the message ids."""
+        request = {'writes': writes, 'done': threading.Event(), 'ids': None, 'error': None,
+                   'submitted': time.perf_counter()}
+        self._ensure_writer()
+        self._queue.put(request)
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['ids']
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._app is None:
+                self._app = current_app._get_current_object()
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        commits = 0
+        try:
+            results = [_apply_writes(request['writes']) for request in batch]
+            db.session.flush()
+            for request, messages in zip(batch, results):
+                request['ids'] = [message.id for message in messages]
+            db.session.commit()
+            commits = 1
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Group commit of {len(batch)} turns failed ({e}). Committing them one by one.")
+            for request in batch:
+                try:
+                    messages = _apply_writes(request['writes'])
+                    db.session.flush()
+                    request['ids'] = [message.id for message in messages]
+                    db.session.commit()
+                    commits += 1
+                except Exception as turn_error:
+                    db.session.rollback()
+                    request['error'] = turn_error
+        finally:
+            db.session.remove()
+
+        now = time.perf_counter()
+        turn_write_metrics.record(len(batch), commits, [now - request['submitted'] for request in batch])
+        for request in batch:
+            request['done'].set()
+
+group_committer = GroupCommitter()
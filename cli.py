@@ -1,6 +1,12 @@
+import time
 import click
 from flask.cli import with_appcontext
-from database import db, TTRPGType, GeminiPrepMessage
+from database import db, TTRPGType, GeminiPrepMessage, Character
+from bot.reference_data import reference_data
+import dice_probability
+import dice_roller
+from dice_rng import create_rng, REPLAYABLE_BACKENDS
+from bot.jobs import job_worker, job_stats, purge_finished, requeue_stale
 
 @click.command("seed-data")
 @with_appcontext
@@ -135,8 +141,92 @@ When the player can select one or more options, up to a maximum number.
         db.session.add(choice_instruction)
         print("Seeded Gemini prep message priority 99.")
 
-    db.session.commit()
+    reference_data.commit()
     print("Database seeded.")
 
+@click.command("dice-odds")
+@click.argument("dice", required=False)
+@click.option("--mechanic", default="Classic", show_default=True, help="Heroic, Classic, High Floor or Percentile.")
+@click.option("--advantage", is_flag=True, help="Roll twice and keep the higher total.")
+@click.option("--disadvantage", is_flag=True, help="Roll twice and keep the lower total.")
+@click.option("--at-least", "at_least", type=int, help="Also print the chance of a total of at least this value.")
+def dice_odds(dice, mechanic, advantage, disadvantage, at_least):
+    """Prints the exact outcome distribution of a roll, e.g. 'flask dice-odds 4d6 --mechanic Heroic'."""
+    try:
+        distribution = dice_probability.distribution(mechanic, dice, advantage, disadvantage)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    for total, probability in distribution.as_dict().items():
+        print(f"{total:>6}  {probability * 100:8.4f}%")
+    print(f"Mean: {distribution.mean():.4f}")
+    if at_least is not None:
+        print(f"P(total >= {at_least}): {distribution.at_least(at_least) * 100:.4f}%")
+
+@click.command("replay-roll")
+@click.argument("character_id", type=int)
+@click.argument("counter", type=int)
+@click.argument("mechanic")
+@click.argument("dice", required=False)
+@click.option("--num-rolls", default=1, show_default=True)
+@click.option("--advantage", is_flag=True)
+@click.option("--disadvantage", is_flag=True)
+@with_appcontext
+def replay_roll(character_id, counter, mechanic, dice, num_rolls, advantage, disadvantage):
+    """Re-derives a logged dice roll from the character's seed and the roll counter."""
+    character = Character.query.get(character_id)
+    if not character or character.dice_seed is None:
+        raise click.ClickException(f"Character {character_id} has not rolled any dice.")
+    if character.dice_rng_backend not in REPLAYABLE_BACKENDS:
+        raise click.ClickException(f"Rolls from the '{character.dice_rng_backend}' backend cannot be replayed.")
+    if counter >= character.dice_roll_counter:
+        raise click.ClickException(f"Character {character_id} has only made {character.dice_roll_counter} rolls.")
+
+    rng = create_rng(character.dice_rng_backend, character.dice_seed, counter)
+    results = dice_roller.roll(mechanic, dice, num_rolls, advantage, disadvantage, rng=rng)
+    for result in results:
+        print(f"Total: {result['total']}, Rolls: {result['rolls']}, Dropped: {result.get('dropped')}")
+
+@click.command("run-jobs")
+@click.option("--workers", type=int, help="Worker greenlets to run (default: JOB_WORKERS, at least 1).")
+@click.option("--once", is_flag=True, help="Run the jobs that are due now and exit.")
+@with_appcontext
+def run_jobs(workers, once):
+    """Processes the background job queue (recaps, context summaries)."""
+    if once:
+        requeue_stale(job_worker.lease_seconds)
+        print(f"Ran {job_worker.run_pending()} jobs.")
+        return
+
+    job_worker.start(workers or max(job_worker.concurrency, 1))
+    print(f"Processing jobs with {job_worker.stats()['workers']} workers. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        job_worker.stop()
+
+@click.command("jobs")
+@click.option("--limit", default=20, show_default=True, help="Number of pending jobs to list.")
+@click.option("--purge-days", type=int, help="Delete finished jobs older than this many days.")
+@with_appcontext
+def jobs(limit, purge_days):
+    """Shows the job queue: counts per status and the next pending jobs."""
+    if purge_days is not None:
+        print(f"Deleted {purge_finished(purge_days)} finished jobs.")
+
+    stats = job_stats(limit)
+    for status, kinds in sorted(stats['counts'].items()):
+        print(f"{status}: " + ", ".join(f"{kind} {count}" for kind, count in sorted(kinds.items())))
+    for job in stats['pending']:
+        line = f"#{job['id']:<6} {job['kind']:<16} priority {job['priority']:<4} attempts {job['attempts']}  due {job['run_after']}"
+        if job['last_error']:
+            line += f"  last error: {job['last_error']}"
+        print(line)
+
 def register_cli_commands(app):
     app.cli.add_command(seed_data)
+    app.cli.add_command(dice_odds)
+    app.cli.add_command(replay_roll)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(jobs)
@@ -28,10 +28,31 @@ class Character(db.Model):
     charactersheet = db.Column(db.Text, nullable=False)
     messages = db.relationship('Message', backref='character', lazy=True, cascade="all, delete-orphan")
     sheet_history = db.relationship('CharacterSheetHistory', backref='character', lazy=True, cascade="all, delete-orphan")
+    session_summaries = db.relationship('SessionSummary', backref='character', lazy=True, cascade="all, delete-orphan")
     recap = db.Column(db.Text, nullable=True)
     last_recap_message_id = db.Column(db.Integer, nullable=True)
+    # Running overview of every closed session, see bot.recap.
+    recap_overview = db.Column(db.Text, nullable=True)
+    recap_overview_message_id = db.Column(db.Integer, nullable=True)
+    # The DM preamble sent as the model's system instruction. Characters
+    # created before it existed have it as their first message instead.
+    system_prompt_id = db.Column(db.Integer, db.ForeignKey('system_prompt.id'), nullable=True)
+    system_prompt = db.relationship('SystemPrompt', lazy=True)
+    context_summary = db.Column(db.Text, nullable=True)
+    context_summary_message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Dice rolls are drawn from a per-character stream; roll n can be replayed
+    # from (dice_rng_backend, dice_seed, n). See dice_rng.
+    dice_seed = db.Column(db.String(32), nullable=True)
+    dice_rng_backend = db.Column(db.String(16), nullable=True)
+    dice_roll_counter = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class Message(db.Model):
+    # Timestamps come from the database clock and tie within a second on
+    # SQLite, so every ordered read uses (timestamp, id) as its sort key.
+    __table_args__ = (
+        db.Index('ix_message_character_id_timestamp_id', 'character_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
     role = db.Column(db.String(80), nullable=False)
@@ -39,11 +60,84 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime(timezone=True), server_default=func.now())
 
 class CharacterSheetHistory(db.Model):
+    __table_args__ = (
+        db.Index('ix_character_sheet_history_character_id_timestamp_id', 'character_id', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
+    # A full sheet, or with is_delta a JSON Patch against the previous row
+    # (by id). See bot.sheet_history.
     sheet_data = db.Column(db.Text, nullable=False)
+    is_delta = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     timestamp = db.Column(db.DateTime(timezone=True), default=datetime.datetime.utcnow)
 
+class SessionSummary(db.Model):
+    """
+    The summary of one play session (messages without a gap of more than an
+    hour). A closed session is summarised once; the open, most recent one is
+    re-summarised when it grows.
+    """
+    __table_args__ = (
+        db.Index('ix_session_summary_character_id_last_message_id', 'character_id', 'last_message_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), nullable=False)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    is_open = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+class Job(db.Model):
+    """
+    A unit of background work, see bot.jobs. Lower priorities run first; a
+    job with a dedupe_key is not queued twice while one is pending.
+    """
+    __table_args__ = (
+        db.Index('ix_job_status_priority_run_after', 'status', 'priority', 'run_after'),
+        db.Index('ix_job_dedupe_key_status', 'dedupe_key', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    dedupe_key = db.Column(db.String(128), nullable=True)
+    priority = db.Column(db.Integer, nullable=False, default=100)
+    # pending, running, done or failed
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False, default=3, server_default='3')
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    locked_by = db.Column(db.String(64), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class SystemPrompt(db.Model):
+    """
+    A rendered DM preamble, stored once per distinct text (see
+    bot.system_prompt). Editing the prep messages creates a new row;
+    existing characters keep the version they started with.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    ttrpg_type_id = db.Column(db.Integer, db.ForeignKey('ttrpg_type.id'), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+class CacheVersion(db.Model):
+    """
+    A counter bumped whenever cached data changes, so every worker process
+    can cheaply tell whether its in-memory copy is stale. See
+    bot.reference_data.
+    """
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 class GeminiPrepMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message = db.Column(db.Text, nullable=False)
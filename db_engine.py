@@ -0,0 +1,229 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Production profile for SQLite, enabled with SQLITE_PRODUCTION_MODE = True
+# in config.py. Off by default so that tools and tests opening the database
+# don't switch it to WAL. Every value can be overridden in config.py.
+SQLITE_DEFAULTS = {
+    'SQLITE_PRODUCTION_MODE': False,
+    # WAL lets readers run while a turn is being written.
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    # In WAL mode NORMAL only syncs at checkpoints; a power loss can drop the
+    # last few commits but never corrupts the database.
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    # How long a writer waits for another writer before "database is locked".
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    # Page cache per connection, in KiB. Every pooled connection has its
+    # own, so a worker can use up to (pool size + overflow) times this:
+    # 8 MiB * 30 = 240 MiB. Pages also stay in the OS cache through mmap.
+    'SQLITE_CACHE_SIZE_KB': 8 * 1024,
+    'SQLITE_POOL_SIZE': 10,
+    'SQLITE_MAX_OVERFLOW': 20,
+}
+
+# Pool settings for the MySQL/MariaDB and PostgreSQL backends.
+SERVER_POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    # Seconds a checkout waits for a free connection before failing.
+    'DB_POOL_TIMEOUT': 30,
+    # Connections are replaced after this many seconds, before MySQL's
+    # wait_timeout or a proxy's idle timeout closes them underneath us.
+    'DB_POOL_RECYCLE': 1800,
+    # Test each connection on checkout and reconnect transparently if the
+    # server dropped it while idle.
+    'DB_POOL_PRE_PING': True,
+    # Reuse the most recently returned connection so surplus connections go
+    # idle and are recycled after a peak.
+    'DB_POOL_USE_LIFO': True,
+}
+
+CHECKOUT_SAMPLES = 1000
+
+def _setting(app, key):
+    defaults = SERVER_POOL_DEFAULTS if key in SERVER_POOL_DEFAULTS else SQLITE_DEFAULTS
+    return app.config.get(key, defaults[key])
+
+def _is_server_backend(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    return uri.startswith(('mysql', 'mariadb', 'postgresql'))
+
+def _is_file_sqlite(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///')
+
+def apply_engine_options(app):
+    """
+    Adds the engine options for the configured backend to the app config:
+    the SQLite production profile, or the pool settings of a MySQL/MariaDB
+    or PostgreSQL server.
+
+    Must run before db.init_app(app). Options already present in
+    SQLALCHEMY_ENGINE_OPTIONS are left alone.
+    """
+    if _is_server_backend(app):
+        _apply_server_pool_options(app)
+        return
+    if not _is_file_sqlite(app) or not _setting(app, 'SQLITE_PRODUCTION_MODE'):
+        return
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    # Under gevent every greenlet runs on the same OS thread, and the pool
+    # hands each request its own connection, so the same-thread check only
+    # gets in the way. The pool is sized for the number of concurrent turns
+    # rather than SQLAlchemy's default of 5.
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('check_same_thread', False)
+    connect_args.setdefault('timeout', _setting(app, 'SQLITE_BUSY_TIMEOUT_MS') / 1000)
+    options.setdefault('poolclass', MeteredQueuePool)
+    options.setdefault('pool_size', _setting(app, 'SQLITE_POOL_SIZE'))
+    options.setdefault('max_overflow', _setting(app, 'SQLITE_MAX_OVERFLOW'))
+
+def _apply_server_pool_options(app):
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('poolclass', MeteredQueuePool)
+    options.setdefault('pool_size', _setting(app, 'DB_POOL_SIZE'))
+    options.setdefault('max_overflow', _setting(app, 'DB_MAX_OVERFLOW'))
+    options.setdefault('pool_timeout', _setting(app, 'DB_POOL_TIMEOUT'))
+    options.setdefault('pool_recycle', _setting(app, 'DB_POOL_RECYCLE'))
+    options.setdefault('pool_pre_ping', _setting(app, 'DB_POOL_PRE_PING'))
+    options.setdefault('pool_use_lifo', _setting(app, 'DB_POOL_USE_LIFO'))
+
+    # PyMySQL is pure Python and cooperates with gevent's patched sockets.
+    # psycopg2 talks to the server from C and blocks the event loop unless
+    # psycogreen installs a gevent wait callback.
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') and _gevent_patched():
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            logger.warning("psycogreen is not installed; PostgreSQL queries will block the gevent event loop.")
+        else:
+            patch_psycopg()
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+class PoolMetrics:
+    """
+    Counts connection pool events and keeps recent checkout waits.
+
+    A checkout's wait is the time spent getting a connection from the pool,
+    including queueing for a free one and opening a new one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._waits = deque(maxlen=CHECKOUT_SAMPLES)
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidations = 0
+        self.timeouts = 0
+
+    def register(self, engine):
+        self._engine = engine
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+
+    def record_checkout(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self._waits.append(wait)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'invalidations': self.invalidations,
+                'checkout_wait_p99_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 2) if waits else None,
+                'checkout_wait_max_ms': round(waits[-1] * 1000, 2) if waits else None,
+            }
+        pool = self._engine.pool if self._engine is not None else None
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'pool_size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+            })
+        return stats
+
+pool_metrics = PoolMetrics()
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that reports how long each checkout waited to pool_metrics."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            pool_metrics.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+def register_pool_metrics(app):
+    """Starts collecting pool_metrics for the app's engine. Must run after db.init_app(app)."""
+    with app.app_context():
+        pool_metrics.register(db.engine)
+
+def register_sqlite_pragmas(app):
+    """
+    Applies the profile's PRAGMAs to every new connection of the app's engine.
+
+    Must run after db.init_app(app).
+    """
+    if not _is_file_sqlite(app) or not _setting(app, 'SQLITE_PRODUCTION_MODE'):
+        return
+
+    pragmas = [
+        f"PRAGMA journal_mode={_setting(app, 'SQLITE_JOURNAL_MODE')}",
+        f"PRAGMA synchronous={_setting(app, 'SQLITE_SYNCHRONOUS')}",
+        f"PRAGMA busy_timeout={int(_setting(app, 'SQLITE_BUSY_TIMEOUT_MS'))}",
+        f"PRAGMA mmap_size={int(_setting(app, 'SQLITE_MMAP_SIZE'))}",
+        f"PRAGMA cache_size=-{int(_setting(app, 'SQLITE_CACHE_SIZE_KB'))}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', set_pragmas)
+    logger.info(f"SQLite production profile enabled: {', '.join(pragmas)}")
@@ -0,0 +1,268 @@
+import functools
+import random
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+# Limits that keep an expression written by the model (or a player) from
+# tying up a worker.
+MAX_DICE_PER_TERM = 1000
+MAX_SIDES = 10_000
+MAX_TERMS = 32
+MAX_EXPLOSIONS_PER_DIE = 100
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<sign>[+-])
+      | (?P<dice>(?P<count>\d*)d(?P<sides>\d+|%)(?P<modifiers>(?:kh\d+|kl\d+|k\d+|dh\d+|dl\d+|!|r\d+)*))
+      | (?P<number>\d+)
+    )\s*
+""", re.VERBOSE | re.IGNORECASE)
+
+_MODIFIER_PATTERN = re.compile(r'(kh|kl|k|dh|dl|r)(\d+)|(!)', re.IGNORECASE)
+
+class DiceTerm:
+    """
+    A group of identical dice, e.g. '4d6kh3', '1d6!' or '2d20r1'.
+
+    Attributes:
+        count: The number of dice rolled.
+        sides: The number of faces on each die.
+        keep: How many dice count towards the total, or None to keep all.
+        keep_highest: Whether the kept dice are the highest (True) or lowest (False).
+        explode: Whether a die showing its highest face adds another die.
+        reroll_at_most: Dice showing this value or lower are rerolled once, or None.
+    """
+    __slots__ = ('count', 'sides', 'keep', 'keep_highest', 'explode', 'reroll_at_most')
+
+    def __init__(self, count, sides, keep=None, keep_highest=True, explode=False, reroll_at_most=None):
+        self.count = count
+        self.sides = sides
+        self.keep = keep
+        self.keep_highest = keep_highest
+        self.explode = explode
+        self.reroll_at_most = reroll_at_most
+
+    @property
+    def is_plain(self) -> bool:
+        """Whether every die is a single independent draw."""
+        return not self.explode and self.reroll_at_most is None
+
+    def roll_faces(self, rng) -> Tuple[List[int], List[int]]:
+        """Rolls the dice, returning the final faces and any rerolled faces."""
+        if self.is_plain:
+            return [rng.randint(1, self.sides) for _ in range(self.count)], []
+
+        faces = []
+        rerolled = []
+        for _ in range(self.count):
+            face = rng.randint(1, self.sides)
+            if self.reroll_at_most is not None and face <= self.reroll_at_most:
+                rerolled.append(face)
+                face = rng.randint(1, self.sides)
+            faces.append(face)
+            explosions = 0
+            while self.explode and face == self.sides and explosions < MAX_EXPLOSIONS_PER_DIE:
+                face = rng.randint(1, self.sides)
+                faces.append(face)
+                explosions += 1
+        return faces, rerolled
+
+    def apply_keep(self, faces: List[int]) -> Tuple[List[int], List[int], int]:
+        """
+        Splits rolled faces into the ones shown and the ones dropped.
+
+        Returns:
+            The faces to show, the dropped faces and the term's total. When
+            dice are kept or dropped the shown faces are sorted highest first.
+        """
+        if self.keep is None:
+            return faces, [], sum(faces)
+        ordered = sorted(faces, reverse=True)
+        if self.keep_highest:
+            kept, dropped = ordered[:self.keep], ordered[self.keep:]
+        else:
+            kept, dropped = ordered[len(ordered) - self.keep:], ordered[:len(ordered) - self.keep]
+        return ordered, dropped, sum(kept)
+
+    def __repr__(self):
+        return (f"DiceTerm(count={self.count}, sides={self.sides}, keep={self.keep}, "
+                f"keep_highest={self.keep_highest}, explode={self.explode}, "
+                f"reroll_at_most={self.reroll_at_most})")
+
+class CompiledExpression:
+    """
+    A parsed dice expression such as '2d6+1d4+3' or '4d6kh3'.
+
+    Instances are immutable and shared through compile_expression's cache,
+    so an expression is parsed once no matter how often it is rolled.
+
+    Attributes:
+        source: The expression as it was written.
+        terms: A tuple of (sign, DiceTerm) pairs, sign being 1 or -1.
+        constant: The sum of the expression's plain numbers.
+    """
+    __slots__ = ('source', 'terms', 'constant')
+
+    def __init__(self, source, terms, constant):
+        self.source = source
+        self.terms = terms
+        self.constant = constant
+
+    def simple_form(self) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns (number of dice, sides, modifier) for an expression of the
+        form 'NdM+K', or None for anything more involved.
+        """
+        if len(self.terms) != 1:
+            return None
+        sign, term = self.terms[0]
+        if sign != 1 or term.keep is not None or not term.is_plain:
+            return None
+        return term.count, term.sides, self.constant
+
+    def evaluate(self, rng=None) -> Dict[str, Any]:
+        """
+        Rolls the expression once.
+
+        Args:
+            rng: An object with randint() and choices(), like the random module
+                 or a random.Random instance. Defaults to the random module.
+
+        Returns:
+            A dictionary with the total, the rolled faces and the dropped faces.
+        """
+        rng = rng or random
+        total = self.constant
+        rolls = []
+        dropped = []
+        for sign, term in self.terms:
+            faces, rerolled = term.roll_faces(rng)
+            shown, term_dropped, term_total = term.apply_keep(faces)
+            total += sign * term_total
+            rolls.extend(shown)
+            dropped.extend(rerolled)
+            dropped.extend(term_dropped)
+        return {
+            "total": total,
+            "rolls": rolls,
+            "dropped": dropped
+        }
+
+    def evaluate_many(self, num_rolls: int, rng=None) -> List[Dict[str, Any]]:
+        """
+        Rolls the expression num_rolls times.
+
+        Each plain dice term draws the faces for all rolls in a single
+        choices() call; terms with exploding dice or rerolls fall back to one
+        draw per die.
+        """
+        rng = rng or random
+        results = [{"total": self.constant, "rolls": [], "dropped": []} for _ in range(num_rolls)]
+        for sign, term in self.terms:
+            if term.is_plain:
+                faces = rng.choices(range(1, term.sides + 1), k=term.count * num_rolls)
+                per_roll = ((faces[i * term.count:(i + 1) * term.count], []) for i in range(num_rolls))
+            else:
+                per_roll = (term.roll_faces(rng) for _ in range(num_rolls))
+            for result, (term_faces, rerolled) in zip(results, per_roll):
+                shown, term_dropped, term_total = term.apply_keep(term_faces)
+                result["total"] += sign * term_total
+                result["rolls"].extend(shown)
+                result["dropped"].extend(rerolled)
+                result["dropped"].extend(term_dropped)
+        return results
+
+    def __repr__(self):
+        return f"CompiledExpression({self.source!r})"
+
+def _parse_term(match) -> DiceTerm:
+    count = int(match.group('count')) if match.group('count') else 1
+    sides = 100 if match.group('sides') == '%' else int(match.group('sides'))
+    if count <= 0 or sides <= 0:
+        raise ValueError("Number of dice and sides must be positive.")
+    if count > MAX_DICE_PER_TERM:
+        raise ValueError(f"At most {MAX_DICE_PER_TERM} dice can be rolled at once.")
+    if sides > MAX_SIDES:
+        raise ValueError(f"Dice can have at most {MAX_SIDES} sides.")
+
+    term = DiceTerm(count, sides)
+    seen = set()
+    for modifier in _MODIFIER_PATTERN.finditer(match.group('modifiers')):
+        name = (modifier.group(1) or modifier.group(3)).lower()
+        kind = 'keep' if name in ('kh', 'kl', 'k', 'dh', 'dl') else name
+        if kind in seen:
+            raise ValueError(f"Modifier '{name}' is used more than once in '{match.group('dice')}'.")
+        seen.add(kind)
+
+        if name == '!':
+            if sides == 1:
+                raise ValueError("A one-sided die cannot explode.")
+            term.explode = True
+        elif name == 'r':
+            value = int(modifier.group(2))
+            if value >= sides:
+                raise ValueError(f"Cannot reroll every face of a d{sides}.")
+            term.reroll_at_most = value
+        else:
+            value = int(modifier.group(2))
+            if value > count:
+                raise ValueError(f"Cannot keep or drop {value} of {count} dice.")
+            if name in ('kh', 'k', 'kl'):
+                term.keep = value
+                term.keep_highest = name != 'kl'
+            else:
+                term.keep = count - value
+                term.keep_highest = name == 'dl'
+    return term
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> CompiledExpression:
+    """
+    Parses a dice expression into a CompiledExpression.
+
+    The grammar is a sum of terms, each a constant or a dice group
+    'NdM' (or 'd%' for a percentile die) with optional modifiers:
+    'khN'/'kN' and 'klN' keep the highest/lowest N dice, 'dlN' and 'dhN'
+    drop the lowest/highest N, '!' explodes dice that show their highest
+    face and 'rN' rerolls once any die showing N or less. The whole string
+    must match; trailing text is an error.
+
+    Raises:
+        ValueError: If the expression is not valid.
+    """
+    if not isinstance(expression, str):
+        raise TypeError("dice expression must be a string.")
+
+    terms = []
+    constant = 0
+    sign = None
+    expects_term = True
+    position = 0
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Invalid dice string format: {expression}")
+        position = match.end()
+
+        if match.group('sign'):
+            if sign is not None:
+                raise ValueError(f"Invalid dice string format: {expression}")
+            sign = -1 if match.group('sign') == '-' else 1
+            expects_term = True
+            continue
+        if not expects_term:
+            raise ValueError(f"Invalid dice string format: {expression}")
+
+        term_sign = sign or 1
+        sign = None
+        expects_term = False
+        if match.group('dice'):
+            terms.append((term_sign, _parse_term(match)))
+            if len(terms) > MAX_TERMS:
+                raise ValueError(f"Dice expressions can have at most {MAX_TERMS} dice groups.")
+        else:
+            constant += term_sign * int(match.group('number'))
+
+    if expects_term or not terms:
+        raise ValueError(f"Invalid dice string format: {expression}")
+    return CompiledExpression(expression, tuple(terms), constant)
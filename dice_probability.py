@@ -0,0 +1,245 @@
+import functools
+import math
+from typing import Dict, Tuple
+from dice_expression import CompiledExpression, DiceTerm
+from dice_roller import MECHANICS
+
+# Upper bounds on the work a distribution may take, so a request like
+# '1000d100' cannot tie up a worker. Summing n dice of s sides builds a
+# table of about n * s totals whose counts grow to about n * log2(s) bits,
+# so the work grows with n * n * s; dropping the lowest die repeats that
+# for each of the s possible lowest values, and keeping k dice tracks the
+# kept total for every face and number of dice placed (n * n * s * s * k).
+# Each limit allows about a quarter of a second, e.g. 50d100, Heroic
+# 20d100 and 20d40kh10; the terms of an expression share the budget.
+MAX_SUM_COST = 500_000
+MAX_DROP_LOWEST_COST = 5_000_000
+MAX_KEEP_COST = 8_000_000
+
+# Counts of large rolls are big tables of big integers; keep only a few.
+CACHE_SIZE = 64
+
+class Distribution:
+    """
+    The exact outcome distribution of a roll.
+
+    counts[i] is the number of equally likely dice outcomes whose total is
+    offset + i; total_outcomes is their sum.
+    """
+
+    def __init__(self, offset: int, counts: Tuple[int, ...]):
+        self.offset = offset
+        self.counts = counts
+        self.total_outcomes = sum(counts)
+
+    @property
+    def min_total(self) -> int:
+        return self.offset
+
+    @property
+    def max_total(self) -> int:
+        return self.offset + len(self.counts) - 1
+
+    def probability(self, value: int) -> float:
+        index = value - self.offset
+        if 0 <= index < len(self.counts):
+            return self.counts[index] / self.total_outcomes
+        return 0.0
+
+    def at_least(self, value: int) -> float:
+        index = max(value - self.offset, 0)
+        return sum(self.counts[index:]) / self.total_outcomes
+
+    def at_most(self, value: int) -> float:
+        index = value - self.offset + 1
+        if index <= 0:
+            return 0.0
+        return sum(self.counts[:index]) / self.total_outcomes
+
+    def mean(self) -> float:
+        return sum((self.offset + i) * count for i, count in enumerate(self.counts)) / self.total_outcomes
+
+    def as_dict(self) -> Dict[int, float]:
+        return {self.offset + i: count / self.total_outcomes for i, count in enumerate(self.counts) if count}
+
+def _convolve(a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+    """
+    Multiplies two count polynomials.
+
+    Uses Kronecker substitution: both coefficient lists are packed into one
+    big integer each, with slots wide enough that no product coefficient can
+    overflow into its neighbour, so the multiplication runs in CPython's
+    big-integer arithmetic instead of a Python double loop.
+    """
+    width = ((sum(a) * sum(b)).bit_length() + 8) // 8
+    packed_a = int.from_bytes(b''.join(c.to_bytes(width, 'little') for c in a), 'little')
+    packed_b = int.from_bytes(b''.join(c.to_bytes(width, 'little') for c in b), 'little')
+    length = len(a) + len(b) - 1
+    raw = (packed_a * packed_b).to_bytes(length * width, 'little')
+    return tuple(int.from_bytes(raw[i * width:(i + 1) * width], 'little') for i in range(length))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _sum_counts(num_dice: int, num_faces: int) -> Tuple[int, ...]:
+    """Counts for the sum of num_dice dice with faces 0..num_faces-1, by memoized squaring."""
+    if num_dice == 1:
+        return (1,) * num_faces
+    half = _sum_counts(num_dice // 2, num_faces)
+    counts = _convolve(half, half)
+    if num_dice % 2:
+        counts = _convolve(counts, _sum_counts(1, num_faces))
+    return counts
+
+def _drop_lowest_counts(num_dice: int, num_sides: int) -> Tuple[int, ...]:
+    """
+    Counts for the sum of num_dice dice after dropping the lowest one,
+    starting at a total of num_dice - 1.
+
+    Sequences whose lowest die is exactly m are those with every die >= m
+    minus those with every die >= m + 1; their kept total is the sum minus m.
+    """
+    if num_dice == 1:
+        return (num_sides,)
+
+    kept = [0] * ((num_dice - 1) * (num_sides - 1) + 1)
+    for lowest in range(1, num_sides + 1):
+        faces = num_sides - lowest + 1
+        at_least = _sum_counts(num_dice, faces)
+        above = _sum_counts(num_dice, faces - 1) if faces > 1 else ()
+        # Both count sums of dice shifted down to start at 0; with every die
+        # >= lowest, index i is a raw sum of num_dice * lowest + i.
+        for i, count in enumerate(at_least):
+            exact = count - (above[i - num_dice] if 0 <= i - num_dice < len(above) else 0)
+            if exact:
+                kept_total = num_dice * lowest + i - lowest
+                kept[kept_total - (num_dice - 1)] += exact
+    return tuple(kept)
+
+def _keep_highest_counts(num_dice: int, num_sides: int, keep: int) -> Tuple[int, ...]:
+    """
+    Counts for the sum of the keep highest of num_dice dice, starting at a
+    total of keep.
+
+    Goes through the faces from the highest down, tracking how many dice
+    show a higher face and the total of the kept ones among them: c of the
+    remaining dice showing face v can sit in comb(remaining, c) positions,
+    and as many of them are kept as there are kept places left.
+    """
+    # states[j][t]: sequences with j dice placed and a kept total of t.
+    states = {0: [1]}
+    for face in range(num_sides, 0, -1):
+        next_states = {}
+        for placed, totals in states.items():
+            remaining = num_dice - placed
+            # Below the last face every remaining die must show it.
+            for count in ([remaining] if face == 1 else range(remaining + 1)):
+                ways = math.comb(remaining, count)
+                added = min(count, max(keep - placed, 0)) * face
+                target = next_states.setdefault(placed + count, [])
+                if len(target) < len(totals) + added:
+                    target.extend([0] * (len(totals) + added - len(target)))
+                for total, value in enumerate(totals):
+                    if value:
+                        target[total + added] += value * ways
+        states = next_states
+    return tuple(states[num_dice][keep:])
+
+def _term_counts(term: DiceTerm) -> Tuple[int, Tuple[int, ...]]:
+    """The lowest total of a dice term and the counts of its totals from there."""
+    keep = term.count if term.keep is None else term.keep
+    if keep == term.count:
+        return term.count, _sum_counts(term.count, term.sides)
+    if keep == term.count - 1:
+        counts = _drop_lowest_counts(term.count, term.sides)
+    else:
+        counts = _keep_highest_counts(term.count, term.sides, keep)
+    # The lowest k faces of a roll are k * (sides + 1) minus the highest k
+    # of the mirrored roll, which is equally likely: the counts reverse.
+    return keep, counts if term.keep_highest else counts[::-1]
+
+def _term_cost(term: DiceTerm) -> float:
+    """The work a term takes, as a share of the budget of one distribution."""
+    if not term.is_plain:
+        raise ValueError("Exact odds are not available for exploding (!) or rerolled (rN) dice.")
+    base = term.count * term.count * term.sides
+    keep = term.count if term.keep is None else term.keep
+    if keep == term.count:
+        return base / MAX_SUM_COST
+    if keep == term.count - 1:
+        return base * term.sides / MAX_DROP_LOWEST_COST
+    return base * term.sides * keep / MAX_KEEP_COST
+
+def _expression_distribution(expression: CompiledExpression) -> Distribution:
+    offset, counts = expression.constant, (1,)
+    for sign, term in expression.terms:
+        term_offset, term_counts = _term_counts(term)
+        if sign < 0:
+            term_offset, term_counts = -(term_offset + len(term_counts) - 1), term_counts[::-1]
+        offset += term_offset
+        counts = _convolve(counts, term_counts)
+    return Distribution(offset, counts)
+
+def _best_of_two(distribution: Distribution, highest: bool) -> Distribution:
+    """Distribution of the higher (or lower) total of two independent rolls."""
+    counts = distribution.counts if highest else distribution.counts[::-1]
+    combined = []
+    cumulative = 0
+    for count in counts:
+        previous = cumulative
+        cumulative += count
+        combined.append(cumulative * cumulative - previous * previous)
+    if not highest:
+        combined.reverse()
+    return Distribution(distribution.offset, tuple(combined))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def distribution(mechanic: str, dice: str = None, advantage: bool = False, disadvantage: bool = False) -> Distribution:
+    """
+    Computes the exact distribution of the total of one roll.
+
+    Takes the same arguments as dice_roller.roll() for a single roll and
+    supports the built-in mechanics.
+
+    Args:
+        mechanic: 'Heroic', 'Classic', 'High Floor' or 'Percentile'.
+        dice: The dice string (e.g., '4d6'). Required for 'Heroic' and 'Classic'.
+        advantage: Whether the roll is made with advantage.
+        disadvantage: Whether the roll is made with disadvantage.
+
+    Returns:
+        A Distribution over the roll's total.
+    """
+    if mechanic not in MECHANICS:
+        raise ValueError(f"Unknown mechanic: {mechanic}")
+    if mechanic in ["Heroic", "Classic"] and not dice:
+        raise ValueError(f"Mechanic '{mechanic}' requires a 'dice' string.")
+
+    expression = MECHANICS[mechanic](dice)
+    if sum(_term_cost(term) for _, term in expression.terms) > 1:
+        raise ValueError(f"Dice string '{dice}' is too large to compute exact odds for.")
+    result = _expression_distribution(expression)
+
+    if advantage != disadvantage:
+        result = _best_of_two(result, highest=advantage)
+    return result
+
+def odds(mechanic: str, dice: str = None, advantage: bool = False, disadvantage: bool = False, target=None) -> dict:
+    """
+    Summarises the distribution of one roll for a client.
+
+    Returns the probability of each total, the range and the mean, and with
+    a target also the chance of rolling at least that total. Raises
+    ValueError or TypeError for an invalid roll or target.
+    """
+    if target is not None:
+        target = int(target)
+    result = distribution(mechanic, dice, advantage, disadvantage)
+    summary = {
+        'distribution': result.as_dict(),
+        'min': result.min_total,
+        'max': result.max_total,
+        'mean': result.mean(),
+    }
+    if target is not None:
+        summary['target'] = target
+        summary['at_least'] = result.at_least(target)
+    return summary
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import queue
+import random
+import secrets
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'random'
+DEFAULT_BUFFER_SIZE = 8
+DEFAULT_MAX_CHARACTERS = 256
+
+def derive_seed(seed: str, counter: int) -> int:
+    """The 128-bit seed of roll number counter in the stream identified by seed."""
+    digest = hashlib.sha256(f"{seed}:{counter}".encode()).digest()
+    return int.from_bytes(digest[:16], 'big')
+
+class NumpyRandom:
+    """
+    Adapts a NumPy PCG64 Generator to the randint()/choices() interface the
+    dice expressions use. Bulk draws come back from a single vectorised call.
+    """
+
+    def __init__(self, seed):
+        self._generator = numpy.random.Generator(numpy.random.PCG64(seed))
+
+    def randint(self, a, b):
+        return int(self._generator.integers(a, b, endpoint=True))
+
+    def choices(self, population, k=1):
+        if isinstance(population, range) and population.step == 1:
+            return self._generator.integers(population.start, population.stop, size=k).tolist()
+        return [population[i] for i in self._generator.integers(0, len(population), size=k).tolist()]
+
+def _random_backend(seed, counter):
+    return random.Random(derive_seed(seed, counter))
+
+def _numpy_backend(seed, counter):
+    return NumpyRandom(derive_seed(seed, counter))
+
+_system_random = secrets.SystemRandom()
+
+def _system_backend(seed, counter):
+    return _system_random
+
+# Each backend turns (seed, counter) into the generator for that roll. The
+# 'system' backend draws from the operating system and cannot be replayed.
+BACKENDS = {
+    'random': _random_backend,
+    'system': _system_backend,
+}
+if numpy is not None:
+    BACKENDS['numpy'] = _numpy_backend
+
+REPLAYABLE_BACKENDS = ('random', 'numpy')
+
+def create_rng(backend: str, seed: str, counter: int):
+    """
+    Returns the generator for roll number counter of a stream.
+
+    The same (backend, seed, counter) always gives a generator producing the
+    same draws, so a logged roll can be re-derived later.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown or unavailable dice RNG backend: {backend}")
+    return BACKENDS[backend](seed, counter)
+
+def new_seed() -> str:
+    return secrets.token_hex(16)
+
+class DiceRNG:
+    """
+    Hands out per-character dice generators.
+
+    Every character has its own seed and roll counter; roll number n is
+    drawn from a generator seeded with a hash of (seed, n), so any roll can
+    be replayed from the logged pair without replaying the rolls before it.
+    Generators for the next few counters are created ahead of time by a
+    single long-lived refill thread so an interactive roll doesn't pay the
+    setup cost.
+    """
+
+    def __init__(self, backend=DEFAULT_BACKEND, buffer_size=DEFAULT_BUFFER_SIZE, max_characters=DEFAULT_MAX_CHARACTERS):
+        self.backend = backend
+        self.buffer_size = buffer_size
+        self.max_characters = max_characters
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self._refills = queue.Queue()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        backend = app.config.get('DICE_RNG_BACKEND', DEFAULT_BACKEND)
+        if backend not in BACKENDS:
+            logger.warning(f"Dice RNG backend '{backend}' is not available. Falling back to '{DEFAULT_BACKEND}'.")
+            backend = DEFAULT_BACKEND
+        self.backend = backend
+        self.buffer_size = app.config.get('DICE_RNG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+
+    def get(self, character_id, backend, seed, counter):
+        """
+        Returns the generator for one roll, from the buffer when it was
+        prepared in advance, and schedules a refill.
+        """
+        key = (int(character_id), backend, seed)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            rng = buffer.pop(counter, None) if buffer is not None else None
+            if rng is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if rng is None:
+            rng = create_rng(backend, seed, counter)
+        if backend in REPLAYABLE_BACKENDS and self.buffer_size > 0:
+            self._schedule_refill(key, counter + 1)
+        return rng
+
+    def _schedule_refill(self, key, next_counter):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._refill_forever, name='dice-rng-refill', daemon=True)
+                self._worker.start()
+        self._refills.put((key, next_counter))
+
+    def _refill_forever(self):
+        while True:
+            key, next_counter = self._refills.get()
+            try:
+                self._refill(key, next_counter)
+            except Exception:
+                logger.exception(f"Could not prepare dice generators for {key}")
+            finally:
+                self._refills.task_done()
+
+    def _refill(self, key, next_counter):
+        _, backend, seed = key
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = {}
+                self._buffers[key] = buffer
+                while len(self._buffers) > self.max_characters:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(key)
+            # Counters behind the next roll can never be asked for again.
+            for counter in [c for c in buffer if c < next_counter]:
+                del buffer[counter]
+            missing = [c for c in range(next_counter, next_counter + self.buffer_size) if c not in buffer]
+
+        prepared = {counter: create_rng(backend, seed, counter) for counter in missing}
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is not None:
+                for counter, rng in prepared.items():
+                    buffer.setdefault(counter, rng)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'buffered_characters': len(self._buffers),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+dice_rng = DiceRNG()
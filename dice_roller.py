@@ -1,99 +1,101 @@
-import random
-import re
+import functools
 from typing import List, Dict, Any, Tuple
+from dice_expression import CompiledExpression, DiceTerm, compile_expression
+
+@functools.lru_cache(maxsize=256)
+def _parse_dice(dice_string: str) -> Tuple[int, int, int]:
+    """
+    Parses a dice string like '4d6' or '2d10+5'.
+
+    Returns:
+        A tuple of the number of dice, the number of sides and the modifier.
+    """
+    simple = compile_expression(dice_string).simple_form()
+    if simple is None:
+        raise ValueError(f"Dice string '{dice_string}' is not of the form 'NdM+K'.")
+    return simple
 
 def roll_dice(dice_string: str) -> Tuple[List[int], int]:
     """
-    Rolls dice based on a string like '4d6' or 'd20'.
+    Rolls dice based on an expression like '4d6', 'd20' or '2d6+1d4+3'.
+
+    See dice_expression.compile_expression for the full grammar.
 
     Args:
         dice_string: The string representing the dice to roll.
 
     Returns:
-        A tuple containing a list of the individual rolls and their sum.
+        A tuple containing a list of the individual rolls and their total.
     """
     if not isinstance(dice_string, str):
         raise TypeError("dice_string must be a string.")
 
-    match = re.match(r'(\d*)d(\d+)([\+\-]\d+)?', dice_string)
-    if not match:
-        raise ValueError(f"Invalid dice string format: {dice_string}")
+    result = compile_expression(dice_string).evaluate()
+    return result["rolls"], result["total"]
 
-    num_dice = int(match.group(1)) if match.group(1) else 1
-    num_sides = int(match.group(2))
-    modifier = int(match.group(3)) if match.group(3) else 0
+@functools.lru_cache(maxsize=256)
+def _heroic_expression(dice_string: str) -> CompiledExpression:
+    """
+    Re-expresses an 'NdM' string as 'NdMkh(N-1)'.
 
-    if num_dice <= 0 or num_sides <= 0:
-        raise ValueError("Number of dice and sides must be positive.")
+    As before, a modifier on the dice string is ignored.
+    """
+    num_dice, num_sides, _ = _parse_dice(dice_string)
+    term = DiceTerm(num_dice, num_sides, keep=num_dice - 1)
+    return CompiledExpression(f"{num_dice}d{num_sides}kh{num_dice - 1}", ((1, term),), 0)
 
-    rolls = [random.randint(1, num_sides) for _ in range(num_dice)]
-    total = sum(rolls) + modifier
+# The compiled expression behind each built-in mechanic, given the caller's
+# dice string. A mechanic is added by adding its builder here.
+MECHANICS = {
+    "Heroic": _heroic_expression,
+    "Classic": compile_expression,
+    "High Floor": lambda dice: compile_expression('2d6+6'),
+    "Percentile": lambda dice: compile_expression('1d100')
+}
 
-    return rolls, total
+def _pick(roll1: Dict[str, Any], roll2: Dict[str, Any], advantage: bool) -> Dict[str, Any]:
+    if advantage:
+        chosen = roll1 if roll1['total'] >= roll2['total'] else roll2
+    else:
+        chosen = roll1 if roll1['total'] <= roll2['total'] else roll2
+    result = dict(chosen)
+    result['all_rolls'] = [roll1, roll2]
+    return result
 
-def _roll_heroic(dice_string: str) -> Dict[str, Any]:
-    """
-    Rolls a set of dice, drops the lowest, and sums the rest.
-    """
-    rolls, _ = roll_dice(dice_string)
-    dropped = min(rolls)
-    total = sum(rolls) - dropped
-    return {
-        "total": total,
-        "rolls": sorted(rolls, reverse=True),
-        "dropped": [dropped]
-    }
-
-def _roll_classic(dice_string: str) -> Dict[str, Any]:
-    """
-    Rolls a set of dice and sums them.
+def roll_batch(mechanic: str, dice: str = None, num_rolls: int = 1, advantage: bool = False, disadvantage: bool = False, rng=None) -> List[Dict[str, Any]]:
     """
-    rolls, total = roll_dice(dice_string)
-    return {
-        "total": total,
-        "rolls": rolls,
-        "dropped": []
-    }
-
-def _roll_high_floor() -> Dict[str, Any]:
-    """
-    Rolls 2d6+6.
-    """
-    rolls, total = roll_dice('2d6+6')
-    return {
-        "total": total,
-        "rolls": rolls,
-        "dropped": []
-    }
-
-def _roll_percentile() -> Dict[str, Any]:
-    """
-    Rolls d100.
+    Rolls a built-in mechanic num_rolls times with a single bulk draw.
+
+    The dice string is compiled once (and cached) and every die of every
+    roll (both sets for advantage/disadvantage) is sampled with one
+    random.choices call per dice group (or rng.choices when a generator is
+    given). The results have the same format as roll().
     """
-    rolls, total = roll_dice('1d100')
-    return {
-        "total": total,
-        "rolls": rolls,
-        "dropped": []
-    }
+    if mechanic not in MECHANICS:
+        raise ValueError(f"Unknown mechanic: {mechanic}")
+    expression = MECHANICS[mechanic](dice)
 
-MECHANICS = {
-    "Heroic": _roll_heroic,
-    "Classic": _roll_classic,
-    "High Floor": _roll_high_floor,
-    "Percentile": _roll_percentile
-}
+    paired = advantage != disadvantage
+    num_sets = num_rolls * 2 if paired else num_rolls
+    sets = expression.evaluate_many(num_sets, rng=rng)
+
+    if not paired:
+        return sets
+    return [_pick(sets[i], sets[i + 1], advantage) for i in range(0, num_sets, 2)]
 
-def roll(mechanic: str, dice: str = None, num_rolls: int = 1, advantage: bool = False, disadvantage: bool = False) -> List[Dict[str, Any]]:
+def roll(mechanic: str, dice: str = None, num_rolls: int = 1, advantage: bool = False, disadvantage: bool = False, rng=None) -> List[Dict[str, Any]]:
     """
     Performs one or more dice rolls using a specified mechanic.
 
+    All mechanics are rolled by the batched engine (see roll_batch).
+
     Args:
         mechanic: The name of the rolling mechanic to use.
         dice: The dice string (e.g., '4d6'). Required for 'Heroic' and 'Classic'.
         num_rolls: The number of times to perform the roll.
         advantage: Whether to roll with advantage.
         disadvantage: Whether to roll with disadvantage.
+        rng: The generator to draw from (see dice_rng). Defaults to the random module.
 
     Returns:
         A list of dictionaries, where each dictionary represents a single roll result.
@@ -101,35 +103,8 @@ def roll(mechanic: str, dice: str = None, num_rolls: int = 1, advantage: bool =
     if mechanic not in MECHANICS:
         raise ValueError(f"Unknown mechanic: {mechanic}")
 
-    roll_func = MECHANICS[mechanic]
-
     # These mechanics require a dice string
-    if mechanic in ["Heroic", "Classic"]:
-        if not dice:
-            raise ValueError(f"Mechanic '{mechanic}' requires a 'dice' string.")
-
-        # Create a partial function with the dice string
-        import functools
-        roll_func = functools.partial(roll_func, dice_string=dice)
-
-    results = []
-
-    for _ in range(num_rolls):
-        if advantage and disadvantage:
-            result = roll_func()
-        elif advantage:
-            roll1 = roll_func()
-            roll2 = roll_func()
-            result = roll1 if roll1['total'] >= roll2['total'] else roll2
-            result['all_rolls'] = [roll1, roll2]
-        elif disadvantage:
-            roll1 = roll_func()
-            roll2 = roll_func()
-            result = roll1 if roll1['total'] <= roll2['total'] else roll2
-            result['all_rolls'] = [roll1, roll2]
-        else:
-            result = roll_func()
-
-        results.append(result)
-
-    return results
+    if mechanic in ["Heroic", "Classic"] and not dice:
+        raise ValueError(f"Mechanic '{mechanic}' requires a 'dice' string.")
+
+    return roll_batch(mechanic, dice, num_rolls, advantage, disadvantage, rng)
@@ -0,0 +1,28 @@
+"""Add character context summary
+
+Revision ID: 36f3f6d9634d
+Revises: d62e0f9bab9e
+Create Date: 2026-10-17 09:12:41.503122
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '36f3f6d9634d'
+down_revision = 'd62e0f9bab9e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('context_summary', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('context_summary_message_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_column('context_summary_message_count')
+        batch_op.drop_column('context_summary')
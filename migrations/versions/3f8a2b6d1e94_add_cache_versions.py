@@ -0,0 +1,29 @@
+"""Add cache versions
+
+Revision ID: 3f8a2b6d1e94
+Revises: e1b7d3a95c60
+Create Date: 2026-10-17 18:52:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2b6d1e94'
+down_revision = 'e1b7d3a95c60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_version = op.create_table('cache_version',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(cache_version, [{'name': 'reference_data', 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('cache_version')
@@ -0,0 +1,48 @@
+"""Add session summaries
+
+Revision ID: 5d9e2a7c4b18
+Revises: c3a81f5e2d07
+Create Date: 2026-10-17 15:02:44.190362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9e2a7c4b18'
+down_revision = 'c3a81f5e2d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_summary',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('character_id', sa.Integer(), nullable=False),
+    sa.Column('first_message_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('is_open', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['character_id'], ['character.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('session_summary', schema=None) as batch_op:
+        batch_op.create_index('ix_session_summary_character_id_last_message_id', ['character_id', 'last_message_id'], unique=False)
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('recap_overview', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('recap_overview_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_column('recap_overview_message_id')
+        batch_op.drop_column('recap_overview')
+
+    with op.batch_alter_table('session_summary', schema=None) as batch_op:
+        batch_op.drop_index('ix_session_summary_character_id_last_message_id')
+
+    op.drop_table('session_summary')
@@ -0,0 +1,30 @@
+"""Add character dice stream
+
+Revision ID: 7b2d0c4e91f3
+Revises: e4f6449a9a9c
+Create Date: 2026-10-17 13:05:27.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2d0c4e91f3'
+down_revision = 'e4f6449a9a9c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dice_seed', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('dice_rng_backend', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('dice_roll_counter', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_column('dice_roll_counter')
+        batch_op.drop_column('dice_rng_backend')
+        batch_op.drop_column('dice_seed')
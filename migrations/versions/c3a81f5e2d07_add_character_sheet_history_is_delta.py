@@ -0,0 +1,61 @@
+"""Add character sheet history is_delta
+
+Revision ID: c3a81f5e2d07
+Revises: 7b2d0c4e91f3
+Create Date: 2026-10-17 14:21:09.774512
+
+"""
+import copy
+import json
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a81f5e2d07'
+down_revision = '7b2d0c4e91f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are full snapshots.
+    with op.batch_alter_table('character_sheet_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_delta', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def _apply_patch(document, patch):
+    document = copy.deepcopy(document)
+    for op_ in patch:
+        tokens = [t.replace('~1', '/').replace('~0', '~') for t in op_['path'].split('/')[1:]]
+        if not tokens:
+            document = op_['value']
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        if op_['op'] == 'remove':
+            del parent[last]
+        else:
+            parent[last] = op_['value']
+    return document
+
+
+def downgrade():
+    # Deltas can't be read without is_delta; expand them into full sheets first.
+    connection = op.get_bind()
+    rows = connection.execute(sa.text(
+        "SELECT id, character_id, sheet_data, is_delta FROM character_sheet_history ORDER BY character_id, id"
+    )).fetchall()
+    current = {}
+    for row_id, character_id, sheet_data, is_delta in rows:
+        data = json.loads(sheet_data)
+        if is_delta:
+            data = _apply_patch(current.get(character_id, {}), data)
+            connection.execute(sa.text("UPDATE character_sheet_history SET sheet_data = :data WHERE id = :id"),
+                               {'data': json.dumps(data), 'id': row_id})
+        current[character_id] = data
+
+    with op.batch_alter_table('character_sheet_history', schema=None) as batch_op:
+        batch_op.drop_column('is_delta')
@@ -0,0 +1,40 @@
+"""Add system prompts
+
+Revision ID: e1b7d3a95c60
+Revises: 9a4c6e1f3b27
+Create Date: 2026-10-17 17:41:09.215873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b7d3a95c60'
+down_revision = '9a4c6e1f3b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('system_prompt',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('ttrpg_type_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['ttrpg_type_id'], ['ttrpg_type.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('system_prompt_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_character_system_prompt_id', 'system_prompt', ['system_prompt_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_character_system_prompt_id', type_='foreignkey')
+        batch_op.drop_column('system_prompt_id')
+
+    op.drop_table('system_prompt')
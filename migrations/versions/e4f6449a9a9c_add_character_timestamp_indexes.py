@@ -0,0 +1,32 @@
+"""Add (character_id, timestamp, id) indexes to message and character_sheet_history
+
+Revision ID: e4f6449a9a9c
+Revises: 36f3f6d9634d
+Create Date: 2026-10-17 10:02:17.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f6449a9a9c'
+down_revision = '36f3f6d9634d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_character_id_timestamp_id', ['character_id', 'timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('character_sheet_history', schema=None) as batch_op:
+        batch_op.create_index('ix_character_sheet_history_character_id_timestamp_id', ['character_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('character_sheet_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_character_sheet_history_character_id_timestamp_id')
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_character_id_timestamp_id')
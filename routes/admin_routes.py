@@ -3,6 +3,16 @@ from flask import Blueprint, render_template, request, redirect, url_for, jsonif
 from flask_login import current_user, login_required
 from database import db, TTRPGType, GeminiPrepMessage
 import google.generativeai as genai
+from bot.llm_dispatch import llm_dispatcher
+from bot.rate_limit import rate_limiter
+from bot.model_registry import model_registry
+from bot.context_window import context_metrics
+from bot.render_cache import render_cache
+from dice_rng import dice_rng
+from bot.unit_of_work import turn_write_metrics
+from db_engine import pool_metrics
+from bot.jobs import job_stats
+from bot.reference_data import reference_data
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -26,7 +36,7 @@ def admin():
                 wiki_link=wiki_link
             )
             db.session.add(new_ttrpg_type)
-            db.session.commit()
+            reference_data.commit()
         else:
             config_path = os.path.join(current_app.instance_path, 'config.py')
 
@@ -70,11 +80,14 @@ def admin():
                 f.writelines(new_config_lines)
 
             current_app.config.from_pyfile('config.py', silent=True)
+            # Clients are rebuilt for the newly selected model on first use,
+            # in this worker and in the others.
+            model_registry.settings_changed()
 
         return redirect(url_for('admin.admin'))
 
     models = [m for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-    ttrpg_types = TTRPGType.query.all()
+    ttrpg_types = reference_data.ttrpg_types()
     gemini_model = current_app.config.get('GEMINI_MODEL')
     gemini_debug = current_app.config.get('GEMINI_DEBUG', False)
     return render_template('admin.html', models=models, selected_model=gemini_model, gemini_debug=gemini_debug, ttrpg_types=ttrpg_types)
@@ -86,7 +99,7 @@ def ttrpg_data():
         return "Unauthorized", 401
 
     if request.method == 'GET':
-        ttrpg_types = TTRPGType.query.all()
+        ttrpg_types = reference_data.ttrpg_types()
         return jsonify([
             {
                 'id': t.id,
@@ -105,7 +118,7 @@ def ttrpg_data():
             ttrpg_type.json_template = data['json_template']
             ttrpg_type.html_template = data['html_template']
             ttrpg_type.wiki_link = data['wiki_link']
-            db.session.commit()
+            reference_data.commit()
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'TTRPG type not found'})
 
@@ -118,7 +131,7 @@ def ttrpg_data():
             wiki_link=data['wiki_link']
         )
         db.session.add(new_ttrpg_type)
-        db.session.commit()
+        reference_data.commit()
         return jsonify({'success': True})
 
     if request.method == 'DELETE':
@@ -126,7 +139,7 @@ def ttrpg_data():
         ttrpg_type = TTRPGType.query.get(data['id'])
         if ttrpg_type:
             db.session.delete(ttrpg_type)
-            db.session.commit()
+            reference_data.commit()
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'TTRPG type not found'})
 
@@ -137,7 +150,7 @@ def gemini_prep_data():
         return "Unauthorized", 401
 
     if request.method == 'GET':
-        messages = GeminiPrepMessage.query.order_by(GeminiPrepMessage.priority).all()
+        messages = reference_data.prep_messages()
         return jsonify([
             {
                 'id': m.id,
@@ -152,7 +165,7 @@ def gemini_prep_data():
         if message:
             message.message = data['message']
             message.priority = data['priority']
-            db.session.commit()
+            reference_data.commit()
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Message not found'})
 
@@ -163,7 +176,7 @@ def gemini_prep_data():
             priority=data['priority']
         )
         db.session.add(new_message)
-        db.session.commit()
+        reference_data.commit()
         return jsonify({'success': True})
 
     if request.method == 'DELETE':
@@ -171,6 +184,26 @@ def gemini_prep_data():
         message = GeminiPrepMessage.query.get(data['id'])
         if message:
             db.session.delete(message)
-            db.session.commit()
+            reference_data.commit()
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Message not found'})
+
+@admin_bp.route('/admin/stats')
+@login_required
+def stats():
+    """Runtime statistics for the LLM pipeline."""
+    if current_user.email != current_app.config.get('ADMIN_EMAIL'):
+        return "Unauthorized", 401
+
+    return jsonify({
+        'llm_dispatch': llm_dispatcher.stats(),
+        'rate_limits': rate_limiter.stats(),
+        'model_clients': model_registry.stats(),
+        'context_window': context_metrics.snapshot(),
+        'render_cache': render_cache.stats(),
+        'dice_rng': dice_rng.stats(),
+        'turn_writes': turn_write_metrics.snapshot(),
+        'db_pool': pool_metrics.snapshot(),
+        'jobs': job_stats(),
+        'reference_data': reference_data.stats(),
+    })
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify, current_app
 from flask_login import login_user, logout_user, current_user, login_required
-from database import db, User, Character, TTRPGType
+from database import db, User, Character
 import auth
 from bot.character_utils import get_recap as get_recap_util
+from bot.history import history_cache, VERSION_NAME as HISTORY_VERSION_NAME
+from bot.render_cache import render_cache
+from bot.reference_data import reference_data, bump_version
 
 main_bp = Blueprint('main', __name__)
 
@@ -46,17 +49,19 @@ def new_character():
     if request.method == 'POST':
         character_name = request.form.get('character_name')
         ttrpg_type_id = request.form.get('ttrpg_type')
-        ttrpg_type = TTRPGType.query.get(ttrpg_type_id)
+        ttrpg_type = reference_data.ttrpg_type(ttrpg_type_id)
+        if ttrpg_type is None:
+            return redirect(url_for('main.new_character'))
         new_char = Character(
             user_id=current_user.id,
-            ttrpg_type_id=ttrpg_type_id,
+            ttrpg_type_id=ttrpg_type.id,
             character_name=character_name,
             charactersheet=ttrpg_type.json_template
         )
         db.session.add(new_char)
         db.session.commit()
         return redirect(url_for('main.index', new_char_id=new_char.id))
-    ttrpg_types = TTRPGType.query.all()
+    ttrpg_types = reference_data.ttrpg_types()
     return render_template('new_character.html', ttrpg_types=ttrpg_types)
 
 @main_bp.route('/delete_character/<int:character_id>', methods=['DELETE'])
@@ -65,7 +70,11 @@ def delete_character(character_id):
     character = Character.query.get(character_id)
     if character and character.user_id == current_user.id:
         db.session.delete(character)
+        # Tells the history caches of the other workers to drop it too.
+        bump_version(HISTORY_VERSION_NAME)
         db.session.commit()
+        history_cache.invalidate(character_id)
+        render_cache.drop_character(character_id)
         return jsonify({'success': True})
     return jsonify({'success': False, 'error': 'Character not found or unauthorized'}), 404
 
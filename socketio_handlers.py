@@ -1,21 +1,66 @@
 import logging
 import json
-from flask import request, current_app
+from flask import current_app
 from flask_login import current_user
-from flask_socketio import emit
-from database import db, User, Character, TTRPGType, GeminiPrepMessage, Message, CharacterSheetHistory
-import google.generativeai as genai
+from flask_socketio import emit, join_room
+from database import Character, Message
 import dice_roller
-from bot.gemini_utils import process_bot_response, send_to_gemini_with_retry, MalformedAppDataError
+import dice_probability
+from dice_rng import dice_rng
+from bot.gemini_utils import send_to_gemini_with_retry
+from bot.history import history_cache, message_history_page, DEFAULT_PAGE_SIZE
+from bot.context_window import build_context, schedule_summary
+from bot.render_cache import render_cache
+from bot.character_utils import reserve_dice_roll
+from bot.unit_of_work import TurnUnitOfWork
+from bot.sheet_history import sheet_history_page, sheet_version, DEFAULT_HISTORY_PAGE_SIZE
+from bot.system_prompt import assign_system_prompt, model_for
+from bot.reference_data import reference_data
+from bot.message_queue import user_room
+from bot.llm_dispatch import LLMDispatcher
 
 logger = logging.getLogger(__name__)
 
+# Exact odds of big rolls are CPU-bound; they run on a few native threads of
+# their own so they neither freeze the worker's greenlets nor take the
+# threads waiting on Gemini.
+odds_dispatcher = LLMDispatcher(max_workers=2)
+
+def _run_chat_turn(character_id, user_message_text):
+    """
+    Asks Gemini for a reply to the user's message and emits it.
+
+    The user message, the reply and any character sheet update are stored
+    in a single transaction once the reply is in (see TurnUnitOfWork). If
+    the model call fails, the user message is still stored.
+    """
+    with TurnUnitOfWork() as turn:
+        turn.add_message(character_id, 'user', user_message_text)
+
+        character = Character.query.get(character_id)
+        history = history_cache.get(character_id) + [{'role': 'user', 'parts': [user_message_text]}]
+        prompt, window_start = build_context(character, history)
+        schedule_summary(character, history, window_start)
+
+        model = model_for(character)
+        processed_response, bot_response_text = send_to_gemini_with_retry(model, prompt, character_id)
+
+        if bot_response_text:
+            model_index = turn.add_message(character_id, 'model', bot_response_text)
+
+    if bot_response_text:
+        render_cache.put(int(character_id), turn.message_ids[model_index], bot_response_text, processed_response)
+
+    emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+
 def register_socketio_handlers(socketio):
     @socketio.on('connect')
     def handle_connect():
         """Handles a new client connection."""
         if not current_user.is_authenticated:
             return False
+        # Lets background work reach the user on whichever worker they are connected to.
+        join_room(user_room(current_user.id))
         logger.info('Client connected')
 
     @socketio.on('disconnect')
@@ -27,7 +72,7 @@ def register_socketio_handlers(socketio):
     def handle_edit_ttrpg(data):
         """Handles a request to edit a TTRPG type."""
         ttrpg_id = data['id']
-        ttrpg_type = TTRPGType.query.get(ttrpg_id)
+        ttrpg_type = reference_data.ttrpg_type(ttrpg_id)
         if ttrpg_type:
             emit('ttrpg_data', {'html': ttrpg_type.html_template})
 
@@ -38,41 +83,30 @@ def register_socketio_handlers(socketio):
         if not character or character.user_id != current_user.id:
             return
 
-        messages = Message.query.filter_by(character_id=character.id).order_by(Message.timestamp).all()
-
-        if messages:
+        if Message.query.filter_by(character_id=character.id).first():
             pass
         else:
-            prep_messages = GeminiPrepMessage.query.order_by(GeminiPrepMessage.priority).all()
-            ttrpg_name = character.ttrpg_type.name
-            char_name = character.character_name
-
-            system_instructions = []
-            initial_user_prompt = ""
-
-            ttrpg_json = character.ttrpg_type.json_template
-            for prep_msg in prep_messages:
-                msg = prep_msg.message.replace('[DB.TTRPG.Name]', ttrpg_name).replace('[DB.CHARACTER.NAME]', char_name).replace('[DB.TTRPG.JSON]', ttrpg_json)
-                if prep_msg.priority == 2:
-                    initial_user_prompt = msg
-                else:
-                    system_instructions.append(msg)
-
-            full_initial_prompt = "\\n".join(system_instructions) + "\\n" + initial_user_prompt
+            # The preamble is stored once as a shared system instruction;
+            # only the short kickoff turn is stored for the character.
+            try:
+                kickoff = assign_system_prompt(character)
+            except ValueError as e:
+                logger.error(f"Could not start chat for character {character_id}: {e}")
+                emit('message', {'text': f"Error: {e}", 'sender': 'received', 'character_id': character_id})
+                return
 
-            user_message = Message(character_id=character.id, role='user', content=full_initial_prompt)
-            db.session.add(user_message)
-            db.session.commit()
+            with TurnUnitOfWork() as turn:
+                turn.add_message(character.id, 'user', kickoff)
+                history = [{'role': 'user', 'parts': [kickoff]}]
+                model = model_for(character)
 
-            history = [{'role': 'user', 'parts': [full_initial_prompt]}]
-            model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
+                processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
 
-            processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
+                if bot_response_text:
+                    model_index = turn.add_message(character.id, 'model', bot_response_text)
 
             if bot_response_text:
-                model_message = Message(character_id=character.id, role='model', content=bot_response_text)
-                db.session.add(model_message)
-                db.session.commit()
+                render_cache.put(character.id, turn.message_ids[model_index], bot_response_text, processed_response)
 
                 emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
 
@@ -84,37 +118,78 @@ def register_socketio_handlers(socketio):
         if character and character.user_id == current_user.id:
             try:
                 sheet_data = json.loads(character.charactersheet)
-                html_template = character.ttrpg_type.html_template
-
+                ttrpg_type = reference_data.ttrpg_type(character.ttrpg_type_id)
+                if ttrpg_type is None:
+                    logger.error(f"TTRPG type {character.ttrpg_type_id} of character {character_id} not found")
+                    emit('character_sheet_error', {'character_id': character_id, 'message': 'Could not load the character sheet template.'})
+                    return
+
+                # The template itself is cached by the client and fetched
+                # with get_sheet_template only when its version is unknown.
                 emit('character_sheet_data', {
                     'sheet_data': sheet_data,
-                    'html_template': html_template,
+                    'ttrpg_type_id': ttrpg_type.id,
+                    'template_version': ttrpg_type.template_version,
                     'character_id': character_id
                 })
             except json.JSONDecodeError:
                 logger.error(f"Could not decode character sheet JSON for character {character_id}")
                 emit('character_sheet_error', {'character_id': character_id, 'message': 'Could not load character sheet data.'})
 
+    @socketio.on('get_sheet_template')
+    def handle_get_sheet_template(data):
+        """Sends a character sheet template by version."""
+        ttrpg_type = reference_data.sheet_template(data.get('ttrpg_type_id'), data.get('version'))
+        if ttrpg_type is None:
+            # The template was edited since the sheet was sent; send the
+            # current one for the TTRPG type instead.
+            ttrpg_type = reference_data.ttrpg_type(data.get('ttrpg_type_id'))
+        if ttrpg_type is None:
+            emit('character_sheet_error', {'character_id': data.get('character_id'), 'message': 'Could not load the character sheet template.'})
+            return
+
+        emit('sheet_template', {
+            'ttrpg_type_id': ttrpg_type.id,
+            'version': ttrpg_type.template_version,
+            'html_template': ttrpg_type.html_template
+        })
+
     @socketio.on('get_character_sheet_history')
     def handle_get_character_sheet_history(data):
         character_id = data.get('character_id')
         character = Character.query.get(character_id)
 
         if character and character.user_id == current_user.id:
-            history_records = CharacterSheetHistory.query.filter_by(character_id=character_id).order_by(CharacterSheetHistory.timestamp.desc()).all()
-
-            history_data = []
-            for record in history_records:
-                try:
-                    history_data.append({
-                        'sheet_data': json.loads(record.sheet_data),
-                        'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S') + ' UTC'
-                    })
-                except json.JSONDecodeError:
-                    logger.error(f"Could not decode character sheet history JSON for character {character_id}, record {record.id}")
-
+            page = sheet_history_page(character.id, before_id=data.get('before_id'),
+                                      limit=data.get('limit') or DEFAULT_HISTORY_PAGE_SIZE)
             emit('character_sheet_history_data', {
-                'history': history_data,
+                'versions': page['versions'],
+                'before_id': page['before_id'],
+                'has_more': page['has_more'],
+                'count': page['count'],
+                'is_older_page': data.get('before_id') is not None,
+                'character_id': character_id
+            })
+
+    @socketio.on('get_character_sheet_version')
+    def handle_get_character_sheet_version(data):
+        character_id = data.get('character_id')
+        character = Character.query.get(character_id)
+
+        if character and character.user_id == current_user.id:
+            try:
+                version = sheet_version(character.id, int(data.get('history_id')))
+            except (TypeError, ValueError):
+                version = None
+            if version is None:
+                emit('character_sheet_error', {'character_id': character_id, 'message': 'Could not load this version of the character sheet.'})
+                return
+
+            record, sheet_data = version
+            emit('character_sheet_version_data', {
+                'history_id': record.id,
+                'sheet_data': sheet_data,
+                'timestamp': record.timestamp.strftime('%Y-%m-%d %H:%M:%S') + ' UTC',
                 'character_id': character_id
             })
 
@@ -123,23 +198,15 @@ def register_socketio_handlers(socketio):
         character_id = data.get('character_id')
         character = Character.query.get(character_id)
         if character and character.user_id == current_user.id:
-            messages = Message.query.filter_by(character_id=character.id).order_by(Message.timestamp.asc()).all()
-            history_data = []
-            for msg in messages:
-                if msg.role == 'user' and "You are the DM" in msg.content:
-                    continue
-
-                try:
-                    content = process_bot_response(msg.content)
-                except MalformedAppDataError:
-                    logger.warning(f"Malformed APPDATA in history for message {msg.id}. Displaying raw content.")
-                    content = msg.content.replace('\\n', '<br>')
-
-                history_data.append({
-                    'role': msg.role,
-                    'content': content
-                })
-            emit('message_history_data', {'history': history_data, 'character_id': character_id})
+            page_size = data.get('limit') or current_app.config.get('MESSAGE_HISTORY_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+            page = message_history_page(character.id, before_id=data.get('before_id'), limit=page_size)
+            emit('message_history_data', {
+                'history': page['history'],
+                'before_id': page['before_id'],
+                'has_more': page['has_more'],
+                'is_older_page': data.get('before_id') is not None,
+                'character_id': character_id
+            })
 
     @socketio.on('user_ordered_list')
     def handle_user_ordered_list(data):
@@ -156,22 +223,7 @@ def register_socketio_handlers(socketio):
         for item in ordered_list:
             user_message_text += f"{item['name']}: {item['value']}\\n"
 
-        user_message = Message(character_id=character_id, role='user', content=user_message_text)
-        db.session.add(user_message)
-        db.session.commit()
-
-        messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
-        history = [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
-
-        model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-        processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
-
-        if bot_response_text:
-            model_message = Message(character_id=character_id, role='model', content=bot_response_text)
-            db.session.add(model_message)
-            db.session.commit()
-
-        emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+        _run_chat_turn(character_id, user_message_text)
 
     @socketio.on('dice_roll')
     def handle_dice_roll(data):
@@ -185,15 +237,18 @@ def register_socketio_handlers(socketio):
             return
 
         try:
+            backend, seed, counter = reserve_dice_roll(character_id)
             results = dice_roller.roll(
                 mechanic=roll_params.get('Mechanic'),
                 dice=roll_params.get('Dice'),
                 num_rolls=roll_params.get('NumRolls', 1),
                 advantage=roll_params.get('Advantage', False),
-                disadvantage=roll_params.get('Disadvantage', False)
+                disadvantage=roll_params.get('Disadvantage', False),
+                rng=dice_rng.get(character_id, backend, seed, counter)
             )
+            logger.info(f"Dice roll {counter} for character {character_id} ({backend} backend, seed {seed}): {roll_params}")
 
-            emit('dice_roll_result', {'results': results, 'character_id': character_id})
+            emit('dice_roll_result', {'results': results, 'roll_counter': counter, 'character_id': character_id})
 
             summary_parts = []
             for result in results:
@@ -206,27 +261,33 @@ def register_socketio_handlers(socketio):
                 summary_parts.append(f"({part})")
             user_message_text = f"I rolled for {roll_params.get('Title', 'dice')}: {', '.join(summary_parts)}"
 
-            user_message = Message(character_id=character_id, role='user', content=user_message_text)
-            db.session.add(user_message)
-            db.session.commit()
-
-            messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
-            history = [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
-
-            model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-            processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
-
-            if bot_response_text:
-                model_message = Message(character_id=character_id, role='model', content=bot_response_text)
-                db.session.add(model_message)
-                db.session.commit()
-
-            emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+            _run_chat_turn(character_id, user_message_text)
 
         except (ValueError, TypeError) as e:
             logger.error(f"Error processing dice roll: {e}")
             emit('message', {'text': f"Error: {e}", 'sender': 'received', 'character_id': character_id})
 
+    @socketio.on('dice_odds')
+    def handle_dice_odds(data):
+        """Computes the exact outcome distribution of a DiceRoll."""
+        roll_params = data['roll_params']
+        try:
+            result = odds_dispatcher.call(
+                dice_probability.odds,
+                mechanic=roll_params.get('Mechanic'),
+                dice=roll_params.get('Dice'),
+                advantage=roll_params.get('Advantage', False),
+                disadvantage=roll_params.get('Disadvantage', False),
+                target=data.get('target')
+            )
+        except (ValueError, TypeError) as e:
+            logger.error(f"Error computing dice odds: {e}")
+            emit('dice_odds_result', {'error': str(e), 'character_id': data.get('character_id')})
+            return
+
+        result['character_id'] = data.get('character_id')
+        emit('dice_odds_result', result)
+
     @socketio.on('message')
     def handle_message(data):
         message_text = data['message']
@@ -238,22 +299,7 @@ def register_socketio_handlers(socketio):
             emit('message', {'text': "Error: Gemini API key not configured", 'sender': 'received', 'character_id': character_id})
             return
 
-        user_message = Message(character_id=character_id, role='user', content=message_text)
-        db.session.add(user_message)
-        db.session.commit()
-
-        messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
-        history = [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
-
-        model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-        processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
-
-        if bot_response_text:
-            model_message = Message(character_id=character_id, role='model', content=bot_response_text)
-            db.session.add(model_message)
-            db.session.commit()
-
-        emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+        _run_chat_turn(character_id, message_text)
 
     @socketio.on('user_choice')
     def handle_user_choice(data):
@@ -268,22 +314,7 @@ def register_socketio_handlers(socketio):
 
         user_message_text = f"I choose: {choice}"
 
-        user_message = Message(character_id=character_id, role='user', content=user_message_text)
-        db.session.add(user_message)
-        db.session.commit()
-
-        messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
-        history = [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
-
-        model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-        processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
-
-        if bot_response_text:
-            model_message = Message(character_id=character_id, role='model', content=bot_response_text)
-            db.session.add(model_message)
-            db.session.commit()
-
-        emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+        _run_chat_turn(character_id, user_message_text)
 
     @socketio.on('user_multi_choice')
     def handle_user_multi_choice(data):
@@ -299,19 +330,4 @@ def register_socketio_handlers(socketio):
 
         user_message_text = f"I choose the following: {', '.join(choices)}"
 
-        user_message = Message(character_id=character_id, role='user', content=user_message_text)
-        db.session.add(user_message)
-        db.session.commit()
-
-        messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
-        history = [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
-
-        model = genai.GenerativeModel(current_app.config.get('GEMINI_MODEL'))
-        processed_response, bot_response_text = send_to_gemini_with_retry(model, history, character_id)
-
-        if bot_response_text:
-            model_message = Message(character_id=character_id, role='model', content=bot_response_text)
-            db.session.add(model_message)
-            db.session.commit()
-
-        emit('message', {'text': processed_response, 'sender': 'received', 'character_id': character_id})
+        _run_chat_turn(character_id, user_message_text)
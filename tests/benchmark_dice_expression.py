@@ -0,0 +1,53 @@
+"""
+Compares parsing a dice string with a regex on every call (the old
+roll_dice) with compiling it once and evaluating the cached expression.
+
+Run with: python -m tests.benchmark_dice_expression
+"""
+import random
+import re
+import time
+from dice_expression import compile_expression
+
+NUM_ROLLS = 200_000
+EXPRESSIONS = ['1d20', '4d6', '2d10+5']
+
+_DICE_PATTERN = re.compile(r'(\d*)d(\d+)([\+\-]\d+)?')
+
+def regex_per_call(dice_string):
+    match = _DICE_PATTERN.match(dice_string)
+    num_dice = int(match.group(1)) if match.group(1) else 1
+    num_sides = int(match.group(2))
+    modifier = int(match.group(3)) if match.group(3) else 0
+    rolls = [random.randint(1, num_sides) for _ in range(num_dice)]
+    return rolls, sum(rolls) + modifier
+
+def cached_compile(dice_string):
+    return compile_expression(dice_string).evaluate()
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def run(func, dice_string):
+    for _ in range(NUM_ROLLS):
+        func(dice_string)
+
+def main():
+    print(f"{'expression':<12} {'regex/call k/s':>15} {'compiled k/s':>13} {'evaluate_many k/s':>18}")
+    for dice_string in EXPRESSIONS:
+        legacy = timed(run, regex_per_call, dice_string)
+        compiled = timed(run, cached_compile, dice_string)
+        bulk = timed(compile_expression(dice_string).evaluate_many, NUM_ROLLS)
+        print(f"{dice_string:<12} {NUM_ROLLS / legacy / 1000:>15.1f} {NUM_ROLLS / compiled / 1000:>13.1f} "
+              f"{NUM_ROLLS / bulk / 1000:>18.1f}")
+
+    start = time.perf_counter()
+    compile_expression.cache_clear()
+    for i in range(10_000):
+        compile_expression(f"{i % 50 + 1}d6kh1+{i}")
+    print(f"Cold compile: {(time.perf_counter() - start) / 10_000 * 1e6:.1f} us per expression")
+
+if __name__ == '__main__':
+    main()
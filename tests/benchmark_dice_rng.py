@@ -0,0 +1,37 @@
+"""
+Compares the dice RNG backends and the cost of serving a roll's generator
+from the pre-generated buffer instead of creating it inline.
+
+Run with: python -m tests.benchmark_dice_rng
+"""
+import time
+import dice_roller
+from dice_rng import BACKENDS, DiceRNG, create_rng
+
+NUM_ROLLS = 100_000
+NUM_SETUPS = 20_000
+
+def main():
+    print(f"{'backend':<8} {'setup us':>9} {'Heroic 4d6 x100k ms':>20}")
+    for backend in BACKENDS:
+        start = time.perf_counter()
+        for counter in range(NUM_SETUPS):
+            create_rng(backend, 'benchmark', counter)
+        setup = (time.perf_counter() - start) / NUM_SETUPS * 1e6
+
+        rng = create_rng(backend, 'benchmark', 0)
+        start = time.perf_counter()
+        dice_roller.roll('Heroic', '4d6', num_rolls=NUM_ROLLS, rng=rng)
+        bulk = (time.perf_counter() - start) * 1000
+        print(f"{backend:<8} {setup:>9.2f} {bulk:>20.1f}")
+
+    service = DiceRNG(buffer_size=NUM_SETUPS)
+    service._refill((1, 'random', 'benchmark'), 0)
+    start = time.perf_counter()
+    for counter in range(NUM_SETUPS):
+        service._buffers[(1, 'random', 'benchmark')].pop(counter)
+    buffered = (time.perf_counter() - start) / NUM_SETUPS * 1e6
+    print(f"Buffered generator lookup: {buffered:.2f} us")
+
+if __name__ == '__main__':
+    main()
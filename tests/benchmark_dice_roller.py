@@ -0,0 +1,48 @@
+"""
+Compares the per-roll dice path with the batched engine.
+
+Run with: python -m tests.benchmark_dice_roller
+"""
+import time
+import dice_roller
+
+ROLL_COUNTS = [1, 100, 100_000]
+CASES = [
+    ('Heroic 4d6', 'Heroic', '4d6', False),
+    ('Heroic 4d6 adv', 'Heroic', '4d6', True),
+    ('Classic 1d20 adv', 'Classic', '1d20', True),
+]
+
+def per_roll(mechanic, dice, num_rolls, advantage):
+    """The loop roll() used before the batched engine: one evaluation per set."""
+    roll_func = dice_roller.MECHANICS[mechanic](dice).evaluate
+    results = []
+    for _ in range(num_rolls):
+        if advantage:
+            results.append(dice_roller._pick(roll_func(), roll_func(), True))
+        else:
+            results.append(roll_func())
+    return results
+
+def batched(mechanic, dice, num_rolls, advantage):
+    return dice_roller.roll_batch(mechanic, dice, num_rolls, advantage, False)
+
+def best_of(func, *args, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    print(f"{'case':<18} {'rolls':>8} {'per-roll ms':>12} {'batched ms':>12} {'speed-up':>9}")
+    for label, mechanic, dice, advantage in CASES:
+        for num_rolls in ROLL_COUNTS:
+            repeats = 3 if num_rolls >= 100_000 else 200
+            legacy = best_of(per_roll, mechanic, dice, num_rolls, advantage, repeats=repeats)
+            batch = best_of(batched, mechanic, dice, num_rolls, advantage, repeats=repeats)
+            print(f"{label:<18} {num_rolls:>8} {legacy:>12.3f} {batch:>12.3f} {legacy / batch:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
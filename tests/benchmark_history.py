@@ -0,0 +1,70 @@
+"""
+Compares the per-turn cost of building the Gemini prompt history.
+
+The legacy path re-queries every message of the character on each turn; the
+HistoryCache only fetches the rows written since the previous turn.
+
+Run with: python -m tests.benchmark_history
+"""
+import time
+from flask import Flask
+from database import db, User, TTRPGType, Character, Message
+from bot.history import HistoryCache
+
+SIZES = [10, 100, 1000, 10000]
+TURNS = 50
+
+def create_app():
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+    return bench_app
+
+def seed_character(num_messages):
+    user = User(google_id=f'bench-{num_messages}', email=f'bench-{num_messages}@example.com')
+    ttrpg_type = TTRPGType(name=f'Bench {num_messages}', json_template='{}', html_template='')
+    db.session.add_all([user, ttrpg_type])
+    db.session.commit()
+    character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Bench', charactersheet='{}')
+    db.session.add(character)
+    db.session.commit()
+    db.session.bulk_insert_mappings(Message, [
+        {'character_id': character.id, 'role': 'user' if i % 2 == 0 else 'model', 'content': f'Message {i} ' * 20}
+        for i in range(num_messages)
+    ])
+    db.session.commit()
+    return character.id
+
+def add_turn(character_id):
+    db.session.add(Message(character_id=character_id, role='user', content='Next turn'))
+    db.session.commit()
+
+def legacy_history(character_id):
+    messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp).all()
+    return [{'role': msg.role, 'parts': [msg.content]} for msg in messages]
+
+def time_turns(build_history, character_id):
+    elapsed = 0.0
+    for _ in range(TURNS):
+        add_turn(character_id)
+        start = time.perf_counter()
+        build_history(character_id)
+        elapsed += time.perf_counter() - start
+    return elapsed / TURNS * 1000
+
+def main():
+    bench_app = create_app()
+    with bench_app.app_context():
+        db.create_all()
+        print(f"{'messages':>10} {'legacy ms/turn':>16} {'cached ms/turn':>16}")
+        for size in SIZES:
+            character_id = seed_character(size)
+            cache = HistoryCache()
+            cache.get(character_id)  # warm-up, paid once per character
+            legacy = time_turns(legacy_history, character_id)
+            cached = time_turns(cache.get, character_id)
+            print(f"{size:>10} {legacy:>16.3f} {cached:>16.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Load test for the LLM dispatcher with a stubbed slow model.
+
+The stub blocks the native thread (like a non-cooperative gRPC call) for
+SLOW_CALL_SECONDS. While SLOW_CALLS turns are waiting on it, a heartbeat
+greenlet stands in for other connected sockets and records how long it was
+starved of the event loop.
+
+Run with: python -m tests.benchmark_llm_dispatch
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import time
+import gevent
+from gevent.event import Event
+from bot.llm_dispatch import LLMDispatcher
+
+SLOW_CALL_SECONDS = 0.5
+SLOW_CALLS = 8
+HEARTBEAT_INTERVAL = 0.01
+
+_blocking_sleep = monkey.get_original('time', 'sleep')
+
+class SlowModel:
+    def generate_content(self, contents):
+        _blocking_sleep(SLOW_CALL_SECONDS)
+        return contents
+
+def heartbeat(stop, gaps):
+    last = time.perf_counter()
+    while not stop.is_set():
+        gevent.sleep(HEARTBEAT_INTERVAL)
+        now = time.perf_counter()
+        gaps.append(now - last - HEARTBEAT_INTERVAL)
+        last = now
+
+def run(call):
+    model = SlowModel()
+    stop = Event()
+    gaps = []
+    monitor = gevent.spawn(heartbeat, stop, gaps)
+    gevent.sleep(HEARTBEAT_INTERVAL * 2)
+    start = time.perf_counter()
+    turns = [gevent.spawn(call, model.generate_content, f'turn {i}') for i in range(SLOW_CALLS)]
+    gevent.joinall(turns)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    monitor.join()
+    return elapsed, max(gaps) * 1000
+
+def main():
+    def inline(func, *args):
+        return func(*args)
+
+    dispatcher = LLMDispatcher(max_workers=SLOW_CALLS)
+
+    print(f"{SLOW_CALLS} concurrent calls of {SLOW_CALL_SECONDS}s each")
+    print(f"{'mode':>12} {'wall s':>8} {'max heartbeat stall ms':>24}")
+    for name, call in (('inline', inline), ('dispatcher', dispatcher.call)):
+        elapsed, stall = run(call)
+        print(f"{name:>12} {elapsed:>8.2f} {stall:>24.1f}")
+    print(f"dispatcher stats: {dispatcher.stats()}")
+
+if __name__ == '__main__':
+    main()
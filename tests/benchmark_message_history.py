@@ -0,0 +1,77 @@
+"""
+Compares loading a 5,000-message campaign in the history popup in one
+payload (the previous behaviour) against loading only the first page.
+
+Run with: python -m tests.benchmark_message_history
+"""
+import json
+import time
+from flask import Flask
+from database import db, User, TTRPGType, Character, Message
+from bot.gemini_utils import process_bot_response, MalformedAppDataError
+from bot.history import message_history_page, DEFAULT_PAGE_SIZE
+
+NUM_MESSAGES = 5000
+
+MODEL_MESSAGE = (
+    "The innkeeper slides a mug across the bar and leans in. " * 8
+    + '[APPDATA]{"SingleChoice": {"Title": "What do you do?", "Options": {'
+    + ", ".join(f'"Option{i}": {{"Name": "Option {i}", "Description": "{"A possible course of action. " * 4}"}}' for i in range(4))
+    + '}}}[/APPDATA]'
+)
+USER_MESSAGE = "I ask the innkeeper about the missing caravan and offer him a silver coin."
+
+def create_app():
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+    return bench_app
+
+def seed_character():
+    user = User(google_id='bench', email='bench@example.com')
+    ttrpg_type = TTRPGType(name='Bench', json_template='{}', html_template='')
+    db.session.add_all([user, ttrpg_type])
+    db.session.commit()
+    character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Bench', charactersheet='{}')
+    db.session.add(character)
+    db.session.commit()
+    db.session.bulk_insert_mappings(Message, [
+        {'character_id': character.id, 'role': 'model' if i % 2 == 0 else 'user',
+         'content': MODEL_MESSAGE if i % 2 == 0 else USER_MESSAGE}
+        for i in range(NUM_MESSAGES)
+    ])
+    db.session.commit()
+    return character.id
+
+def full_history(character_id):
+    messages = Message.query.filter_by(character_id=character_id).order_by(Message.timestamp.asc(), Message.id.asc()).all()
+    history_data = []
+    for msg in messages:
+        try:
+            content = process_bot_response(msg.content)
+        except MalformedAppDataError:
+            content = msg.content
+        history_data.append({'role': msg.role, 'content': content})
+    return {'history': history_data}
+
+def measure(label, load):
+    db.session.expire_all()
+    start = time.perf_counter()
+    payload = load()
+    elapsed = (time.perf_counter() - start) * 1000
+    size = len(json.dumps(payload))
+    print(f"{label:<24} {elapsed:>10.1f} ms {size / 1024:>12.1f} KiB")
+
+def main():
+    bench_app = create_app()
+    with bench_app.app_context():
+        db.create_all()
+        character_id = seed_character()
+        print(f"{NUM_MESSAGES} messages")
+        print(f"{'':<24} {'server time':>13} {'payload':>16}")
+        measure('full history', lambda: full_history(character_id))
+        measure(f'first page ({DEFAULT_PAGE_SIZE})', lambda: message_history_page(character_id))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Query-plan benchmark for the hot per-character queries on the message table.
+
+Seeds a SQLite database with NUM_MESSAGES messages spread over NUM_CHARACTERS
+characters, then shows the query plan and timing of each query before and
+after the (character_id, timestamp, id) index is created.
+
+Run with: python -m tests.benchmark_query_plan [num_messages]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+NUM_MESSAGES = 1_000_000
+NUM_CHARACTERS = 2_000
+REPEATS = 20
+
+QUERIES = {
+    'chat history (timestamp, id)': (
+        "SELECT id, role, content FROM message WHERE character_id = ? ORDER BY timestamp, id"
+    ),
+    'history tail (id > ?)': (
+        "SELECT id, role, content FROM message WHERE character_id = ? AND id > ? ORDER BY id"
+    ),
+    'latest message': (
+        "SELECT id FROM message WHERE character_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1"
+    ),
+}
+
+def seed(conn, num_messages):
+    conn.execute("""
+        CREATE TABLE message (
+            id INTEGER NOT NULL PRIMARY KEY,
+            character_id INTEGER NOT NULL,
+            role VARCHAR(80) NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT (CURRENT_TIMESTAMP)
+        )
+    """)
+    rng = random.Random(42)
+    batch = []
+    for i in range(num_messages):
+        # Many rows share a timestamp, as they do with server_default=func.now() on SQLite.
+        second = i // 50
+        batch.append((rng.randrange(NUM_CHARACTERS), 'user' if i % 2 else 'model', 'x' * 200,
+                      f'2026-01-01 00:00:00+{second}'))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO message (character_id, role, content, timestamp) VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO message (character_id, role, content, timestamp) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+
+def run_queries(conn, num_messages):
+    for name, sql in QUERIES.items():
+        params = (NUM_CHARACTERS // 2, num_messages - 1000)[:sql.count('?')]
+        plan = " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) / REPEATS * 1000
+        print(f"  {name:<32} {elapsed:>9.2f} ms   {plan}")
+
+def main():
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_MESSAGES
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        print(f"Seeding {num_messages} messages over {NUM_CHARACTERS} characters...")
+        seed(conn, num_messages)
+
+        print("Without index:")
+        run_queries(conn, num_messages)
+
+        conn.execute("CREATE INDEX ix_message_character_id_timestamp_id ON message (character_id, timestamp, id)")
+        conn.execute("ANALYZE")
+        print("With ix_message_character_id_timestamp_id:")
+        run_queries(conn, num_messages)
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of bot response rendering.
+
+Compares the previous multi-pass regex implementation of
+process_bot_response (reproduced below without its side effects) with the
+single-pass parser over a corpus of real-sized model outputs.
+
+Run with: python -m tests.benchmark_response_parser
+"""
+import json
+import re
+import timeit
+from bot.gemini_utils import process_bot_response
+
+ITERATIONS = 2000
+
+NARRATION = (
+    "The rain hammers against the shutters of the Prancing Pony as you push the door open. "
+    "A dozen faces turn towards you, then quickly return to their drinks. Behind the bar, "
+    "a heavy-set innkeeper polishes a tankard and eyes your muddy boots.\\n\\n"
+) * 6
+
+SHEET = json.dumps({
+    "name": "Arannis", "level": "3", "class": "Ranger", "race": "Elf", "hp": "27",
+    "strength": "12", "dexterity": "17", "constitution": "14", "intelligence": "10",
+    "wisdom": "15", "charisma": "8", "inventory": "Longbow, 40 arrows, shortsword, rope, rations",
+})
+
+SINGLE_CHOICE = json.dumps({"SingleChoice": {"Title": "What do you do?", "Options": {
+    f"Option{i}": {"Name": f"Option {i}", "Description": "A possible course of action. " * 5} for i in range(5)
+}}})
+
+ORDERED_LIST = json.dumps({"OrderedList": {"Title": "Assign Ability Scores", "Items": [
+    {"Name": name} for name in ("Strength", "Dexterity", "Constitution", "Intelligence", "Wisdom", "Charisma")
+], "Values": [15, 14, 13, 12, 10, 8]}})
+
+CORPUS = {
+    'narration only': NARRATION,
+    'narration + choice': NARRATION + f"[APPDATA]{SINGLE_CHOICE}[/APPDATA]",
+    'sheet + ordered list': NARRATION + f"[CHARACTERSHEET]{SHEET}[/CHARACTERSHEET]\n[APPDATA]{ORDERED_LIST}[/APPDATA]",
+}
+
+def legacy_process_bot_response(bot_response):
+    charactersheet_pattern = re.compile(r'\[CHARACTERSHEET\](.*?)\[/CHARACTERSHEET\]', re.DOTALL)
+    match_cs = charactersheet_pattern.search(bot_response)
+    if match_cs:
+        try:
+            json.loads(match_cs.group(1))
+            bot_response = charactersheet_pattern.sub('', bot_response).strip()
+        except json.JSONDecodeError:
+            pass
+
+    if bot_response.count('[APPDATA]') != bot_response.count('[/APPDATA]'):
+        raise ValueError("Mismatched number of [APPDATA] and [/APPDATA] tags.")
+
+    appdata_pattern = re.compile(r'\[APPDATA\](.*?)\[/APPDATA\]', re.DOTALL)
+    match = appdata_pattern.search(bot_response)
+    if not match:
+        return bot_response.replace('\\n', '<br>')
+
+    processed_text = appdata_pattern.sub('', bot_response).strip().replace('\\n', '<br>')
+    appdata = json.loads(match.group(1))
+    if 'SingleChoice' in appdata:
+        choice_data = appdata['SingleChoice']
+        html_choices = f'<div class="singlechoice-container"><h3>{choice_data.get("Title")}</h3>'
+        for key, details in choice_data.get('Options', {}).items():
+            html_choices += f"""
+                    <div class="singlechoice-option">
+                        <div class="singlechoice-option-inner">
+                            <button onclick="sendChoice('{details['Name']}')">{details['Name']}</button>
+                        </div>
+                        <span class="description">{details['Description']}</span>
+                    </div>
+                """
+        return processed_text + html_choices + '</div>'
+    if 'OrderedList' in appdata:
+        list_data = appdata['OrderedList']
+        items = list_data.get('Items', [])
+        values = list_data.get('Values', [])
+        html_list = f'<div class="ordered-list-container"><h3>{list_data.get("Title")}</h3><ul id="sortable-list">'
+        for i, item in enumerate(items):
+            value = values[i] if i < len(values) else ''
+            li_class = "sortable-item"
+            if i == 0:
+                li_class += " first-item"
+            if i == len(items) - 1:
+                li_class += " last-item"
+            html_list += f'<li class="{li_class}" data-name="{item["Name"]}">{item["Name"]}<div class="value-card" draggable="true" ondragstart="drag(event)" id="val-{i}"><span class="value">{value}</span><span class="arrows"><span class="up-arrow" onclick="moveValueUp(this)">&#8593;</span><span class="down-arrow" onclick="moveValueDown(this)">&#8595;</span></span><span class="drag-handle">&#9776;</span></div></li>'
+        return processed_text + html_list + '</ul><button onclick="confirmOrderedList()">Confirm</button></div>'
+    return processed_text
+
+def main():
+    print(f"{'corpus':<24} {'legacy/s':>12} {'parser/s':>12} {'speed-up':>10}")
+    for name, text in CORPUS.items():
+        legacy = timeit.timeit(lambda: legacy_process_bot_response(text), number=ITERATIONS)
+        parser = timeit.timeit(lambda: process_bot_response(text), number=ITERATIONS)
+        print(f"{name:<24} {ITERATIONS / legacy:>12.0f} {ITERATIONS / parser:>12.0f} {legacy / parser:>9.2f}x")
+
+if __name__ == '__main__':
+    main()
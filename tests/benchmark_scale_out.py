@@ -0,0 +1,196 @@
+"""
+Connected-player capacity as the number of Socket.IO worker processes
+grows.
+
+For 1..N workers this starts that many single-process gevent servers with
+the real Socket.IO handlers on a shared SQLite file. Each simulated player
+is pinned to one worker (as sticky sessions would), speaks Engine.IO
+long-polling and opens its character sheet about once per THINK_SECONDS.
+The number of players is doubled until the 95th percentile round trip
+exceeds TARGET_P95_MS or requests fail; the last step that met the target
+is the capacity of that worker count.
+
+The load generator runs on the same machine and competes for CPU with the
+workers, so run it on a machine with at least N + 1 cores to see the
+scaling; on fewer cores the numbers stay flat.
+
+Run with: python -m tests.benchmark_scale_out [max_workers] [max_players]
+"""
+import sys
+
+if __name__ == '__main__':
+    from gevent import monkey
+    monkey.patch_all()
+
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from unittest.mock import patch
+import gevent
+import requests
+from flask import Flask
+from flask_login import LoginManager
+from flask_socketio import SocketIO
+from database import db, User, TTRPGType, Character
+from socketio_handlers import register_socketio_handlers
+
+MAX_WORKERS = 4
+MAX_PLAYERS = 1600
+FIRST_STEP = 25
+THINK_SECONDS = 1.0
+STEP_SECONDS = 5.0
+TARGET_P95_MS = 200
+BASE_PORT = 5600
+
+def create_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SECRET_KEY'] = 'benchmark'
+    db.init_app(app)
+    LoginManager(app)
+    socketio = SocketIO(app, async_mode='gevent')
+    register_socketio_handlers(socketio)
+    return app, socketio
+
+def seed(db_path):
+    app, _ = create_app(db_path)
+    with app.app_context():
+        db.create_all()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        ttrpg_type = TTRPGType(name='Test', json_template='{}', html_template='<table><tr><td id="name"></td></tr></table>')
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Hero',
+                              charactersheet=json.dumps({'name': 'Hero', 'level': 3}))
+        db.session.add(character)
+        db.session.commit()
+        return character.id
+
+def serve(port, db_path):
+    """One worker process; every connection is the benchmark user."""
+    app, socketio = create_app(db_path)
+    with app.app_context():
+        user = User.query.first()
+        db.session.expunge(user)
+    with patch('flask_login.utils._get_user', return_value=user):
+        socketio.run(app, host='127.0.0.1', port=port, log_output=False)
+
+class Player:
+    """A Socket.IO client speaking Engine.IO long-polling."""
+
+    def __init__(self, port, character_id):
+        self.http = requests.Session()
+        self.base = f'http://127.0.0.1:{port}/socket.io/?EIO=4&transport=polling'
+        self.character_id = character_id
+        handshake = self.http.get(self.base, timeout=30).text
+        self.base += '&sid=' + json.loads(handshake[1:])['sid']
+        self.http.post(self.base, data='40', timeout=30)
+        self.poll()
+
+    def poll(self):
+        """Returns the event names of the next poll, answering pings."""
+        payload = self.http.get(self.base, timeout=30).text
+        events = []
+        for packet in payload.split('\x1e'):
+            if packet == '2':
+                self.http.post(self.base, data='3', timeout=30)
+            elif packet.startswith('42'):
+                events.append(json.loads(packet[2:])[0])
+        return events
+
+    def open_sheet(self):
+        start = time.perf_counter()
+        self.http.post(self.base, data='42' + json.dumps(['get_character_sheet', {'character_id': self.character_id}]), timeout=30)
+        while 'character_sheet_data' not in self.poll():
+            pass
+        return time.perf_counter() - start
+
+    def close(self):
+        try:
+            self.http.post(self.base, data='1', timeout=5)
+        except requests.RequestException:
+            pass
+
+    def run(self, until, latencies, errors):
+        # Spread the first requests over the think time.
+        gevent.sleep(random.uniform(0, THINK_SECONDS))
+        while time.monotonic() < until:
+            try:
+                latencies.append(self.open_sheet())
+            except Exception:
+                errors.append(1)
+                return
+            gevent.sleep(THINK_SECONDS)
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/socket.io/?EIO=4&transport=polling', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Worker on port {port} did not start")
+
+def measure(ports, num_players, character_id):
+    """Connects num_players round-robin to the workers and returns (p95 ms, requests/s, errors)."""
+    try:
+        players = [Player(ports[i % len(ports)], character_id) for i in range(num_players)]
+    except requests.RequestException:
+        return None, 0, num_players
+    latencies, errors = [], []
+    until = time.monotonic() + STEP_SECONDS
+    gevent.joinall([gevent.spawn(player.run, until, latencies, errors) for player in players])
+    gevent.joinall([gevent.spawn(player.close) for player in players])
+    if not latencies:
+        return None, 0, len(errors)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+    return p95, len(latencies) / STEP_SECONDS, len(errors)
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else MAX_WORKERS
+    max_players = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_PLAYERS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        character_id = seed(db_path)
+        print(f"{os.cpu_count()} CPUs; target p95 {TARGET_P95_MS} ms, one sheet open per player every {THINK_SECONDS:.0f} s")
+
+        results = []
+        for num_workers in range(1, max_workers + 1):
+            ports = [BASE_PORT + i for i in range(num_workers)]
+            workers = [subprocess.Popen([sys.executable, '-m', 'tests.benchmark_scale_out', '--serve', str(port), db_path])
+                       for port in ports]
+            try:
+                for port in ports:
+                    wait_for_port(port)
+                capacity = 0
+                num_players = FIRST_STEP
+                while num_players <= max_players:
+                    p95, rate, errors = measure(ports, num_players, character_id)
+                    print(f"  {num_workers} workers, {num_players:5d} players: "
+                          + (f"p95 {p95:7.1f} ms, {rate:7.1f} opens/s" if p95 is not None else "no responses")
+                          + (f", {errors} errors" if errors else ""))
+                    if p95 is None or errors or p95 > TARGET_P95_MS:
+                        break
+                    capacity = num_players
+                    num_players *= 2
+                results.append((num_workers, capacity))
+            finally:
+                for worker in workers:
+                    worker.terminate()
+                    worker.wait()
+
+    print("Workers  Players within target")
+    for num_workers, capacity in results:
+        print(f"{num_workers:7d}  {capacity}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(int(sys.argv[2]), sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,120 @@
+"""
+Storage used by character sheet history over a simulated 500-turn campaign:
+a full copy per update (the old behaviour) against snapshots plus JSON
+Patch deltas with unchanged updates skipped.
+
+The model re-sends the whole sheet on most turns. In the simulation 60% of
+those updates are unchanged, 30% change one or two numbers (hit points,
+experience, gold) and 10% add or use up an inventory item.
+
+Also compares the payload of the sheet history event: every version as a
+full sheet against one page of per-version changes.
+
+Run with: python -m tests.benchmark_sheet_history [turns]
+"""
+import copy
+import json
+import random
+import sys
+import time
+from flask import Flask
+from database import db, User, TTRPGType, Character, CharacterSheetHistory
+from bot.sheet_history import record_sheet_update, sheet_history_versions, sheet_history_page
+
+NUM_TURNS = 500
+
+def initial_sheet():
+    return {
+        'name': 'Elowen Brightwater', 'race': 'Half-Elf', 'class': 'Ranger', 'level': 3,
+        'background': 'Outlander', 'alignment': 'Neutral Good', 'experience': 900,
+        'hit_points': {'current': 28, 'max': 28, 'temporary': 0},
+        'armor_class': 15, 'speed': 30, 'initiative': 3, 'proficiency_bonus': 2,
+        'abilities': {name: {'score': score, 'modifier': (score - 10) // 2}
+                      for name, score in [('strength', 12), ('dexterity', 16), ('constitution', 14),
+                                          ('intelligence', 10), ('wisdom', 15), ('charisma', 11)]},
+        'skills': {skill: {'proficient': i % 3 == 0, 'bonus': i % 5} for i, skill in enumerate([
+            'acrobatics', 'animal_handling', 'arcana', 'athletics', 'deception', 'history', 'insight',
+            'intimidation', 'investigation', 'medicine', 'nature', 'perception', 'performance',
+            'persuasion', 'religion', 'sleight_of_hand', 'stealth', 'survival'])},
+        'inventory': [{'name': f'Item {i}', 'quantity': 1, 'weight': 1} for i in range(25)],
+        'currency': {'cp': 34, 'sp': 12, 'gp': 47, 'pp': 0},
+        'spells': [{'name': name, 'level': 1, 'prepared': True} for name in
+                   ['Hunter\'s Mark', 'Cure Wounds', 'Goodberry', 'Fog Cloud']],
+        'features': ['Favored Enemy: Undead', 'Natural Explorer: Forest', 'Fighting Style: Archery',
+                     'Spellcasting', 'Primeval Awareness'],
+        'notes': 'Seeks the lost shrine of the moon in the Whispering Wood. Owes a favour to the ferryman.',
+    }
+
+def campaign(num_turns, rng):
+    sheet = initial_sheet()
+    for turn in range(num_turns):
+        roll = rng.random()
+        if roll < 0.3:
+            sheet['hit_points']['current'] = max(0, sheet['hit_points']['current'] - rng.randint(-5, 8))
+            if rng.random() < 0.5:
+                sheet['experience'] += rng.randint(10, 200)
+            else:
+                sheet['currency']['gp'] += rng.randint(-5, 20)
+        elif roll < 0.4:
+            if rng.random() < 0.5 or len(sheet['inventory']) < 5:
+                sheet['inventory'].append({'name': f'Loot {turn}', 'quantity': 1, 'weight': 2})
+            else:
+                sheet['inventory'].pop(rng.randrange(len(sheet['inventory'])))
+        yield copy.deepcopy(sheet)
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    return app
+
+def main():
+    num_turns = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_TURNS
+    sheets = list(campaign(num_turns, random.Random(42)))
+    full_bytes = sum(len(json.dumps(sheet)) for sheet in sheets)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        ttrpg_type = TTRPGType(name='Bench', json_template='{}', html_template='')
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Elowen', charactersheet='{}')
+        db.session.add(character)
+        db.session.commit()
+
+        start = time.perf_counter()
+        for sheet in sheets:
+            record_sheet_update(character, sheet)
+            db.session.commit()
+        write_ms = (time.perf_counter() - start) / num_turns * 1000
+
+        rows = CharacterSheetHistory.query.all()
+        delta_bytes = sum(len(row.sheet_data) for row in rows)
+        snapshots = sum(1 for row in rows if not row.is_delta)
+
+        start = time.perf_counter()
+        versions = sheet_history_versions(character.id)
+        rebuild_ms = (time.perf_counter() - start) * 1000
+        assert versions[-1][1] == sheets[-1]
+
+        # Payload of the history event: every full sheet at once against
+        # one page of per-version changes.
+        full_payload = len(json.dumps([{'sheet_data': sheet, 'timestamp': 'YYYY-MM-DD HH:MM:SS UTC'}
+                                       for _, sheet in versions]))
+        start = time.perf_counter()
+        page = sheet_history_page(character.id)
+        page_ms = (time.perf_counter() - start) * 1000
+        page_payload = len(json.dumps(page))
+
+    print(f"{num_turns} sheet updates")
+    print(f"Full copy per update: {num_turns} rows, {full_bytes / 1024:.1f} KiB")
+    print(f"Snapshots + deltas:   {len(rows)} rows ({snapshots} snapshots), {delta_bytes / 1024:.1f} KiB "
+          f"({100 * (1 - delta_bytes / full_bytes):.1f}% smaller)")
+    print(f"Write: {write_ms:.2f} ms per update; rebuilding all {len(versions)} versions: {rebuild_ms:.1f} ms")
+    print(f"History event: all full sheets {full_payload / 1024:.1f} KiB in {rebuild_ms:.1f} ms; "
+          f"first page of {len(page['versions'])} diffs {page_payload / 1024:.1f} KiB in {page_ms:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Bytes sent per character sheet open: the sheet event carrying the whole
+html_template (the old behaviour) against the sheet event carrying only the
+template version, with the template fetched once and then served from the
+client's cache.
+
+Uses a full D&D 5e sheet layout as template, since the seeded one is a
+two-row placeholder. Opens go through the real Socket.IO handlers.
+
+Run with: python -m tests.benchmark_sheet_template [opens]
+"""
+import json
+import sys
+from unittest.mock import patch
+from flask import Flask
+from flask_login import LoginManager
+from flask_socketio import SocketIO
+from database import db, User, TTRPGType, Character
+from bot.reference_data import reference_data
+from socketio_handlers import register_socketio_handlers
+
+NUM_OPENS = 20
+
+ABILITIES = ['strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma']
+SKILLS = ['acrobatics', 'animal_handling', 'arcana', 'athletics', 'deception', 'history', 'insight',
+          'intimidation', 'investigation', 'medicine', 'nature', 'perception', 'performance',
+          'persuasion', 'religion', 'sleight_of_hand', 'stealth', 'survival']
+FIELDS = ['name', 'race', 'class', 'level', 'background', 'alignment', 'experience', 'hit_points',
+          'armor_class', 'speed', 'initiative', 'proficiency_bonus', 'inventory', 'currency', 'spells',
+          'features', 'notes']
+
+def sheet_template():
+    rows = ''.join(f'<tr><th class="sheet-label">{field.replace("_", " ").title()}</th>'
+                   f'<td class="sheet-value" id="{field}"></td></tr>' for field in FIELDS + ABILITIES + SKILLS)
+    style = ('<style>.sheet-label{text-align:left;padding:4px 8px;font-weight:bold;color:#5a3e1b}'
+             '.sheet-value{padding:4px 8px;border-bottom:1px solid #d8c8a8;white-space:pre-wrap}</style>')
+    return style + f'<table class="character-sheet">{rows}</table>'
+
+def sheet_data():
+    data = {field: '' for field in FIELDS + ABILITIES + SKILLS}
+    data.update({'name': 'Elowen Brightwater', 'race': 'Half-Elf', 'class': 'Ranger', 'level': 3,
+                 'hit_points': '28/28', 'armor_class': 15, 'strength': 12, 'dexterity': 16})
+    return data
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SECRET_KEY'] = 'benchmark'
+    db.init_app(app)
+    LoginManager(app)
+    socketio = SocketIO(app)
+    register_socketio_handlers(socketio)
+    return app, socketio
+
+def received_bytes(client):
+    return sum(len(json.dumps(packet['args'])) for packet in client.get_received())
+
+def main():
+    num_opens = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_OPENS
+
+    app, socketio = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        ttrpg_type = TTRPGType(name='Dungeons & Dragons 5th Edition', json_template='{}', html_template=sheet_template())
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Elowen',
+                              charactersheet=json.dumps(sheet_data()))
+        db.session.add(character)
+        db.session.commit()
+        reference_data.invalidate()
+
+        with patch('flask_login.utils._get_user', return_value=user):
+            client = socketio.test_client(app)
+            client.get_received()
+
+            legacy_bytes = len(json.dumps([{
+                'sheet_data': sheet_data(),
+                'html_template': ttrpg_type.html_template,
+                'character_id': character.id,
+            }]))
+
+            # First open: the client has no template yet and fetches it.
+            client.emit('get_character_sheet', {'character_id': character.id})
+            sheet_event = client.get_received()
+            first_open = len(json.dumps([sheet_event[0]['args'][0]]))
+            version = sheet_event[0]['args'][0]['template_version']
+            request = {'ttrpg_type_id': ttrpg_type.id, 'version': version, 'character_id': character.id}
+            client.emit('get_sheet_template', request)
+            first_open += len(json.dumps([request])) + received_bytes(client)
+
+            # Later opens: the template version matches the cached one.
+            cached_open = 0
+            for _ in range(num_opens - 1):
+                client.emit('get_character_sheet', {'character_id': character.id})
+                cached_open = received_bytes(client)
+            client.disconnect()
+
+    new_total = first_open + cached_open * (num_opens - 1)
+    print(f"Template: {len(ttrpg_type.html_template)} bytes, sheet data: {len(json.dumps(sheet_data()))} bytes")
+    print(f"Per open (old):           {legacy_bytes} bytes")
+    print(f"First open (new):         {first_open} bytes (sheet event + template fetch)")
+    print(f"Cached open (new):        {cached_open} bytes ({100 * (1 - cached_open / legacy_bytes):.1f}% smaller)")
+    print(f"{num_opens} opens:                {legacy_bytes * num_opens / 1024:.1f} KiB -> {new_total / 1024:.1f} KiB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Simulates N players chatting against a file-backed SQLite database, with
+SQLite's defaults and with the production profile from db_engine.
+
+Every player thread loops over a chat turn: read the history tail, write
+the turn in one transaction and load a page of the history popup.
+
+Run with: python -m tests.benchmark_sqlite_profile [num_players] [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from database import db, User, TTRPGType, Character, Message
+from db_engine import apply_engine_options, register_sqlite_pragmas
+from bot.history import message_history_page
+from bot.unit_of_work import TurnUnitOfWork, GroupCommitter
+
+NUM_PLAYERS = 32
+DURATION = 10
+SEED_MESSAGES_PER_PLAYER = 200
+
+def create_app(path, production):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLITE_PRODUCTION_MODE'] = production
+    apply_engine_options(app)
+    db.init_app(app)
+    register_sqlite_pragmas(app)
+    with app.app_context():
+        db.create_all()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        ttrpg_type = TTRPGType(name='Bench', json_template='{}', html_template='')
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        for i in range(NUM_PLAYERS):
+            character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name=f'Hero {i}', charactersheet='{}')
+            db.session.add(character)
+            db.session.flush()
+            db.session.add_all([Message(character_id=character.id, role='user' if j % 2 else 'model', content='x' * 300)
+                                for j in range(SEED_MESSAGES_PER_PLAYER)])
+        db.session.commit()
+    return app
+
+def run(label, app):
+    committer = GroupCommitter(window_ms=0)
+    stop = time.perf_counter() + DURATION
+    counts = {'turns': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def player(character_id):
+        last_id = 0
+        with app.app_context():
+            while time.perf_counter() < stop:
+                try:
+                    tail = Message.query.filter(Message.character_id == character_id, Message.id > last_id).order_by(Message.id).all()
+                    if tail:
+                        last_id = tail[-1].id
+                    with TurnUnitOfWork(committer) as turn:
+                        turn.add_message(character_id, 'user', 'I search the room.')
+                        turn.add_message(character_id, 'model', 'You find a small brass key. ' * 10)
+                    message_history_page(character_id, limit=50)
+                    with lock:
+                        counts['turns'] += 1
+                except OperationalError:
+                    db.session.rollback()
+                    with lock:
+                        counts['errors'] += 1
+            db.session.remove()
+
+    threads = [threading.Thread(target=player, args=(i + 1,)) for i in range(NUM_PLAYERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"{label:<20} {counts['turns'] / DURATION:>9.0f} {counts['errors']:>8}")
+    with app.app_context():
+        db.engine.dispose()
+
+def main():
+    global NUM_PLAYERS, DURATION
+    if len(sys.argv) > 1:
+        NUM_PLAYERS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        DURATION = int(sys.argv[2])
+
+    print(f"{NUM_PLAYERS} players, {DURATION} s each")
+    print(f"{'profile':<20} {'turns/s':>9} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run('SQLite defaults', create_app(os.path.join(tmp, 'default.db'), production=False))
+        run('production profile', create_app(os.path.join(tmp, 'production.db'), production=True))
+
+if __name__ == '__main__':
+    main()
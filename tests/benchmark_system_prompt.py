@@ -0,0 +1,77 @@
+"""
+Storage and request size of the DM preamble for a number of characters
+started with the seeded prep messages: the whole preamble stored as every
+character's first message (the old behaviour) against one shared system
+prompt per version plus a short kickoff message per character.
+
+Run with: python -m tests.benchmark_system_prompt [characters]
+"""
+import json
+import sys
+from flask import Flask
+from database import db, User, TTRPGType, Character, GeminiPrepMessage, SystemPrompt
+from bot.system_prompt import render_preamble, assign_system_prompt
+from cli import seed_data
+
+NUM_CHARACTERS = 200
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    db.init_app(app)
+    return app
+
+def legacy_preamble(character):
+    """The single user message initiate_chat used to store."""
+    prep_messages = GeminiPrepMessage.query.order_by(GeminiPrepMessage.priority).all()
+    ttrpg_type = character.ttrpg_type
+    system_instructions = []
+    initial_user_prompt = ""
+    for prep_msg in prep_messages:
+        msg = prep_msg.message.replace('[DB.TTRPG.Name]', ttrpg_type.name).replace('[DB.CHARACTER.NAME]', character.character_name).replace('[DB.TTRPG.JSON]', ttrpg_type.json_template)
+        if prep_msg.priority == 2:
+            initial_user_prompt = msg
+        else:
+            system_instructions.append(msg)
+    return "\\n".join(system_instructions) + "\\n" + initial_user_prompt
+
+def main():
+    num_characters = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_CHARACTERS
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_data.callback.__wrapped__()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        db.session.add(user)
+        db.session.commit()
+        ttrpg_type = TTRPGType.query.first()
+
+        legacy_bytes = 0
+        kickoff_bytes = 0
+        for i in range(num_characters):
+            character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name=f'Hero {i}', charactersheet='{}')
+            db.session.add(character)
+            db.session.commit()
+            legacy_bytes += len(legacy_preamble(character).encode('utf-8'))
+            kickoff_bytes += len(assign_system_prompt(character).encode('utf-8'))
+
+        prompts = SystemPrompt.query.all()
+        prompt_bytes = sum(len(prompt.content.encode('utf-8')) for prompt in prompts)
+        system_text, kickoff = render_preamble(character)
+
+        turn = [{'role': 'model', 'parts': ['The tavern is quiet tonight.']}, {'role': 'user', 'parts': ['I order an ale.']}]
+        legacy_request = len(json.dumps({'contents': [{'role': 'user', 'parts': [legacy_preamble(character)]}] + turn}))
+        contents_request = len(json.dumps({'contents': [{'role': 'user', 'parts': [kickoff]}] + turn}))
+        instruction_bytes = len(json.dumps({'system_instruction': system_text}))
+
+    print(f"{num_characters} characters")
+    print(f"Preamble per character:   {legacy_bytes / 1024:.1f} KiB stored")
+    print(f"Shared system prompt:     {len(prompts)} row, {prompt_bytes / 1024:.1f} KiB + kickoff messages {kickoff_bytes / 1024:.1f} KiB "
+          f"({100 * (1 - (prompt_bytes + kickoff_bytes) / legacy_bytes):.1f}% smaller)")
+    print(f"Request per turn (old):   {legacy_request} bytes of contents")
+    print(f"Request per turn (new):   {contents_request} bytes of contents + {instruction_bytes} bytes of system instruction, "
+          f"the same for every character of the TTRPG type")
+
+if __name__ == '__main__':
+    main()
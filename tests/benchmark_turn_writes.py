@@ -0,0 +1,106 @@
+"""
+Measures the write side of chat turns on a file-backed SQLite database:
+the old per-statement commits (user message, sheet update, model message),
+one transaction per turn, and group commit across concurrent turns.
+
+Run with: python -m tests.benchmark_turn_writes [num_threads] [turns_per_thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from flask import Flask
+from database import db, User, TTRPGType, Character, Message
+from bot.character_utils import update_character_sheet
+from bot.unit_of_work import TurnUnitOfWork, GroupCommitter, turn_write_metrics
+
+NUM_THREADS = 16
+TURNS_PER_THREAD = 50
+GROUP_WINDOW_MS = 5
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(google_id='1', email='bench@example.com', name='Bench')
+        ttrpg_type = TTRPGType(name='Bench', json_template='{}', html_template='')
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        for i in range(NUM_THREADS):
+            db.session.add(Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name=f'Hero {i}', charactersheet='{}'))
+        db.session.commit()
+    return app
+
+def legacy_turn(character_id, i):
+    db.session.add(Message(character_id=character_id, role='user', content=f'Action {i}'))
+    db.session.commit()
+    update_character_sheet(character_id, {'hp': i})
+    db.session.add(Message(character_id=character_id, role='model', content=f'Outcome {i}'))
+    db.session.commit()
+    return 3
+
+def unit_of_work_turn(character_id, i, committer):
+    with TurnUnitOfWork(committer) as turn:
+        turn.add_message(character_id, 'user', f'Action {i}')
+        update_character_sheet(character_id, {'hp': i})
+        turn.add_message(character_id, 'model', f'Outcome {i}')
+
+def run(label, app, turn):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(character_id):
+        with app.app_context():
+            for i in range(TURNS_PER_THREAD):
+                start = time.perf_counter()
+                turn(character_id, i)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(character_id + 1,)) for character_id in range(NUM_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{label:<22} {len(latencies) / wall:>9.0f} {p50:>9.2f} {p99:>9.2f}")
+
+def main():
+    global NUM_THREADS, TURNS_PER_THREAD
+    if len(sys.argv) > 1:
+        NUM_THREADS = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        TURNS_PER_THREAD = int(sys.argv[2])
+
+    print(f"{NUM_THREADS} threads x {TURNS_PER_THREAD} turns")
+    print(f"{'mode':<22} {'turns/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(os.path.join(tmp, 'legacy.db'))
+        run('3 commits per turn', app, legacy_turn)
+
+        app = create_app(os.path.join(tmp, 'unit_of_work.db'))
+        direct = GroupCommitter(window_ms=0)
+        run('1 commit per turn', app, lambda c, i: unit_of_work_turn(c, i, direct))
+
+        app = create_app(os.path.join(tmp, 'group.db'))
+        group = GroupCommitter(window_ms=GROUP_WINDOW_MS)
+        group._app = app
+        before = turn_write_metrics.snapshot()
+        run(f'group commit {GROUP_WINDOW_MS} ms', app, lambda c, i: unit_of_work_turn(c, i, group))
+        after = turn_write_metrics.snapshot()
+        turns = after['turns'] - before['turns']
+        commits = after['commits'] - before['commits']
+        print(f"Group commit: {commits} commits for {turns} turns ({commits / turns:.3f} per turn)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import unittest
+from types import SimpleNamespace
+from bot.context_window import build_context, SUMMARY_PREFIX
+
+def make_history(num_turns):
+    history = [{'role': 'user', 'parts': ['You are the DM. ' * 10]}]
+    for i in range(num_turns):
+        history.append({'role': 'model', 'parts': [f'Model turn {i} ' * 10]})
+        history.append({'role': 'user', 'parts': [f'User turn {i} ' * 10]})
+    return history
+
+class BuildContextTestCase(unittest.TestCase):
+    def test_small_history_is_sent_verbatim(self):
+        character = SimpleNamespace(id=1, context_summary=None, context_summary_message_count=0)
+        history = make_history(3)
+
+        prompt, window_start = build_context(character, history, token_budget=10000, min_recent_messages=2)
+
+        self.assertEqual(prompt, history)
+        self.assertEqual(window_start, 1)
+
+    def test_old_turns_are_replaced_by_summary(self):
+        history = make_history(50)
+        _, window_start = build_context(SimpleNamespace(id=1, context_summary=None, context_summary_message_count=0),
+                                        history, token_budget=400, min_recent_messages=2)
+        # The summary has caught up with the window.
+        character = SimpleNamespace(id=1, context_summary='The hero found a sword.', context_summary_message_count=window_start)
+
+        prompt, _ = build_context(character, history, token_budget=400, min_recent_messages=2)
+
+        self.assertEqual(prompt[0], history[0])
+        self.assertEqual(prompt[1]['parts'][0], SUMMARY_PREFIX + 'The hero found a sword.')
+        self.assertEqual(prompt[3:], history[character.context_summary_message_count:])
+        self.assertEqual(history[window_start]['role'], 'user')
+        self.assertLess(len(prompt), len(history))
+
+    def test_messages_not_yet_summarised_are_sent_verbatim(self):
+        character = SimpleNamespace(id=1, context_summary='The hero found a sword.', context_summary_message_count=21)
+        history = make_history(50)
+
+        prompt, window_start = build_context(character, history, token_budget=400, min_recent_messages=2)
+
+        self.assertGreater(window_start, 21)
+        self.assertEqual(prompt[3:], history[21:])
+
+    def test_minimum_recent_messages_kept_over_budget(self):
+        character = SimpleNamespace(id=1, context_summary=None, context_summary_message_count=0)
+        history = make_history(10)
+
+        prompt, window_start = build_context(character, history, token_budget=1, min_recent_messages=4)
+
+        self.assertGreaterEqual(len(history) - window_start, 4)
+        # Nothing is summarised yet, so the older messages are still sent.
+        self.assertEqual(prompt, history)
+
+if __name__ == '__main__':
+    unittest.main()
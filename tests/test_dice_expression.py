@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import patch
+import dice_expression
+from dice_expression import compile_expression
+
+class DiceExpressionTestCase(unittest.TestCase):
+    def test_compound_expression(self):
+        with patch('random.randint', side_effect=[3, 5, 2]):
+            result = compile_expression('2d6 + 1d4 - 3').evaluate()
+        self.assertEqual(result, {"total": 7, "rolls": [3, 5, 2], "dropped": []})
+
+    def test_negative_dice_term(self):
+        with patch('random.randint', side_effect=[10, 4]):
+            result = compile_expression('1d20-1d4').evaluate()
+        self.assertEqual(result['total'], 6)
+
+    def test_keep_highest(self):
+        with patch('random.randint', side_effect=[2, 6, 1, 5]):
+            result = compile_expression('4d6kh3').evaluate()
+        self.assertEqual(result, {"total": 13, "rolls": [6, 5, 2, 1], "dropped": [1]})
+
+    def test_keep_lowest_and_drop_highest(self):
+        with patch('random.randint', side_effect=[15, 4]):
+            self.assertEqual(compile_expression('2d20kl1').evaluate()['total'], 4)
+        with patch('random.randint', side_effect=[15, 4]):
+            self.assertEqual(compile_expression('2d20dh1').evaluate()['total'], 4)
+
+    def test_exploding_dice(self):
+        with patch('random.randint', side_effect=[6, 6, 2]):
+            result = compile_expression('1d6!').evaluate()
+        self.assertEqual(result, {"total": 14, "rolls": [6, 6, 2], "dropped": []})
+
+    def test_reroll_once(self):
+        with patch('random.randint', side_effect=[1, 1, 7]):
+            result = compile_expression('2d8r1').evaluate()
+        self.assertEqual(result, {"total": 8, "rolls": [1, 7], "dropped": [1]})
+
+    def test_percentile_die(self):
+        self.assertEqual(compile_expression('d%').simple_form(), (1, 100, 0))
+
+    def test_evaluate_many_draws_once_per_dice_group(self):
+        with patch('random.choices', side_effect=[[1, 2, 3, 4], [5, 6]]) as choices:
+            results = compile_expression('2d6+1d8').evaluate_many(2)
+        self.assertEqual([r['total'] for r in results], [8, 13])
+        self.assertEqual(choices.call_count, 2)
+
+    def test_compiled_expressions_are_cached(self):
+        self.assertIs(compile_expression('3d6+2'), compile_expression('3d6+2'))
+
+    def test_invalid_expressions(self):
+        for expression in ['', 'invalid', '4d6 junk', '4d6+', '++1d6', '1d6 2', '1d6kh2kl1',
+                           '2d6kh3', '0d6', '1d0', '1d1!', '1d6r6', '5', '1001d6']:
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    compile_expression(expression)
+
+    def test_explosions_are_capped(self):
+        with patch('random.randint', return_value=6):
+            result = compile_expression('1d6!').evaluate()
+        self.assertEqual(len(result['rolls']), dice_expression.MAX_EXPLOSIONS_PER_DIE + 1)
+
+if __name__ == '__main__':
+    unittest.main()
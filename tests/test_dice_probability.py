@@ -0,0 +1,106 @@
+import itertools
+import unittest
+from collections import Counter
+import dice_probability
+from dice_expression import compile_expression
+
+def brute_force(num_dice, num_sides, drop_lowest=False):
+    counts = Counter()
+    for rolls in itertools.product(range(1, num_sides + 1), repeat=num_dice):
+        counts[sum(rolls) - (min(rolls) if drop_lowest else 0)] += 1
+    return counts
+
+def brute_force_expression(dice):
+    """Counts every equally likely outcome of an expression without rerolls or explosions."""
+    expression = compile_expression(dice)
+    counts = Counter({expression.constant: 1})
+    for sign, term in expression.terms:
+        term_counts = Counter()
+        for rolls in itertools.product(range(1, term.sides + 1), repeat=term.count):
+            term_counts[term.apply_keep(list(rolls))[2]] += 1
+        combined = Counter()
+        for total, count in counts.items():
+            for term_total, term_count in term_counts.items():
+                combined[total + sign * term_total] += count * term_count
+        counts = combined
+    return dict(counts)
+
+def as_counts(distribution):
+    return {distribution.offset + i: count for i, count in enumerate(distribution.counts) if count}
+
+class DiceProbabilityTestCase(unittest.TestCase):
+    def test_classic_matches_brute_force(self):
+        distribution = dice_probability.distribution('Classic', '3d6+2')
+        expected = {total + 2: count for total, count in brute_force(3, 6).items()}
+        self.assertEqual(as_counts(distribution), expected)
+
+    def test_heroic_matches_brute_force(self):
+        distribution = dice_probability.distribution('Heroic', '4d6')
+        self.assertEqual(as_counts(distribution), dict(brute_force(4, 6, drop_lowest=True)))
+
+    def test_expressions_match_brute_force(self):
+        for dice in ['2d6+1d4+3', '4d6kh3', '4d6k2', '2d6-1', '5d4kl3', '5d4dh2', '4d6dl1', '1d20-1d4', 'd%-50', '3d6kh0']:
+            with self.subTest(dice=dice):
+                self.assertEqual(as_counts(dice_probability.distribution('Classic', dice)), brute_force_expression(dice))
+
+    def test_rerolls_and_explosions_are_rejected(self):
+        for dice in ['1d6!', '2d6r1', '1d20+1d6!']:
+            with self.subTest(dice=dice):
+                with self.assertRaisesRegex(ValueError, 'exploding'):
+                    dice_probability.distribution('Classic', dice)
+
+    def test_advantage_and_disadvantage(self):
+        advantage = dice_probability.distribution('Classic', '1d20', advantage=True)
+        disadvantage = dice_probability.distribution('Classic', '1d20', disadvantage=True)
+        self.assertAlmostEqual(advantage.probability(20), 39 / 400)
+        self.assertAlmostEqual(disadvantage.probability(20), 1 / 400)
+        self.assertAlmostEqual(advantage.at_least(11), 1 - (10 / 20) ** 2)
+
+    def test_advantage_and_disadvantage_cancel(self):
+        both = dice_probability.distribution('Classic', '1d20', advantage=True, disadvantage=True)
+        self.assertAlmostEqual(both.probability(20), 1 / 20)
+
+    def test_fixed_mechanics(self):
+        self.assertEqual(dice_probability.distribution('High Floor').min_total, 8)
+        self.assertEqual(dice_probability.distribution('Percentile').max_total, 100)
+
+    def test_large_expression(self):
+        distribution = dice_probability.distribution('Classic', '20d20')
+        self.assertEqual(distribution.total_outcomes, 20 ** 20)
+        self.assertAlmostEqual(distribution.mean(), 210)
+
+    def test_invalid_requests(self):
+        with self.assertRaises(ValueError):
+            dice_probability.distribution('Unknown', '1d6')
+        with self.assertRaises(ValueError):
+            dice_probability.distribution('Heroic')
+        with self.assertRaises(ValueError):
+            dice_probability.distribution('Classic', '1000d1000')
+
+    def test_cost_limits(self):
+        for mechanic, dice in [('Classic', '1000d100'), ('Classic', '300d100'), ('Heroic', '100d100'), ('Heroic', '125d40')]:
+            with self.assertRaises(ValueError):
+                dice_probability.distribution(mechanic, dice)
+        self.assertEqual(dice_probability.distribution('Classic', '50d100').max_total, 5000)
+        self.assertEqual(dice_probability.distribution('Heroic', '20d100').max_total, 1900)
+        self.assertEqual(dice_probability.distribution('Classic', '20d40kh10').max_total, 400)
+        with self.assertRaises(ValueError):
+            dice_probability.distribution('Classic', '40d40kh20')
+        with self.assertRaises(ValueError):
+            # Each term is within the limit, together they are not.
+            dice_probability.distribution('Classic', '60d100+60d100')
+
+    def test_odds(self):
+        odds = dice_probability.odds('Classic', '1d20', advantage=True, target='11')
+        self.assertEqual((odds['min'], odds['max'], odds['target']), (1, 20, 11))
+        self.assertAlmostEqual(odds['at_least'], 1 - (10 / 20) ** 2)
+        self.assertAlmostEqual(sum(odds['distribution'].values()), 1)
+
+    def test_odds_invalid_target(self):
+        with self.assertRaises(ValueError):
+            dice_probability.odds('Classic', '1d20', target='high')
+        with self.assertRaises(TypeError):
+            dice_probability.odds('Classic', '1d20', target=[11])
+
+if __name__ == '__main__':
+    unittest.main()
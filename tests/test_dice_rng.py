@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+from sqlalchemy.orm import Query
+import dice_roller
+import dice_rng
+from dice_rng import DiceRNG, create_rng
+from database import db
+from bot.character_utils import reserve_dice_roll
+from tests.test_history import HistoryTestCase
+
+class CreateRngTestCase(unittest.TestCase):
+    def test_same_seed_and_counter_replay(self):
+        first = create_rng('random', 'abc', 3)
+        second = create_rng('random', 'abc', 3)
+        self.assertEqual([first.randint(1, 20) for _ in range(10)], [second.randint(1, 20) for _ in range(10)])
+
+    def test_counters_give_different_streams(self):
+        self.assertNotEqual(dice_rng.derive_seed('abc', 0), dice_rng.derive_seed('abc', 1))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_rng('dice-cup', 'abc', 0)
+
+    @unittest.skipIf(dice_rng.numpy is None, "NumPy is not installed")
+    def test_numpy_backend(self):
+        rng = create_rng('numpy', 'abc', 0)
+        faces = rng.choices(range(1, 7), k=1000)
+        self.assertTrue(all(1 <= face <= 6 for face in faces))
+        self.assertEqual(faces, create_rng('numpy', 'abc', 0).choices(range(1, 7), k=1000))
+
+class DiceRNGBufferTestCase(unittest.TestCase):
+    def test_prepared_generators_are_served_from_the_buffer(self):
+        service = DiceRNG(buffer_size=4)
+        key = (1, 'random', 'abc')
+        service._refill(key, 0)
+
+        rng = service.get(1, 'random', 'abc', 2)
+
+        self.assertEqual(service.hits, 1)
+        self.assertEqual(rng.random(), create_rng('random', 'abc', 2).random())
+
+    def test_miss_creates_generator_inline(self):
+        service = DiceRNG(buffer_size=0)
+        rng = service.get(1, 'random', 'abc', 0)
+        self.assertEqual(service.misses, 1)
+        self.assertEqual(rng.random(), create_rng('random', 'abc', 0).random())
+
+    def test_one_worker_refills_every_roll(self):
+        service = DiceRNG(buffer_size=4)
+        for counter in range(3):
+            service.get(1, 'random', 'abc', counter)
+        worker = service._worker
+        service._refills.join()
+
+        service.get(1, 'random', 'abc', 3)
+        service._refills.join()
+
+        self.assertIs(service._worker, worker)
+        self.assertEqual(service.hits, 1)
+        self.assertEqual(sorted(service._buffers[(1, 'random', 'abc')]), [4, 5, 6, 7])
+
+    def test_system_backend_is_not_buffered(self):
+        service = DiceRNG(buffer_size=4)
+        service.get(1, 'system', None, 0)
+        self.assertIsNone(service._worker)
+
+class ReserveDiceRollTestCase(HistoryTestCase):
+    def test_counter_increments_and_roll_replays(self):
+        backend, seed, first = reserve_dice_roll(self.character.id)
+        _, _, second = reserve_dice_roll(self.character.id)
+        self.assertEqual((first, second), (0, 1))
+        self.assertEqual(db.session.get(type(self.character), self.character.id).dice_roll_counter, 2)
+
+        rolled = dice_roller.roll('Heroic', '4d6', rng=create_rng(backend, seed, second))
+        replayed = dice_roller.roll('Heroic', '4d6', rng=create_rng(backend, seed, second))
+        self.assertEqual(rolled, replayed)
+
+    def test_unknown_character(self):
+        with self.assertRaises(ValueError):
+            reserve_dice_roll(self.character.id + 1)
+
+    def test_seed_stored_by_another_worker_is_kept(self):
+        Character = type(self.character)
+        original_update = Query.update
+
+        def update_after_other_worker(query, *args, **kwargs):
+            # Another worker stores its seed between our read and our update.
+            db.session.execute(db.update(Character).where(Character.id == self.character.id)
+                               .values(dice_seed='other', dice_rng_backend='system'))
+            return original_update(query, *args, **kwargs)
+
+        with patch.object(Query, 'update', update_after_other_worker):
+            backend, seed, counter = reserve_dice_roll(self.character.id)
+
+        self.assertEqual((backend, seed, counter), ('system', 'other', 0))
+
+    def test_unavailable_backend_is_not_reseeded(self):
+        self.character.dice_seed = 'seed'
+        self.character.dice_rng_backend = 'removed'
+        self.character.dice_roll_counter = 5
+        db.session.commit()
+
+        with self.assertLogs('bot.character_utils', level='ERROR'), self.assertRaises(ValueError):
+            reserve_dice_roll(self.character.id)
+
+        character = db.session.get(type(self.character), self.character.id)
+        self.assertEqual((character.dice_seed, character.dice_roll_counter), ('seed', 5))
+
+if __name__ == '__main__':
+    unittest.main()
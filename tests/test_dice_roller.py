@@ -1,3 +1,4 @@
+import random
 import unittest
 from unittest.mock import patch
 import dice_roller
@@ -21,81 +22,79 @@ class TestDiceRoller(unittest.TestCase):
         with self.assertRaises(ValueError):
             dice_roller.roll_dice('invalid')
 
+    def test_roll_dice_rejects_trailing_text(self):
+        with self.assertRaises(ValueError):
+            dice_roller.roll_dice('4d6 and some')
+
+    def test_roll_classic_compound_expression(self):
+        with patch('random.choices', side_effect=[[3, 4], [2]]):
+            results = dice_roller.roll(mechanic='Classic', dice='2d6+1d4+3')
+            self.assertEqual(results[0]['total'], 12)
+
     def test_roll_heroic(self):
-        with patch('random.randint', side_effect=[6, 5, 4, 1]):
-            result = dice_roller._roll_heroic('4d6')
+        with patch('random.choices', return_value=[6, 5, 4, 1]):
+            result = dice_roller.roll(mechanic='Heroic', dice='4d6')[0]
             self.assertEqual(result['total'], 15)
             self.assertEqual(result['rolls'], [6, 5, 4, 1])
             self.assertEqual(result['dropped'], [1])
 
     def test_roll_classic(self):
-        with patch('random.randint', side_effect=[3, 4, 5]):
-            result = dice_roller._roll_classic('3d6')
+        with patch('random.choices', return_value=[3, 4, 5]):
+            result = dice_roller.roll(mechanic='Classic', dice='3d6')[0]
             self.assertEqual(result['total'], 12)
             self.assertEqual(result['rolls'], [3, 4, 5])
 
     def test_roll_high_floor(self):
-        with patch('random.randint', side_effect=[1, 1]):
-            result = dice_roller._roll_high_floor()
+        with patch('random.choices', return_value=[1, 1]):
+            result = dice_roller.roll(mechanic='High Floor')[0]
             self.assertEqual(result['total'], 8) # 1 + 1 + 6
             self.assertEqual(result['rolls'], [1, 1])
 
     def test_roll_percentile(self):
-        with patch('random.randint', return_value=78):
-            result = dice_roller._roll_percentile()
+        with patch('random.choices', return_value=[78]):
+            result = dice_roller.roll(mechanic='Percentile')[0]
             self.assertEqual(result['total'], 78)
             self.assertEqual(result['rolls'], [78])
 
     def test_roll_function_single(self):
-        mock_classic_roll = unittest.mock.Mock(return_value={"total": 10, "rolls": [3, 3, 4]})
-        with patch.dict(dice_roller.MECHANICS, {'Classic': mock_classic_roll}):
+        with patch('dice_roller.roll_batch', return_value=[{"total": 10, "rolls": [3, 3, 4]}]) as roll_batch:
             results = dice_roller.roll(mechanic='Classic', dice='3d6')
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['total'], 10)
-            mock_classic_roll.assert_called_once_with(dice_string='3d6')
+            roll_batch.assert_called_once_with('Classic', '3d6', 1, False, False, None)
 
     def test_roll_function_multiple(self):
-        mock_classic_roll = unittest.mock.Mock(side_effect=[{"total": 10}, {"total": 12}])
-        with patch.dict(dice_roller.MECHANICS, {'Classic': mock_classic_roll}):
+        with patch('dice_roller.roll_batch', return_value=[{"total": 10}, {"total": 12}]) as roll_batch:
             results = dice_roller.roll(mechanic='Classic', dice='3d6', num_rolls=2)
-            self.assertEqual(len(results), 2)
-            self.assertEqual(results[0]['total'], 10)
-            self.assertEqual(results[1]['total'], 12)
-            self.assertEqual(mock_classic_roll.call_count, 2)
+            self.assertEqual([r['total'] for r in results], [10, 12])
+            roll_batch.assert_called_once_with('Classic', '3d6', 2, False, False, None)
 
     def test_roll_function_advantage(self):
-        mock_classic_roll = unittest.mock.Mock(side_effect=[
-            {"total": 10, "rolls": [3, 3, 4]},
-            {"total": 15, "rolls": [5, 5, 5]}
-        ])
-        with patch.dict(dice_roller.MECHANICS, {'Classic': mock_classic_roll}):
+        with patch('random.choices', return_value=[3, 3, 4, 5, 5, 5]):
             results = dice_roller.roll(mechanic='Classic', dice='3d6', advantage=True)
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['total'], 15)
-            self.assertEqual(mock_classic_roll.call_count, 2)
+            self.assertEqual([r['total'] for r in results[0]['all_rolls']], [10, 15])
 
     def test_roll_function_disadvantage(self):
-        mock_classic_roll = unittest.mock.Mock(side_effect=[
-            {"total": 10, "rolls": [3, 3, 4]},
-            {"total": 15, "rolls": [5, 5, 5]}
-        ])
-        with patch.dict(dice_roller.MECHANICS, {'Classic': mock_classic_roll}):
+        with patch('random.choices', return_value=[3, 3, 4, 5, 5, 5]):
             results = dice_roller.roll(mechanic='Classic', dice='3d6', disadvantage=True)
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['total'], 10)
-            self.assertEqual(mock_classic_roll.call_count, 2)
 
     def test_roll_function_advantage_and_disadvantage(self):
-        mock_classic_roll = unittest.mock.Mock(return_value={"total": 12, "rolls": [4, 4, 4]})
-        with patch.dict(dice_roller.MECHANICS, {'Classic': mock_classic_roll}):
+        with patch('random.choices', return_value=[4, 4, 4]) as choices:
             results = dice_roller.roll(mechanic='Classic', dice='3d6', advantage=True, disadvantage=True)
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0]['total'], 12)
-            mock_classic_roll.assert_called_once_with(dice_string='3d6')
+            self.assertNotIn('all_rolls', results[0])
+            self.assertEqual(choices.call_args.kwargs['k'], 3)
 
     def test_roll_function_unknown_mechanic(self):
         with self.assertRaises(ValueError):
             dice_roller.roll(mechanic='UnknownMechanic', dice='1d6')
+        with self.assertRaises(ValueError):
+            dice_roller.roll_batch('UnknownMechanic', '1d6')
 
     def test_roll_function_missing_dice_string(self):
         with self.assertRaises(ValueError):
@@ -103,5 +102,42 @@ class TestDiceRoller(unittest.TestCase):
         with self.assertRaises(ValueError):
             dice_roller.roll(mechanic='Classic')
 
+    def test_roll_batch_heroic(self):
+        with patch('random.choices', return_value=[6, 5, 4, 1, 2, 2, 3, 3]):
+            results = dice_roller.roll_batch('Heroic', '4d6', num_rolls=2)
+            self.assertEqual(results, [
+                {"total": 15, "rolls": [6, 5, 4, 1], "dropped": [1]},
+                {"total": 8, "rolls": [3, 3, 2, 2], "dropped": [2]}
+            ])
+
+    def test_roll_batch_classic_with_modifier(self):
+        with patch('random.choices', return_value=[10, 5]) as choices:
+            results = dice_roller.roll_batch('Classic', '2d10+5')
+            self.assertEqual(results, [{"total": 20, "rolls": [10, 5], "dropped": []}])
+            self.assertEqual(choices.call_args.kwargs['k'], 2)
+
+    def test_roll_batch_advantage(self):
+        with patch('random.choices', return_value=[3, 20]):
+            results = dice_roller.roll_batch('Classic', '1d20', advantage=True)
+            self.assertEqual(results[0]['total'], 20)
+            self.assertEqual([r['total'] for r in results[0]['all_rolls']], [3, 20])
+            self.assertNotIn('all_rolls', results[0]['all_rolls'][1])
+
+    def test_roll_batch_disadvantage(self):
+        with patch('random.choices', return_value=[3, 20]):
+            results = dice_roller.roll_batch('Percentile', disadvantage=True)
+            self.assertEqual(results[0]['total'], 3)
+
+    def test_roll_uses_batch_for_built_in_mechanics(self):
+        with patch('dice_roller.roll_batch', return_value=[{"total": 7}]) as roll_batch:
+            results = dice_roller.roll(mechanic='High Floor', num_rolls=3)
+            self.assertEqual(results, [{"total": 7}])
+            roll_batch.assert_called_once_with('High Floor', None, 3, False, False, None)
+
+    def test_roll_with_seeded_rng_is_reproducible(self):
+        first = dice_roller.roll(mechanic='Heroic', dice='4d6', num_rolls=6, rng=random.Random(7))
+        second = dice_roller.roll(mechanic='Heroic', dice='4d6', num_rolls=6, rng=random.Random(7))
+        self.assertEqual(first, second)
+
 if __name__ == '__main__':
     unittest.main()
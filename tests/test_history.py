@@ -0,0 +1,181 @@
+import unittest
+from flask import Flask
+from sqlalchemy import event
+from database import db, User, TTRPGType, Character, Message
+from bot.history import HistoryCache, message_history_page, VERSION_NAME
+from bot.reference_data import reference_data, bump_version
+from bot.render_cache import render_cache
+
+def create_test_app():
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(test_app)
+    return test_app
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        # Each test has its own database, so the cached copy must not carry over.
+        reference_data.invalidate()
+        self.addCleanup(reference_data.invalidate)
+
+        user = User(google_id='1', email='player@example.com', name='Player')
+        ttrpg_type = TTRPGType(name='Test', json_template='{}', html_template='')
+        db.session.add_all([user, ttrpg_type])
+        db.session.commit()
+        self.character = Character(user_id=user.id, ttrpg_type_id=ttrpg_type.id, character_name='Hero', charactersheet='{}')
+        db.session.add(self.character)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_message(self, role, content):
+        message = Message(character_id=self.character.id, role=role, content=content)
+        db.session.add(message)
+        db.session.commit()
+        return message
+
+class HistoryCacheTestCase(HistoryTestCase):
+    def test_loads_existing_messages_in_order(self):
+        self.add_message('user', 'Hello')
+        self.add_message('model', 'Greetings')
+        cache = HistoryCache()
+
+        history = cache.get(self.character.id)
+
+        self.assertEqual(history, [
+            {'role': 'user', 'parts': ['Hello']},
+            {'role': 'model', 'parts': ['Greetings']},
+        ])
+
+    def test_appends_new_messages(self):
+        self.add_message('user', 'Hello')
+        cache = HistoryCache()
+        cache.get(self.character.id)
+
+        self.add_message('model', 'Greetings')
+        history = cache.get(str(self.character.id))
+
+        self.assertEqual([entry['parts'][0] for entry in history], ['Hello', 'Greetings'])
+
+    def test_evicts_least_recently_used(self):
+        cache = HistoryCache(max_characters=1)
+        cache.get(self.character.id)
+        cache.get(self.character.id + 1)
+
+        self.assertEqual(list(cache._histories), [self.character.id + 1])
+
+    def test_invalidate(self):
+        self.add_message('user', 'Hello')
+        cache = HistoryCache()
+        cache.get(self.character.id)
+
+        cache.invalidate(self.character.id)
+
+        self.assertNotIn(self.character.id, cache._histories)
+
+    def test_tail_query_does_not_hold_cache_lock(self):
+        cache = HistoryCache()
+        held = []
+        def record(orm_execute_state):
+            held.append(cache._lock.locked())
+        event.listen(db.session, 'do_orm_execute', record)
+        self.addCleanup(event.remove, db.session, 'do_orm_execute', record)
+
+        cache.get(self.character.id)
+
+        self.assertTrue(held)
+        self.assertFalse(any(held))
+
+    def test_deleting_a_character_clears_other_workers(self):
+        self.add_message('user', 'alice secret')
+        worker_a, worker_b = HistoryCache(), HistoryCache()
+        worker_a.get(self.character.id)
+        worker_b.get(self.character.id)
+
+        # Worker A deletes the character, as the delete_character route does,
+        # and a new character gets the freed id.
+        character_id, user_id, ttrpg_type_id = self.character.id, self.character.user_id, self.character.ttrpg_type_id
+        db.session.delete(self.character)
+        bump_version(VERSION_NAME)
+        db.session.commit()
+        worker_a.invalidate(character_id)
+        db.session.add(Character(id=character_id, user_id=user_id, ttrpg_type_id=ttrpg_type_id,
+                                 character_name='Other', charactersheet='{}'))
+        db.session.add(Message(character_id=character_id, role='user', content='bob hello'))
+        db.session.commit()
+
+        self.assertEqual(worker_b.get(character_id), [{'role': 'user', 'parts': ['bob hello']}])
+
+    def test_unchanged_version_keeps_history(self):
+        self.add_message('user', 'Hello')
+        cache = HistoryCache()
+        history = cache.get(self.character.id)
+
+        self.assertIs(cache.get(self.character.id), history)
+
+class MessageHistoryPageTestCase(HistoryTestCase):
+    def test_pages_newest_first(self):
+        for i in range(5):
+            self.add_message('user', f'Message {i}')
+
+        first_page = message_history_page(self.character.id, limit=2)
+        second_page = message_history_page(self.character.id, before_id=first_page['before_id'], limit=2)
+        last_page = message_history_page(self.character.id, before_id=second_page['before_id'], limit=2)
+
+        self.assertEqual([msg['content'] for msg in first_page['history']], ['Message 3', 'Message 4'])
+        self.assertEqual([msg['content'] for msg in second_page['history']], ['Message 1', 'Message 2'])
+        self.assertEqual([msg['content'] for msg in last_page['history']], ['Message 0'])
+        self.assertTrue(second_page['has_more'])
+        self.assertFalse(last_page['has_more'])
+        self.assertIsNone(last_page['before_id'])
+
+    def test_cursor_from_other_character_is_rejected(self):
+        message = self.add_message('user', 'Hello')
+
+        page = message_history_page(self.character.id + 1, before_id=message.id)
+
+        self.assertEqual(page['history'], [])
+
+    def test_reused_message_id_does_not_show_old_text(self):
+        render_cache.clear()
+        self.addCleanup(render_cache.clear)
+        message = self.add_message('user', 'alice secret 1')
+        message_history_page(self.character.id)
+        message_id = message.id
+        db.session.delete(message)
+        db.session.commit()
+
+        db.session.add(Message(id=message_id, character_id=self.character.id, role='user', content='bob hello'))
+        db.session.commit()
+
+        self.assertEqual(message_history_page(self.character.id)['history'][0]['content'], 'bob hello')
+
+    def test_invalid_limit_uses_default_page_size(self):
+        for i in range(3):
+            self.add_message('user', f'Message {i}')
+
+        for limit in ('abc', None, {'n': 1}):
+            page = message_history_page(self.character.id, limit=limit)
+            self.assertEqual(len(page['history']), 3)
+
+    def test_string_cursor_is_parsed_and_invalid_cursor_is_ignored(self):
+        for i in range(3):
+            self.add_message('user', f'Message {i}')
+        first_page = message_history_page(self.character.id, limit=2)
+
+        page = message_history_page(self.character.id, before_id=str(first_page['before_id']), limit=2)
+        self.assertEqual([msg['content'] for msg in page['history']], ['Message 0'])
+        for before_id in ('abc', {'id': 1}, [1]):
+            page = message_history_page(self.character.id, before_id=before_id)
+            self.assertEqual(len(page['history']), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import datetime
+import json
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from database import db, Job
+from bot import jobs
+from bot.jobs import enqueue, claim_next, run_job, requeue_stale, purge_finished, job_stats, job_handler, JobWorker
+
+def create_test_app():
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    test_app.config['JOB_RETRY_BASE_SECONDS'] = 10
+    test_app.config['JOB_RETRY_MAX_SECONDS'] = 60
+    db.init_app(test_app)
+    return test_app
+
+calls = []
+
+@job_handler('test_ok')
+def _ok(value=None):
+    calls.append(value)
+
+@job_handler('test_fail')
+def _fail():
+    raise RuntimeError('model unavailable')
+
+class JobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        calls.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_dedupe_key_keeps_one_pending_job_with_latest_payload(self):
+        first = enqueue('test_ok', {'value': 1}, dedupe_key='recap:1', priority=100)
+        second = enqueue('test_ok', {'value': 2}, dedupe_key='recap:1', priority=10)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.query.count(), 1)
+        self.assertEqual(json.loads(second.payload), {'value': 2})
+        self.assertEqual(second.priority, 10)
+
+    def test_running_job_does_not_absorb_new_requests(self):
+        enqueue('test_ok', {'value': 1}, dedupe_key='recap:1')
+        running = claim_next('worker')
+        enqueue('test_ok', {'value': 2}, dedupe_key='recap:1')
+
+        self.assertEqual(Job.query.filter_by(status='pending').count(), 1)
+        # The new job waits until the running one with the same key is finished.
+        self.assertIsNone(claim_next('worker'))
+        run_job(running)
+        self.assertIsNotNone(claim_next('worker'))
+
+    def test_claims_by_priority(self):
+        enqueue('test_ok', {'value': 'background'}, priority=jobs.PRIORITY_BACKGROUND)
+        enqueue('test_ok', {'value': 'interactive'}, priority=jobs.PRIORITY_INTERACTIVE)
+
+        job = claim_next('worker')
+
+        self.assertEqual(json.loads(job.payload), {'value': 'interactive'})
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.attempts, 1)
+
+    def test_below_priority_leaves_background_jobs(self):
+        enqueue('test_ok', priority=jobs.PRIORITY_BACKGROUND)
+
+        self.assertIsNone(claim_next('worker', below_priority=jobs.PRIORITY_BACKGROUND))
+        self.assertIsNotNone(claim_next('worker'))
+
+    def test_job_is_claimed_once(self):
+        enqueue('test_ok')
+
+        self.assertIsNotNone(claim_next('a'))
+        self.assertIsNone(claim_next('b'))
+
+    def test_successful_job(self):
+        enqueue('test_ok', {'value': 7})
+
+        self.assertTrue(run_job(claim_next('worker')))
+
+        self.assertEqual(calls, [7])
+        job = Job.query.one()
+        self.assertEqual(job.status, 'done')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_backs_off_then_fails(self):
+        enqueue('test_fail', max_attempts=2)
+
+        before = datetime.datetime.utcnow()
+        self.assertFalse(run_job(claim_next('worker')))
+        job = Job.query.one()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.last_error, 'model unavailable')
+        self.assertGreaterEqual(job.run_after, before + datetime.timedelta(seconds=10))
+        self.assertIsNone(claim_next('worker'))
+
+        job.run_after = before
+        db.session.commit()
+        self.assertFalse(run_job(claim_next('worker')))
+        self.assertEqual(Job.query.one().status, 'failed')
+
+    def test_retry_delay_is_exponential_and_capped(self):
+        self.assertEqual([jobs.retry_delay(n) for n in (1, 2, 3, 4, 5)], [10, 20, 40, 60, 60])
+
+    def test_unknown_kind_fails(self):
+        enqueue('no_such_kind', max_attempts=1)
+
+        self.assertFalse(run_job(claim_next('worker')))
+        self.assertIn('no_such_kind', Job.query.one().last_error)
+
+    def test_requeue_stale(self):
+        enqueue('test_ok')
+        job = claim_next('worker')
+        job.locked_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        db.session.commit()
+
+        self.assertEqual(requeue_stale(600), 1)
+        self.assertEqual(Job.query.one().status, 'pending')
+
+    def test_requeue_stale_does_not_write_without_stale_jobs(self):
+        enqueue('test_ok')
+        claim_next('worker')
+
+        with patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+            self.assertEqual(requeue_stale(600), 0)
+        commit.assert_not_called()
+
+    def test_worker_sweeps_once_per_half_lease(self):
+        worker = JobWorker()
+        worker.lease_seconds = 600
+        with patch('bot.jobs.time.monotonic', side_effect=[1000.0, 1002.0, 1299.0, 1300.0]):
+            self.assertEqual([worker._sweep_due() for _ in range(4)], [True, False, False, True])
+
+    def test_purge_finished(self):
+        enqueue('test_ok')
+        run_job(claim_next('worker'))
+        Job.query.one().finished_at = datetime.datetime.utcnow() - datetime.timedelta(days=10)
+        db.session.commit()
+
+        self.assertEqual(purge_finished(7), 1)
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_worker_runs_pending_jobs(self):
+        enqueue('test_ok', {'value': 1})
+        enqueue('test_ok', {'value': 2})
+
+        self.assertEqual(JobWorker().run_pending(), 2)
+        self.assertEqual(calls, [1, 2])
+
+    def test_worker_defers_background_jobs_while_chat_waits(self):
+        enqueue('test_ok', {'value': 1}, priority=jobs.PRIORITY_BACKGROUND)
+
+        with patch.object(jobs.llm_dispatcher, 'stats', return_value={'queue_depth': 3}):
+            self.assertEqual(JobWorker().run_pending(), 0)
+        self.assertEqual(JobWorker().run_pending(), 1)
+
+    def test_stats(self):
+        enqueue('test_ok', dedupe_key='recap:1')
+        enqueue('test_fail')
+
+        stats = job_stats()
+
+        self.assertEqual(stats['counts'], {'pending': {'test_ok': 1, 'test_fail': 1}})
+        self.assertEqual([job['kind'] for job in stats['pending']], ['test_ok', 'test_fail'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+from bot.llm_dispatch import LLMDispatcher
+
+class LLMDispatcherTestCase(unittest.TestCase):
+    def test_call_returns_result(self):
+        dispatcher = LLMDispatcher(max_workers=2)
+        self.assertEqual(dispatcher.call(lambda a, b: a + b, 2, b=3), 5)
+        self.assertEqual(dispatcher.stats()['completed'], 1)
+
+    def test_call_propagates_exceptions(self):
+        dispatcher = LLMDispatcher(max_workers=2)
+
+        def fail():
+            raise RuntimeError('quota exceeded')
+
+        with self.assertRaises(RuntimeError):
+            dispatcher.call(fail)
+        stats = dispatcher.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
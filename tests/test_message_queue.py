@@ -0,0 +1,105 @@
+import json
+import unittest
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+from bot.message_queue import LocalManager, socketio_options, user_room, emit_to_user
+
+def create_worker(channel):
+    """One web worker: its own app and Socket.IO server, sharing the channel."""
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', SOCKETIO_MESSAGE_QUEUE='local://', SOCKETIO_CHANNEL=channel)
+    socketio = SocketIO(app, async_mode='threading', **socketio_options(app))
+
+    @socketio.on('connect')
+    def handle_connect():
+        join_room(user_room(1))
+
+    @socketio.on('ping_all')
+    def handle_ping_all(data):
+        socketio.emit('pong', data, to=user_room(1))
+
+    return app, socketio
+
+class PollingClient:
+    """
+    A Socket.IO client speaking Engine.IO long-polling to a worker's WSGI
+    app. Flask-SocketIO's test client refuses to run with a message queue.
+    """
+
+    def __init__(self, app):
+        self.http = app.test_client()
+        handshake = self.http.get('/socket.io/?EIO=4&transport=polling').get_data(as_text=True)
+        self.sid = json.loads(handshake[1:])['sid']
+        self._post('40')
+        self.receive()
+
+    def _url(self):
+        return f'/socket.io/?EIO=4&transport=polling&sid={self.sid}'
+
+    def _post(self, data):
+        self.http.post(self._url(), data=data)
+
+    def emit(self, event, data):
+        self._post('42' + json.dumps([event, data]))
+
+    def receive(self):
+        """Waits for the next poll and returns its events as (name, args) tuples."""
+        payload = self.http.get(self._url()).get_data(as_text=True)
+        events = []
+        for packet in payload.split('\x1e'):
+            if packet.startswith('42'):
+                name, *args = json.loads(packet[2:])
+                events.append((name, args))
+        return events
+
+class MessageQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.channel = f"test-{self.id()}"
+        self.addCleanup(LocalManager._channels.pop, self.channel, None)
+
+    def test_no_queue_by_default(self):
+        self.assertEqual(socketio_options(Flask(__name__)), {})
+
+    def test_redis_url_is_passed_to_flask_socketio(self):
+        app = Flask(__name__)
+        app.config['SOCKETIO_MESSAGE_QUEUE'] = 'redis://localhost:6379/0'
+
+        self.assertEqual(socketio_options(app), {'message_queue': 'redis://localhost:6379/0', 'channel': 'dndadventure'})
+
+    def test_emit_reaches_client_on_another_worker(self):
+        app_a, _ = create_worker(self.channel)
+        app_b, _ = create_worker(self.channel)
+        client_a = PollingClient(app_a)
+        client_b = PollingClient(app_b)
+
+        client_b.emit('ping_all', {'n': 1})
+
+        self.assertIn(('pong', [{'n': 1}]), client_a.receive())
+
+    def test_emit_to_user_from_background_work(self):
+        app_a, _ = create_worker(self.channel)
+        app_b, _ = create_worker(self.channel)
+        client_a = PollingClient(app_a)
+
+        with app_b.app_context():
+            self.assertTrue(emit_to_user(1, 'recap_ready', {'character_id': 7}))
+
+        self.assertEqual(client_a.receive(), [('recap_ready', [{'character_id': 7}])])
+
+    def test_emit_to_user_without_socketio(self):
+        with Flask(__name__).app_context():
+            self.assertFalse(emit_to_user(1, 'recap_ready', {}))
+
+    def test_channels_are_separate(self):
+        self.addCleanup(LocalManager._channels.pop, self.channel + '-other', None)
+        sender = LocalManager(channel=self.channel)
+        same = LocalManager(channel=self.channel)
+        other = LocalManager(channel=self.channel + '-other')
+
+        sender._publish({'method': 'emit'})
+
+        self.assertEqual(same._inbox.get_nowait(), {'method': 'emit'})
+        self.assertTrue(other._inbox.empty())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import subprocess
+import sys
+import textwrap
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from flask import Flask
+from database import db
+from bot.model_registry import ModelRegistry
+from tests.test_history import create_test_app
+
+class FakeModel:
+    built = 0
+
+    def __init__(self, model_name, **kwargs):
+        FakeModel.built += 1
+        self.model_name = f"models/{model_name}"
+        self.kwargs = kwargs
+
+    def generate_content(self, contents):
+        if contents == 'fail':
+            raise RuntimeError('unavailable')
+        return SimpleNamespace(text='ok')
+
+class ModelRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['GEMINI_MODEL'] = 'gemini-a'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        FakeModel.built = 0
+        patcher = patch('bot.model_registry.genai.GenerativeModel', FakeModel)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = ModelRegistry()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_reuses_client_for_same_settings(self):
+        prompt = SimpleNamespace(id=1, content='You are the GM.')
+
+        first = self.registry.get(system_prompt=prompt)
+        second = self.registry.get(system_prompt=SimpleNamespace(id=1, content='You are the GM.'))
+
+        self.assertIs(first, second)
+        self.assertEqual(FakeModel.built, 1)
+        self.assertEqual(first.model.kwargs, {'system_instruction': 'You are the GM.'})
+
+    def test_separate_clients_per_key(self):
+        base = self.registry.get()
+        self.assertIsNot(base, self.registry.get(system_prompt=SimpleNamespace(id=2, content='x')))
+        self.assertIsNot(base, self.registry.get(generation_config={'temperature': 0.2}))
+        self.assertIs(self.registry.get(generation_config={'temperature': 0.2}),
+                      self.registry.get(generation_config={'temperature': 0.2}))
+        self.assertEqual(FakeModel.built, 3)
+
+    def test_model_change_builds_new_client(self):
+        old = self.registry.get()
+        self.app.config['GEMINI_MODEL'] = 'gemini-b'
+        self.registry.clear()
+
+        new = self.registry.get()
+
+        self.assertIsNot(old, new)
+        self.assertEqual(new.model_name, 'models/gemini-b')
+
+    def test_least_recently_used_client_is_dropped(self):
+        registry = ModelRegistry(max_clients=2)
+        first = registry.get('one')
+        registry.get('two')
+        registry.get('one')
+        registry.get('three')
+
+        self.assertIs(registry.get('one'), first)
+        self.assertEqual([client['model'] for client in registry.stats()['clients']], ['models/three', 'models/one'])
+
+    def test_counts_calls_and_errors(self):
+        client = self.registry.get()
+        client.generate_content('hello')
+        with self.assertRaises(RuntimeError):
+            client.generate_content('fail')
+
+        stats = self.registry.stats()['clients'][0]
+        self.assertEqual((stats['calls'], stats['errors']), (2, 1))
+        self.assertIsNotNone(stats['average_latency_ms'])
+
+    def test_concurrent_calls_through_the_dispatcher(self):
+        # The dispatcher's threads are native only under gevent's monkey
+        # patching, so this runs in a fresh, patched interpreter.
+        script = textwrap.dedent('''
+            from gevent import monkey
+            monkey.patch_all()
+            import time
+            import gevent
+            from bot.llm_dispatch import LLMDispatcher
+            from bot.model_registry import PooledModel
+
+            class EchoModel:
+                def generate_content(self, contents):
+                    return contents
+
+            model = PooledModel(EchoModel(), 'echo', None, None)
+
+            def hold_lock(i):
+                # Makes the calls in between contend for the counters' lock.
+                with model._lock:
+                    time.sleep(0.02)
+                return i
+
+            dispatcher = LLMDispatcher(max_workers=4)
+            tasks = [gevent.spawn(dispatcher.call, hold_lock if i % 2 else model.generate_content, i) for i in range(8)]
+            gevent.joinall(tasks, timeout=5)
+            assert all(task.ready() for task in tasks), f"{sum(not task.ready() for task in tasks)} calls are stuck"
+            assert [task.value for task in tasks] == list(range(8))
+            assert model.stats()['calls'] == 4
+        ''')
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+class SettingsSyncTestCase(unittest.TestCase):
+    """Two registries stand in for two worker processes sharing the database."""
+
+    def setUp(self):
+        self.app = create_test_app()
+        self.app.config['GEMINI_MODEL'] = 'gemini-a'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        patcher = patch('bot.model_registry.genai.GenerativeModel', FakeModel)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin_worker = ModelRegistry(poll_seconds=60)
+        self.other_worker = ModelRegistry(poll_seconds=60)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_model_change_reaches_other_worker_after_poll_interval(self):
+        with patch('bot.model_registry.time.monotonic', return_value=1000.0):
+            old = self.other_worker.get()
+
+        self.admin_worker.settings_changed()
+        with patch('bot.model_registry.time.monotonic', return_value=1030.0):
+            self.assertIs(self.other_worker.get(), old)
+
+        with patch('bot.model_registry.time.monotonic', return_value=1061.0), \
+             patch.object(self.app.config, 'from_pyfile') as from_pyfile:
+            from_pyfile.side_effect = lambda *args, **kwargs: self.app.config.update(GEMINI_MODEL='gemini-b')
+            new = self.other_worker.get()
+
+        from_pyfile.assert_called_once_with('config.py', silent=True)
+        self.assertIsNot(new, old)
+        self.assertEqual(new.model_name, 'models/gemini-b')
+
+    def test_worker_that_saved_the_change_does_not_reload(self):
+        self.admin_worker.settings_changed()
+
+        with patch.object(self.app.config, 'from_pyfile') as from_pyfile:
+            self.admin_worker.get()
+
+        from_pyfile.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from flask import Flask
+from bot.rate_limit import ModelLimiter, RateLimiter, retry_after, backoff_delay, estimate_tokens, generate, rate_limiter
+
+class RetryAfterTestCase(unittest.TestCase):
+    def test_attribute(self):
+        self.assertEqual(retry_after(SimpleNamespace(retry_after=7)), 7.0)
+
+    def test_retry_info_detail(self):
+        error = SimpleNamespace(details=[SimpleNamespace(retry_delay=SimpleNamespace(seconds=12, nanos=500000000))])
+        self.assertEqual(retry_after(error), 12.5)
+
+    def test_message(self):
+        self.assertEqual(retry_after(Exception('429 Quota exceeded. Please retry in 21.5s.')), 21.5)
+        self.assertEqual(retry_after(Exception('retry_delay { seconds: 40 }')), 40.0)
+
+    def test_no_hint(self):
+        self.assertIsNone(retry_after(Exception('Internal error')))
+
+class BackoffTestCase(unittest.TestCase):
+    def test_jittered_exponential_and_capped(self):
+        for attempt in range(6):
+            for _ in range(20):
+                delay = backoff_delay(attempt, base=1, cap=10)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, min(10, 2 ** attempt))
+
+    def test_respects_retry_after(self):
+        delay = backoff_delay(0, Exception('Please retry in 15s'), base=1, cap=10)
+        self.assertGreaterEqual(delay, 15)
+
+class ModelLimiterTestCase(unittest.TestCase):
+    def test_unlimited_never_waits(self):
+        limiter = ModelLimiter('model')
+        for _ in range(100):
+            with limiter.slot('user', 1000):
+                pass
+        self.assertEqual(limiter.snapshot()['throttled_requests'], 0)
+
+    def test_requests_per_minute(self):
+        limiter = ModelLimiter('model', rpm=6000)
+        limiter._request_allowance = 0
+
+        waited = limiter.acquire('user', 1)
+
+        # One request refills in 60 / 6000 s.
+        self.assertGreaterEqual(waited, 0.005)
+        self.assertEqual(limiter.snapshot()['throttled_requests'], 1)
+
+    def test_tokens_per_minute_charges_actual_usage(self):
+        limiter = ModelLimiter('model', tpm=1000)
+        with limiter.slot('user', 100) as slot:
+            slot.actual_tokens = 400
+
+        snapshot = limiter.snapshot()
+        self.assertEqual(snapshot['tokens_last_minute'], 400)
+        self.assertAlmostEqual(snapshot['tpm_utilisation'], 0.4)
+        self.assertLess(limiter._token_allowance, 601)
+
+    def test_waiters_are_admitted_round_robin_per_user(self):
+        limiter = ModelLimiter('model', max_in_flight=1)
+        limiter.acquire('holder', 1)
+        order = []
+
+        def request(user):
+            with limiter.slot(user, 1):
+                order.append(user)
+
+        threads = []
+        for user in ('a', 'a', 'a', 'b'):
+            thread = threading.Thread(target=request, args=(user,))
+            thread.start()
+            threads.append(thread)
+            while limiter.snapshot()['waiting'] < len(threads):
+                time.sleep(0.001)
+
+        limiter.release(1)
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ['a', 'b', 'a', 'a'])
+        self.assertEqual(limiter.snapshot()['in_flight'], 0)
+
+    def test_pause_holds_requests(self):
+        limiter = ModelLimiter('model')
+        limiter.pause(0.05)
+
+        waited = limiter.acquire('user', 1)
+
+        self.assertGreaterEqual(waited, 0.04)
+        self.assertEqual(limiter.snapshot()['rate_limit_errors'], 1)
+
+class RateLimiterTestCase(unittest.TestCase):
+    def test_limiters_are_per_model_with_overrides(self):
+        app = Flask(__name__)
+        app.config.update(GEMINI_RPM=10, GEMINI_RATE_LIMITS={'fast': {'rpm': 100}})
+        limiter = RateLimiter()
+        limiter.init_app(app)
+
+        self.assertIs(limiter.for_model('models/slow'), limiter.for_model('slow'))
+        self.assertEqual(limiter.for_model('slow').rpm, 10)
+        self.assertEqual(limiter.for_model('fast').rpm, 100)
+        self.assertEqual(set(limiter.stats()), {'slow', 'fast'})
+
+    def test_limits_are_shared_between_worker_processes(self):
+        app = Flask(__name__)
+        app.config.update(GEMINI_RPM=10, GEMINI_TPM=0, GEMINI_MAX_IN_FLIGHT=3, WORKER_PROCESSES=4)
+        limiter = RateLimiter()
+        limiter.init_app(app)
+
+        model = limiter.for_model('shared')
+        self.assertEqual((model.rpm, model.tpm, model.max_in_flight), (2, 0, 1))
+
+class QuotaError(Exception):
+    code = 429
+
+class GenerateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_rate_limit_error_pauses_model(self):
+        def fail(contents):
+            raise QuotaError('Please retry in 0.01s')
+        model = SimpleNamespace(model_name='models/quota-test', generate_content=fail)
+
+        with self.assertRaises(QuotaError):
+            generate(model, 'Hello', 'user')
+
+        self.assertEqual(rate_limiter.for_model('quota-test').rate_limit_errors, 1)
+
+    def test_records_reported_usage(self):
+        response = SimpleNamespace(text='Hi', usage_metadata=SimpleNamespace(total_token_count=50))
+        model = SimpleNamespace(model_name='models/usage-test', generate_content=lambda contents: response)
+
+        self.assertIs(generate(model, 'Hello', 'user'), response)
+        self.assertEqual(rate_limiter.for_model('usage-test').snapshot()['tokens_last_minute'], 50)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens('a' * 40), 11)
+        self.assertEqual(estimate_tokens([{'role': 'user', 'parts': ['a' * 40]}]), 11)
+
+if __name__ == '__main__':
+    unittest.main()
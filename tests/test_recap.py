@@ -0,0 +1,131 @@
+import datetime
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from database import db, Message, SessionSummary, Job
+from bot.recap import split_sessions, refresh_recap, schedule_recap
+from bot.character_utils import get_recap
+from bot.model_registry import model_registry
+from tests.test_history import HistoryTestCase
+
+START = datetime.datetime(2024, 1, 1, 18, 0)
+
+class FakeModel:
+    prompts = []
+
+    def __init__(self, name):
+        pass
+
+    def generate_content(self, prompt):
+        FakeModel.prompts.append(prompt)
+        return SimpleNamespace(text=f"summary {len(FakeModel.prompts)}")
+
+class SplitSessionsTestCase(unittest.TestCase):
+    def test_splits_on_gaps_over_an_hour(self):
+        messages = [SimpleNamespace(timestamp=START + datetime.timedelta(minutes=m)) for m in (0, 30, 90, 200, 260)]
+
+        sessions = split_sessions(messages)
+
+        self.assertEqual([len(session) for session in sessions], [3, 2])
+
+    def test_empty(self):
+        self.assertEqual(split_sessions([]), [])
+
+class RecapTestBase(HistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        FakeModel.prompts = []
+        model_registry.clear()
+        patcher = patch('bot.model_registry.genai.GenerativeModel', FakeModel)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(model_registry.clear)
+
+    def add_at(self, role, content, minutes):
+        message = Message(character_id=self.character.id, role=role, content=content,
+                          timestamp=START + datetime.timedelta(minutes=minutes))
+        db.session.add(message)
+        db.session.commit()
+        return message
+
+class RefreshRecapTestCase(RecapTestBase):
+    def test_summarises_each_closed_session_once(self):
+        self.add_at('user', 'Enter the cave', 0)
+        self.add_at('model', 'It is dark', 1)
+        self.add_at('user', 'Light a torch', 180)
+        refresh_recap(self.character.id)
+        calls = len(FakeModel.prompts)
+
+        self.add_at('user', 'Go deeper', 360)
+        refresh_recap(self.character.id)
+        new_prompts = FakeModel.prompts[calls:]
+
+        self.assertFalse(any('Enter the cave' in prompt for prompt in new_prompts))
+        closed = SessionSummary.query.filter_by(character_id=self.character.id, is_open=False).count()
+        self.assertEqual(closed, 2)
+
+    def test_open_session_resummarised_only_when_it_grows(self):
+        self.add_at('user', 'Enter the cave', 0)
+        refresh_recap(self.character.id)
+        calls = len(FakeModel.prompts)
+
+        refresh_recap(self.character.id)
+        self.assertEqual(len(FakeModel.prompts), calls)
+
+        self.add_at('model', 'It is dark', 5)
+        refresh_recap(self.character.id)
+        self.assertEqual(len(FakeModel.prompts), calls + 1)
+        self.assertEqual(SessionSummary.query.filter_by(character_id=self.character.id, is_open=True).count(), 1)
+
+    def test_overview_merges_new_sessions(self):
+        self.add_at('user', 'Enter the cave', 0)
+        self.add_at('user', 'Leave the cave', 120)
+        refresh_recap(self.character.id)
+
+        self.assertTrue(self.character.recap_overview)
+        self.assertIn(self.character.recap_overview, self.character.recap)
+        self.assertEqual(self.character.last_recap_message_id,
+                         Message.query.order_by(Message.id.desc()).first().id)
+
+    def test_skips_dm_prompt(self):
+        self.add_at('user', 'You are the DM of this game', 0)
+        self.add_at('model', 'Welcome', 1)
+        refresh_recap(self.character.id)
+
+        self.assertFalse(any('You are the DM' in prompt for prompt in FakeModel.prompts))
+
+class GetRecapTestCase(RecapTestBase):
+    def test_returns_cached_recap_and_schedules_refresh(self):
+        self.add_at('user', 'Enter the cave', 0)
+        self.character.recap = 'Old recap'
+        db.session.commit()
+
+        with patch('bot.character_utils.schedule_recap') as schedule:
+            result = get_recap(self.character.id)
+
+        self.assertEqual(result, {'recap': 'Old recap', 'pending': True})
+        schedule.assert_called_once_with(self.character.id)
+        self.assertEqual(FakeModel.prompts, [])
+
+    def test_up_to_date_recap_is_not_pending(self):
+        self.add_at('user', 'Enter the cave', 0)
+        refresh_recap(self.character.id)
+
+        with patch('bot.character_utils.schedule_recap') as schedule:
+            result = get_recap(self.character.id)
+
+        self.assertFalse(result['pending'])
+        schedule.assert_not_called()
+
+    def test_schedule_recap_queues_one_job_per_character(self):
+        schedule_recap(self.character.id)
+        schedule_recap(self.character.id)
+
+        job = Job.query.one()
+        self.assertEqual((job.kind, job.dedupe_key), ('recap', f"recap:{self.character.id}"))
+
+    def test_missing_character(self):
+        self.assertEqual(get_recap(999), ({'error': 'Character not found'}, 404))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -105,5 +105,13 @@ class RefactoredAuthTestCase(unittest.TestCase):
         self.assertIn('<h3>Roll for initiative!</h3>', processed_response)
         self.assertIn('<button onclick="rollDice(\'{&quot;Title&quot;: &quot;Roll for initiative!&quot;, &quot;ButtonText&quot;: &quot;Roll!&quot;, &quot;Mechanic&quot;: &quot;Classic&quot;, &quot;Dice&quot;: &quot;1d20&quot;}\')">Roll!</button>', processed_response)
 
+    def test_process_bot_response_multiple_appdata_blocks(self):
+        bot_response = "Roll, then choose. [APPDATA]{\"DiceRoll\": {\"Title\": \"Roll for initiative!\"}}[/APPDATA][APPDATA]{\"SingleChoice\": {\"Title\": \"Choose your Race\", \"Options\": {\"Elf\": {\"Name\": \"Elf\", \"Description\": \"Graceful\"}}}}[/APPDATA]"
+        processed_response = process_bot_response(bot_response)
+        self.assertTrue(processed_response.startswith('Roll, then choose.'))
+        self.assertIn('<div class="diceroll-container">', processed_response)
+        self.assertIn('<div class="singlechoice-container"><h3>Choose your Race</h3>', processed_response)
+        self.assertLess(processed_response.index('diceroll-container'), processed_response.index('singlechoice-container'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest.mock import patch
+from database import db, TTRPGType, GeminiPrepMessage, CacheVersion
+from bot.reference_data import ReferenceDataCache, template_version
+from tests.test_history import HistoryTestCase
+
+class ReferenceDataTestCase(HistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        db.session.add(GeminiPrepMessage(priority=1, message='You are the GM.'))
+        db.session.commit()
+        self.cache = ReferenceDataCache(poll_seconds=60)
+
+    def test_reads_are_served_from_memory(self):
+        self.assertEqual([t.name for t in self.cache.ttrpg_types()], ['Test'])
+        self.assertEqual(self.cache.ttrpg_type(self.character.ttrpg_type_id).json_template, '{}')
+        self.assertEqual([m.message for m in self.cache.prep_messages()], ['You are the GM.'])
+
+        self.assertEqual(self.cache.loads, 1)
+        self.assertEqual(self.cache.version_checks, 1)
+
+    def test_unknown_type_is_none(self):
+        self.assertIsNone(self.cache.ttrpg_type(999))
+        self.assertIsNone(self.cache.ttrpg_type('abc'))
+
+    def test_commit_bumps_version_and_reloads(self):
+        self.cache.ttrpg_types()
+        db.session.add(TTRPGType(name='Other', json_template='{}', html_template=''))
+
+        self.cache.commit()
+
+        self.assertEqual(db.session.get(CacheVersion, 'reference_data').version, 1)
+        self.assertEqual([t.name for t in self.cache.ttrpg_types()], ['Test', 'Other'])
+        self.assertEqual(self.cache.loads, 2)
+
+    def test_other_worker_sees_bump_after_poll_interval(self):
+        other_worker = ReferenceDataCache(poll_seconds=60)
+        with patch('bot.reference_data.time.monotonic', return_value=1000.0):
+            self.assertEqual(len(other_worker.prep_messages()), 1)
+
+        GeminiPrepMessage.query.one().message = 'You are a grim GM.'
+        self.cache.commit()
+
+        with patch('bot.reference_data.time.monotonic', return_value=1030.0):
+            self.assertEqual(other_worker.prep_messages()[0].message, 'You are the GM.')
+        with patch('bot.reference_data.time.monotonic', return_value=1061.0):
+            self.assertEqual(other_worker.prep_messages()[0].message, 'You are a grim GM.')
+        self.assertEqual(other_worker.loads, 2)
+
+    def test_type_added_on_other_worker_is_found_before_poll_interval(self):
+        other_worker = ReferenceDataCache(poll_seconds=60)
+        with patch('bot.reference_data.time.monotonic', return_value=1000.0):
+            other_worker.ttrpg_types()
+
+        new_type = TTRPGType(name='Other', json_template='{"hp": 0}', html_template='')
+        db.session.add(new_type)
+        self.cache.commit()
+
+        with patch('bot.reference_data.time.monotonic', return_value=1001.0):
+            self.assertEqual(other_worker.ttrpg_type(new_type.id).json_template, '{"hp": 0}')
+            self.assertIsNone(other_worker.ttrpg_type(999))
+        self.assertEqual(other_worker.loads, 2)
+
+    def test_unchanged_version_does_not_reload(self):
+        with patch('bot.reference_data.time.monotonic', return_value=1000.0):
+            self.cache.ttrpg_types()
+        with patch('bot.reference_data.time.monotonic', return_value=1100.0):
+            self.cache.ttrpg_types()
+
+        self.assertEqual(self.cache.version_checks, 2)
+        self.assertEqual(self.cache.loads, 1)
+
+    def test_templates_are_addressed_by_content_hash(self):
+        ttrpg_type = self.cache.ttrpg_type(self.character.ttrpg_type_id)
+
+        self.assertEqual(ttrpg_type.template_version, template_version(''))
+        self.assertIs(self.cache.sheet_template(ttrpg_type.id, ttrpg_type.template_version), ttrpg_type)
+        self.assertIsNone(self.cache.sheet_template(ttrpg_type.id, 'unknown'))
+
+    def test_identical_templates_keep_their_own_type(self):
+        other = TTRPGType(name='Other', json_template='{}', html_template='')
+        db.session.add(other)
+        self.cache.commit()
+        version = template_version('')
+
+        self.assertEqual(self.cache.sheet_template(other.id, version).id, other.id)
+        self.assertEqual(self.cache.sheet_template(str(self.character.ttrpg_type_id), version).id, self.character.ttrpg_type_id)
+
+    def test_editing_template_changes_its_version(self):
+        old_version = self.cache.ttrpg_type(self.character.ttrpg_type_id).template_version
+        db.session.get(TTRPGType, self.character.ttrpg_type_id).html_template = '<table id="name"></table>'
+        self.cache.commit()
+
+        ttrpg_type = self.cache.ttrpg_type(self.character.ttrpg_type_id)
+
+        self.assertNotEqual(ttrpg_type.template_version, old_version)
+        self.assertIsNone(self.cache.sheet_template(ttrpg_type.id, old_version))
+        self.assertEqual(self.cache.sheet_template(ttrpg_type.id, ttrpg_type.template_version).html_template, '<table id="name"></table>')
+
+    def test_stats(self):
+        self.cache.ttrpg_types()
+
+        stats = self.cache.stats()
+
+        self.assertEqual(stats['version'], 0)
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['poll_seconds'], 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from bot.render_cache import RenderCache
+
+class RenderCacheTestCase(unittest.TestCase):
+    def test_renders_once_per_message(self):
+        cache = RenderCache()
+        message = SimpleNamespace(id=1, character_id=7, content='Hello\\nthere')
+
+        with patch('bot.render_cache.process_bot_response', return_value='<b>Hello</b>') as render:
+            first = cache.render(message)
+            second = cache.render(message)
+
+        self.assertEqual(first, second)
+        render.assert_called_once_with('Hello\\nthere')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_renderer_version_is_part_of_key(self):
+        message = SimpleNamespace(id=1, character_id=7, content='Hello')
+        old_cache = RenderCache(version=1)
+        old_cache.put(7, 1, 'Hello', 'old render')
+        new_cache = RenderCache(version=2)
+        new_cache._entries = old_cache._entries
+
+        self.assertEqual(new_cache.render(message), 'Hello')
+
+    def test_character_sheet_is_stripped_without_update(self):
+        cache = RenderCache()
+        message = SimpleNamespace(id=1, character_id=7, content='You level up! [CHARACTERSHEET]{"level": "2"}[/CHARACTERSHEET]')
+
+        with patch('bot.gemini_utils.update_character_sheet') as update_character_sheet:
+            rendered = cache.render(message)
+
+        self.assertEqual(rendered, 'You level up!')
+        update_character_sheet.assert_not_called()
+
+    def test_evicts_least_recently_used(self):
+        cache = RenderCache(max_entries=2)
+        cache.put(7, 1, 'one', 'one')
+        cache.put(7, 2, 'two', 'two')
+        cache.put(7, 3, 'three', 'three')
+
+        self.assertEqual([key[1] for key in cache._entries], [2, 3])
+
+    def test_reused_message_id_is_not_served(self):
+        cache = RenderCache()
+        cache.put(7, 1, 'alice secret', 'alice secret')
+
+        self.assertEqual(cache.render(SimpleNamespace(id=1, character_id=8, content='bob')), 'bob')
+        self.assertEqual(cache.render(SimpleNamespace(id=1, character_id=7, content='bob again')), 'bob again')
+
+    def test_drop_character(self):
+        cache = RenderCache()
+        cache.put(7, 1, 'one', 'one')
+        cache.put(8, 2, 'two', 'two')
+
+        cache.drop_character(7)
+
+        self.assertEqual([key[0] for key in cache._entries], [8])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from bot.response_parser import parse_bot_response, MalformedAppDataError
+
+class ParseBotResponseTestCase(unittest.TestCase):
+    def test_plain_text(self):
+        parsed = parse_bot_response('You enter the tavern.')
+        self.assertEqual(parsed.text, 'You enter the tavern.')
+        self.assertFalse(parsed.has_blocks)
+
+    def test_extracts_all_blocks_in_order(self):
+        parsed = parse_bot_response(
+            'Intro [CHARACTERSHEET]{"level": "1"}[/CHARACTERSHEET] middle '
+            '[APPDATA]{"a": 1}[/APPDATA] and [APPDATA]{"b": 2}[/APPDATA] end'
+        )
+        self.assertEqual(parsed.text, 'Intro  middle  and  end')
+        self.assertEqual(parsed.character_sheets, ['{"level": "1"}'])
+        self.assertEqual(parsed.appdata, ['{"a": 1}', '{"b": 2}'])
+
+    def test_unclosed_appdata(self):
+        with self.assertRaises(MalformedAppDataError):
+            parse_bot_response('Text [APPDATA]{"a": 1}')
+
+    def test_stray_closing_appdata(self):
+        with self.assertRaises(MalformedAppDataError):
+            parse_bot_response('Text [/APPDATA]')
+
+    def test_nested_appdata(self):
+        with self.assertRaises(MalformedAppDataError):
+            parse_bot_response('[APPDATA]\n[APPDATA]{"a": 1}[/APPDATA]')
+
+    def test_unclosed_character_sheet_is_text(self):
+        parsed = parse_bot_response('Text [CHARACTERSHEET]{"a" [APPDATA]{"b": 2}[/APPDATA]')
+        self.assertEqual(parsed.text, 'Text [CHARACTERSHEET]{"a" ')
+        self.assertEqual(parsed.character_sheets, [])
+        self.assertEqual(parsed.appdata, ['{"b": 2}'])
+
+    def test_many_unclosed_character_sheets(self):
+        response = '[CHARACTERSHEET]' * 5000 + '[APPDATA]{"b": 2}[/APPDATA] end'
+        parsed = parse_bot_response(response)
+        self.assertEqual(parsed.text, '[CHARACTERSHEET]' * 5000 + ' end')
+        self.assertEqual(parsed.appdata, ['{"b": 2}'])
+
+if __name__ == '__main__':
+    unittest.main()
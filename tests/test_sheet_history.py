@@ -0,0 +1,140 @@
+import json
+import unittest
+from sqlalchemy import event
+from database import db, Character, CharacterSheetHistory
+from bot.sheet_history import json_diff, apply_patch, record_sheet_update, sheet_history_versions, sheet_history_page, sheet_version
+from tests.test_history import HistoryTestCase
+
+class JsonPatchTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        old = {'hp': 10, 'name': 'Hero', 'items': ['rope', 'torch'], 'stats': {'str': 12, 'dex': 14}, 'a/b': 1}
+        new = {'hp': 7, 'items': ['rope', 'lantern'], 'stats': {'str': 12, 'dex': 15, 'con': 10}, 'a/b': 2}
+
+        patch = json_diff(old, new)
+
+        self.assertEqual(apply_patch(old, patch), new)
+        self.assertIn({'op': 'remove', 'path': '/name'}, patch)
+        self.assertIn({'op': 'replace', 'path': '/items/1', 'value': 'lantern'}, patch)
+
+    def test_list_length_change_replaces_list(self):
+        patch = json_diff({'items': ['rope']}, {'items': ['rope', 'torch']})
+        self.assertEqual(patch, [{'op': 'replace', 'path': '/items', 'value': ['rope', 'torch']}])
+
+    def test_type_change_is_a_replace(self):
+        self.assertEqual(json_diff({'hp': 1}, {'hp': True}), [{'op': 'replace', 'path': '/hp', 'value': True}])
+
+    def test_apply_patch_does_not_mutate_input(self):
+        old = {'stats': {'str': 12}}
+        apply_patch(old, [{'op': 'replace', 'path': '/stats/str', 'value': 13}])
+        self.assertEqual(old, {'stats': {'str': 12}})
+
+class SheetHistoryTestBase(HistoryTestCase):
+    def update(self, sheet):
+        changed = record_sheet_update(self.character, sheet)
+        db.session.commit()
+        return changed
+
+class SheetHistoryTestCase(SheetHistoryTestBase):
+    def test_unchanged_update_is_skipped(self):
+        self.assertTrue(self.update({'hp': 10}))
+        self.assertFalse(self.update({'hp': 10}))
+        self.assertEqual(CharacterSheetHistory.query.count(), 1)
+
+    def test_first_row_is_a_snapshot_then_deltas(self):
+        for hp in (10, 9, 8):
+            self.update({'hp': hp, 'name': 'Hero'})
+
+        rows = CharacterSheetHistory.query.order_by(CharacterSheetHistory.id).all()
+        self.assertEqual([row.is_delta for row in rows], [False, True, True])
+        self.assertEqual(json.loads(rows[2].sheet_data), [{'op': 'replace', 'path': '/hp', 'value': 8}])
+        self.assertEqual(json.loads(db.session.get(Character, self.character.id).charactersheet), {'hp': 8, 'name': 'Hero'})
+
+    def test_snapshot_interval(self):
+        self.app.config['SHEET_SNAPSHOT_INTERVAL'] = 3
+        for hp in range(7):
+            self.update({'hp': hp})
+
+        rows = CharacterSheetHistory.query.order_by(CharacterSheetHistory.id).all()
+        self.assertEqual([row.is_delta for row in rows], [False, True, True, False, True, True, False])
+
+    def test_versions_are_reconstructed(self):
+        self.app.config['SHEET_SNAPSHOT_INTERVAL'] = 3
+        sheets = [{'hp': hp, 'items': ['rope'] * (hp % 3)} for hp in range(8)]
+        for sheet in sheets:
+            self.update(sheet)
+
+        versions = sheet_history_versions(self.character.id)
+
+        self.assertEqual([sheet for _, sheet in versions], sheets)
+
+class SheetHistoryPageTestCase(SheetHistoryTestBase):
+    def test_pages_of_changes(self):
+        self.app.config['SHEET_SNAPSHOT_INTERVAL'] = 3
+        for hp in range(5):
+            self.update({'hp': hp, 'name': 'Hero'})
+
+        first = sheet_history_page(self.character.id, limit=3)
+        second = sheet_history_page(self.character.id, before_id=first['before_id'], limit=3)
+
+        self.assertEqual(first['count'], 5)
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        versions = first['versions'] + second['versions']
+        self.assertEqual([v['initial'] for v in versions], [False, False, False, False, True])
+        self.assertIsNone(versions[-1]['changes'])
+        # Row 4 is a snapshot; its changes are diffed against the previous delta.
+        for hp, version in zip(range(4, 0, -1), versions):
+            self.assertEqual(version['changes'], [{'op': 'replace', 'path': '/hp', 'value': hp}])
+
+    def test_invalid_limit_uses_default_page_size(self):
+        for hp in range(3):
+            self.update({'hp': hp})
+
+        page = sheet_history_page(self.character.id, limit='ten')
+
+        self.assertEqual(len(page['versions']), 3)
+        self.assertFalse(page['has_more'])
+
+    def test_string_cursor_is_parsed_and_invalid_cursor_is_ignored(self):
+        for hp in range(3):
+            self.update({'hp': hp})
+        first = sheet_history_page(self.character.id, limit=2)
+
+        page = sheet_history_page(self.character.id, before_id=str(first['before_id']), limit=2)
+        self.assertEqual(len(page['versions']), 1)
+        for before_id in ('abc', {'id': 1}, [1]):
+            page = sheet_history_page(self.character.id, before_id=before_id)
+            self.assertEqual(len(page['versions']), 3)
+
+    def test_page_fetches_one_extra_row(self):
+        for hp in range(5):
+            self.update({'hp': hp})
+        limits = []
+
+        def record_limit(conn, cursor, statement, parameters, context, executemany):
+            if 'LIMIT' in statement:
+                limits.append(parameters[-2])
+
+        event.listen(db.engine, 'before_cursor_execute', record_limit)
+        self.addCleanup(event.remove, db.engine, 'before_cursor_execute', record_limit)
+
+        page = sheet_history_page(self.character.id, limit=2)
+
+        self.assertEqual(limits, [3])
+        self.assertTrue(page['has_more'])
+        self.assertFalse(page['versions'][-1]['initial'])
+
+    def test_sheet_version(self):
+        self.app.config['SHEET_SNAPSHOT_INTERVAL'] = 3
+        for hp in range(5):
+            self.update({'hp': hp})
+        rows = CharacterSheetHistory.query.order_by(CharacterSheetHistory.id).all()
+
+        record, sheet = sheet_version(self.character.id, rows[2].id)
+
+        self.assertEqual(record.id, rows[2].id)
+        self.assertEqual(sheet, {'hp': 2})
+        self.assertIsNone(sheet_version(self.character.id + 1, rows[2].id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from flask import Flask
+from bot.streaming import StreamTagBuffer
+from bot.gemini_utils import send_to_gemini_with_retry
+
+def render_block(tag, block):
+    return f'<{tag}>' if tag == 'APPDATA' else None
+
+def make_chunk(text):
+    return SimpleNamespace(parts=[SimpleNamespace(text=text)])
+
+class FakeModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, contents, stream=False):
+        if stream:
+            return iter([make_chunk(chunk) for chunk in self.chunks])
+        return SimpleNamespace(parts=[SimpleNamespace(text="".join(self.chunks))])
+
+class StreamTagBufferTestCase(unittest.TestCase):
+    def test_plain_text_passes_through(self):
+        buffer = StreamTagBuffer(render_block)
+        self.assertEqual(buffer.feed('Hello '), ['Hello '])
+        self.assertEqual(buffer.feed('world'), ['world'])
+        self.assertEqual(buffer.flush(), '')
+
+    def test_block_is_held_until_closed(self):
+        buffer = StreamTagBuffer(render_block)
+        self.assertEqual(buffer.feed('Pick one [APP'), ['Pick one '])
+        self.assertEqual(buffer.feed('DATA]{"SingleChoice": '), [])
+        self.assertEqual(buffer.feed('{}}[/APPDATA] done'), ['<APPDATA>', ' done'])
+
+    def test_character_sheet_block_is_hidden(self):
+        buffer = StreamTagBuffer(render_block)
+        self.assertEqual(buffer.feed('A[CHARACTERSHEET]{}[/CHARACTERSHEET]B'), ['A', 'B'])
+
+    def test_brackets_that_are_not_tags(self):
+        buffer = StreamTagBuffer(render_block)
+        self.assertEqual(buffer.feed('[roll] it'), ['[', 'roll] it'])
+
+    def test_unclosed_block_is_dropped(self):
+        buffer = StreamTagBuffer(render_block)
+        buffer.feed('Text [APPDATA]{"broken"')
+        self.assertEqual(buffer.flush(), '')
+
+class StreamingResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    @patch('bot.gemini_utils.emit')
+    def test_streamed_text_matches_non_streamed(self, emit):
+        chunks = ['You enter ', 'the tavern. [APPDATA]{"DiceRoll": ', '{"Title": "Roll"}}[/APPDATA]']
+        model = FakeModel(chunks)
+
+        streamed = send_to_gemini_with_retry(model, [], '1', stream=True)
+        blocking = send_to_gemini_with_retry(model, [], '1', stream=False)
+
+        self.assertEqual(streamed, blocking)
+        chunk_events = [call.args[1] for call in emit.call_args_list if call.args[0] == 'message_chunk']
+        self.assertTrue(chunk_events[0]['reset'])
+        self.assertEqual(chunk_events[1]['text'], 'You enter ')
+
+if __name__ == '__main__':
+    unittest.main()
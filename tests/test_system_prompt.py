@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+from database import db, Character, GeminiPrepMessage, SystemPrompt
+from bot.system_prompt import render_preamble, assign_system_prompt, model_for, system_instruction, DEFAULT_KICKOFF
+from bot.model_registry import model_registry
+from bot.reference_data import reference_data
+from tests.test_history import HistoryTestCase
+
+class SystemPromptTestCase(HistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['GEMINI_MODEL'] = 'gemini-test'
+        model_registry.clear()
+        self.addCleanup(model_registry.clear)
+        db.session.add_all([
+            GeminiPrepMessage(priority=0, message='You are the GM of a [DB.TTRPG.Name] game.'),
+            GeminiPrepMessage(priority=98, message='Sheet keys: [DB.TTRPG.JSON]'),
+            GeminiPrepMessage(priority=99, message='The player has chosen [DB.CHARACTER.NAME]. Start.'),
+        ])
+        db.session.commit()
+
+    def add_character(self, name):
+        character = Character(user_id=self.character.user_id, ttrpg_type_id=self.character.ttrpg_type_id,
+                              character_name=name, charactersheet='{}')
+        db.session.add(character)
+        db.session.commit()
+        return character
+
+    def test_character_specific_messages_form_the_kickoff(self):
+        system_text, kickoff = render_preamble(self.character)
+
+        self.assertEqual(system_text, 'You are the GM of a Test game.\n\nSheet keys: {}')
+        self.assertEqual(kickoff, 'The player has chosen Hero. Start.')
+
+    def test_unknown_ttrpg_type(self):
+        self.character.ttrpg_type_id = 999
+
+        with self.assertRaises(ValueError):
+            render_preamble(self.character)
+
+    def test_kickoff_defaults_when_no_message_names_the_character(self):
+        GeminiPrepMessage.query.filter_by(priority=99).delete()
+        reference_data.commit()
+
+        self.assertEqual(render_preamble(self.character)[1], DEFAULT_KICKOFF)
+
+    def test_system_prompt_is_shared_between_characters(self):
+        other = self.add_character('Sidekick')
+
+        assign_system_prompt(self.character)
+        assign_system_prompt(other)
+
+        self.assertEqual(SystemPrompt.query.count(), 1)
+        self.assertEqual(self.character.system_prompt_id, other.system_prompt_id)
+
+    def test_editing_prep_messages_creates_a_new_version(self):
+        assign_system_prompt(self.character)
+        GeminiPrepMessage.query.filter_by(priority=0).one().message = 'You are a grim GM.'
+        reference_data.commit()
+        other = self.add_character('Sidekick')
+
+        assign_system_prompt(other)
+
+        self.assertEqual(SystemPrompt.query.count(), 2)
+        self.assertNotEqual(self.character.system_prompt_id, other.system_prompt_id)
+        self.assertIn('GM of a Test game', system_instruction(self.character))
+
+    def test_model_gets_system_instruction(self):
+        assign_system_prompt(self.character)
+
+        with patch('bot.model_registry.genai.GenerativeModel') as model_class:
+            model_for(self.character)
+
+        model_class.assert_called_once_with('gemini-test', system_instruction=system_instruction(self.character))
+
+    def test_legacy_character_has_no_system_instruction(self):
+        self.assertIsNone(system_instruction(self.character))
+
+        with patch('bot.model_registry.genai.GenerativeModel') as model_class:
+            model_for(self.character)
+
+        model_class.assert_called_once_with('gemini-test')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import threading
+from unittest.mock import patch
+from database import db, Character, Message, CharacterSheetHistory
+from bot.character_utils import update_character_sheet
+from bot.context_window import schedule_summary
+from bot.unit_of_work import TurnUnitOfWork, GroupCommitter, current_turn
+from tests.test_history import HistoryTestCase
+
+class TurnUnitOfWorkTestCase(HistoryTestCase):
+    def test_turn_is_written_in_one_commit(self):
+        with patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+            with TurnUnitOfWork() as turn:
+                turn.add_message(self.character.id, 'user', 'I open the door')
+                update_character_sheet(self.character.id, {'hp': 7})
+                model_index = turn.add_message(self.character.id, 'model', 'It creaks open.')
+
+                self.assertEqual(Message.query.count(), 0)
+
+        self.assertEqual(commit.call_count, 1)
+        messages = Message.query.order_by(Message.id).all()
+        self.assertEqual([m.content for m in messages], ['I open the door', 'It creaks open.'])
+        self.assertEqual(turn.message_ids[model_index], messages[1].id)
+        self.assertEqual(json.loads(db.session.get(Character, self.character.id).charactersheet), {'hp': 7})
+        self.assertEqual(CharacterSheetHistory.query.count(), 1)
+        self.assertIsNone(current_turn())
+
+    def test_only_the_user_message_is_kept_when_the_turn_fails(self):
+        with self.assertRaises(RuntimeError):
+            with TurnUnitOfWork() as turn:
+                turn.add_message(self.character.id, 'user', 'Hello')
+                update_character_sheet(self.character.id, {'hp': 7})
+                turn.add_message(self.character.id, 'model', 'Half a reply')
+                raise RuntimeError("model call failed")
+
+        self.assertEqual([(m.role, m.content) for m in Message.query.all()], [('user', 'Hello')])
+        self.assertEqual(CharacterSheetHistory.query.count(), 0)
+
+    def test_summary_job_is_queued_after_the_turn_commits(self):
+        character = db.session.get(Character, self.character.id)
+        with patch('bot.context_window.enqueue') as enqueue:
+            with TurnUnitOfWork() as turn:
+                turn.add_message(self.character.id, 'user', 'Hello')
+                schedule_summary(character, [], window_start=5)
+                enqueue.assert_not_called()
+
+            enqueue.assert_called_once()
+
+            with self.assertRaises(RuntimeError):
+                with TurnUnitOfWork():
+                    schedule_summary(character, [], window_start=5)
+                    raise RuntimeError("model call failed")
+            enqueue.assert_called_once()
+
+    def test_sheet_update_outside_a_turn_commits_directly(self):
+        update_character_sheet(self.character.id, {'hp': 3})
+        self.assertEqual(CharacterSheetHistory.query.count(), 1)
+
+class GroupCommitterTestCase(HistoryTestCase):
+    def test_concurrent_turns_share_commits(self):
+        committer = GroupCommitter(window_ms=100)
+        committer._app = self.app
+        character_id = self.character.id
+        ids = []
+
+        def run_turn(i):
+            with self.app.app_context():
+                with TurnUnitOfWork(committer) as turn:
+                    turn.add_message(character_id, 'user', f'Message {i}')
+                ids.extend(turn.message_ids)
+
+        threads = [threading.Thread(target=run_turn, args=(i,)) for i in range(5)]
+        with patch('bot.unit_of_work.turn_write_metrics') as metrics:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        turns = sum(call.args[0] for call in metrics.record.call_args_list)
+        commits = sum(call.args[1] for call in metrics.record.call_args_list)
+        self.assertEqual(turns, 5)
+        self.assertLess(commits, 5)
+        self.assertEqual(sorted(ids), sorted(m.id for m in Message.query.all()))